@@ -0,0 +1,295 @@
+import math
+from array import array
+from bisect import bisect_left
+from itertools import islice
+from datetime import datetime, timedelta
+
+import anomalias
+import piramide
+import regressao
+import serie
+from leitura import Decodificador, converter_float
+from metricas import NULA
+
+METRICAS = ("cpu", "ram", "disco", "temp")
+COLUNAS = METRICAS + ("prob_falha",)
+
+
+def agregar_linhas(cabecalho, linhas_dados, medicao=NULA):
+    # motor em python puro: uma passada no CSV e depois só fatias
+    parcial = novo_parcial(cabecalho)
+    with medicao.etapa("linhas"):
+        acumular_linhas(linhas_dados, parcial, medicao)
+    with medicao.etapa("medianas"):
+        return finalizar(parcial)
+
+
+def novo_parcial(cabecalho):
+    # estado da leitura que dá pra continuar depois (modo incremental):
+    # as colunas de quem tem timestamp válido e as somas da regressão, que
+    # usa a ordem do arquivo (x = índice da linha válida)
+    # (array("d") guarda o double direto, bem menor que lista de float)
+    return {
+        "cabecalho": cabecalho,
+        "total_linhas": 0,
+        "colunas_ultima": None,
+        "posicoes": Decodificador(cabecalho).posicoes,
+        "datas": [],
+        "colunas": {nome: array("d") for nome in COLUNAS},
+        "em_ordem": True,
+        "detector": anomalias.novo(),
+        "n": 0,
+        "soma_y": 0.0,
+        "soma_xy": 0.0,
+        "primeira": 0.0,
+        "ultima": 0.0,
+    }
+
+
+def acumular_linhas(linhas_dados, parcial, medicao=NULA):
+    # posições, separador e formato da data saem do cabeçalho uma vez só
+    decodificador = Decodificador(parcial["cabecalho"])
+    separador = decodificador.separador
+    largura_minima = decodificador.largura_minima
+    posicoes = decodificador.posicoes
+    p_data = posicoes["timestamp"]
+    p_cpu = posicoes["cpu"]
+    p_ram = posicoes["ram"]
+    p_disco = posicoes["disco"]
+    p_temp = posicoes["temp"]
+    converter_data = decodificador.data
+
+    lista_datas = parcial["datas"]
+    colunas = parcial["colunas"]
+    total_linhas = parcial["total_linhas"]
+    total_inicial = total_linhas
+    curtas = 0
+    ultima_bruta = None
+    em_ordem = parcial["em_ordem"]
+    n = parcial["n"]
+    soma_y = parcial["soma_y"]
+    soma_xy = parcial["soma_xy"]
+    inicio_novas = len(lista_datas)
+
+    # varre cada linha do CSV e extrai os campos que importam
+    for linha in linhas_dados:
+        total_linhas += 1
+        campos = linha.split(separador)
+        if len(campos) < largura_minima:
+            curtas += 1
+            continue
+
+        # última linha completa = estado mais recente da máquina
+        ultima_bruta = campos
+
+        data_linha = converter_data(campos[p_data])
+        if data_linha is None:
+            # se não der pra converter a data, a gente ignora essa linha
+            continue
+
+        disco_linha = converter_float(campos[p_disco])
+        temp_linha = converter_float(campos[p_temp])
+
+        # probabilidade histórica de falha
+        prob_hist = calcular_prob_falha_simples(temp=temp_linha, disco=disco_linha)
+        if n == 0:
+            parcial["primeira"] = prob_hist
+        soma_xy += n * prob_hist
+        soma_y += prob_hist
+        n += 1
+
+        if em_ordem and lista_datas and data_linha < lista_datas[-1]:
+            em_ordem = False
+
+        lista_datas.append(data_linha)
+        colunas["cpu"].append(converter_float(campos[p_cpu]))
+        colunas["ram"].append(converter_float(campos[p_ram]))
+        colunas["disco"].append(disco_linha)
+        colunas["temp"].append(temp_linha)
+        colunas["prob_falha"].append(prob_hist)
+
+    # anomalias (EWMA/z-score) nas linhas válidas dessa chamada, na ordem do
+    # arquivo: o estado do detector fica no parcial e continua na próxima
+    detector = parcial["detector"]
+    if detector is not None:
+        detector.varrer(
+            islice(lista_datas, inicio_novas, None),
+            islice(colunas["cpu"], inicio_novas, None),
+            islice(colunas["ram"], inicio_novas, None),
+            islice(colunas["temp"], inicio_novas, None),
+        )
+
+    # contagens só dessa chamada (no incremental o parcial já vem com linhas)
+    medicao.somar("linhas_lidas", total_linhas - total_inicial)
+    medicao.somar("linhas_curtas", curtas)
+    medicao.somar("linhas_validas", n - parcial["n"])
+    medicao.somar("linhas_data_invalida", total_linhas - total_inicial - curtas - (n - parcial["n"]))
+
+    parcial["total_linhas"] = total_linhas
+    if ultima_bruta is not None:
+        parcial["colunas_ultima"] = [c.strip() for c in ultima_bruta]
+    parcial["em_ordem"] = em_ordem
+    parcial["n"] = n
+    parcial["soma_y"] = soma_y
+    parcial["soma_xy"] = soma_xy
+    if lista_datas:
+        parcial["ultima"] = colunas["prob_falha"][-1]
+    return parcial
+
+
+def ordenar(parcial):
+    # daqui pra frente tudo é janela de tempo: com as datas ordenadas cada
+    # janela é uma fatia achada por busca binária, sem varrer tudo de novo
+    lista_datas = parcial["datas"]
+    colunas = parcial["colunas"]
+    if not parcial["em_ordem"]:
+        ordem = sorted(range(len(lista_datas)), key=lista_datas.__getitem__)
+        lista_datas = [lista_datas[i] for i in ordem]
+        colunas = {nome: array("d", (valores[i] for i in ordem)) for nome, valores in colunas.items()}
+    return lista_datas, colunas
+
+
+def inicio_semana(lista_datas):
+    # primeira posição dentro de data_maxima - 7 dias (datas ordenadas)
+    return bisect_left(lista_datas, lista_datas[-1] - timedelta(days=7))
+
+
+def finalizar(parcial):
+    agregado = {
+        "total_linhas": parcial["total_linhas"],
+        "colunas_ultima": parcial["colunas_ultima"],
+        "posicoes": parcial["posicoes"],
+        "data_maxima": None,
+    }
+    if not parcial["datas"]:
+        return agregado
+
+    agregado["somas_regressao"] = somas_regressao(parcial)
+
+    if parcial["detector"] is not None:
+        agregado["anomalias"] = parcial["detector"].resultado()
+
+    lista_datas, colunas = ordenar(parcial)
+    data_maxima = lista_datas[-1]
+    inicio_dia = bisect_left(lista_datas, datetime.combine(data_maxima.date(), datetime.min.time()))
+    inicio = inicio_semana(lista_datas)
+
+    agregado["data_maxima"] = data_maxima
+    agregado["medianas"] = {
+        "dia": {m: _mediana(colunas[m][inicio_dia:]) for m in METRICAS},
+        "semanal": {m: _mediana(colunas[m][inicio:]) for m in METRICAS},
+    }
+    agregado["historico_7d"] = _montar_historico_7d(lista_datas, colunas, inicio)
+
+    # regressão contra o tempo: segundos até a data_maxima e prob inteira.
+    # as linhas ficam no agregado pro historico.juntar refazer as janelas
+    # com as dos outros arquivos
+    segundos = array("q", (int((d - data_maxima).total_seconds()) for d in lista_datas[inicio:]))
+    probs = array("q", (int(p) for p in colunas["prob_falha"][inicio:]))
+    agregado["tempos_semana"] = (segundos, probs)
+    agregado["somas_tempo"] = regressao.somas_janelas(segundos, probs)
+
+    if serie.PONTOS:
+        # últimas horas em alta resolução pros gráficos (reduzida por balde)
+        inicio_serie = bisect_left(lista_datas, data_maxima - timedelta(seconds=serie.JANELA_SEGUNDOS))
+        agregado["serie_detalhada"] = serie.reduzir(
+            lista_datas[inicio_serie:], {nome: colunas[nome][inicio_serie:] for nome in COLUNAS}
+        )
+
+    # valores de cada um dos 7 dias que terminam em data_maxima (pros
+    # esboços de quantis): esses dias estão sempre inteiros na janela
+    inicio_dias = bisect_left(lista_datas, datetime.combine(data_maxima.date() - timedelta(days=6), datetime.min.time()))
+    agregado["dias_semana"] = [
+        (dia, {m: colunas[m][i:f] for m in METRICAS})
+        for dia, i, f in _fatias_dias(lista_datas, inicio_dias)
+    ]
+
+    if piramide.ATIVO:
+        # e hora a hora, pros resumos da pirâmide (só dias inteiros, igual
+        # aos esboços: no modo incremental o que vem antes foi descartado)
+        agregado["horas"] = [
+            (hora, piramide.balde_linhas({nome: colunas[nome][i:f] for nome in COLUNAS}))
+            for hora, i, f in _fatias_horas(lista_datas, inicio_dias)
+        ]
+    return agregado
+
+
+def somas_regressao(parcial):
+    # regressão contra o índice da linha: soma_x e soma_x2 saem do n
+    n = parcial["n"]
+    return {
+        "n": n,
+        "soma_x": n * (n - 1) // 2,
+        "soma_y": parcial["soma_y"],
+        "soma_x2": (n - 1) * n * (2 * n - 1) // 6,
+        "soma_xy": parcial["soma_xy"],
+        "primeira": parcial["primeira"],
+        "ultima": parcial["ultima"],
+    }
+
+
+def calcular_prob_falha_simples(temp, disco):
+    pontuacao_hw = (temp * 0.7) + (disco * 0.3)
+    prob_falha = min(99, math.floor(pontuacao_hw))
+    return float(prob_falha)
+
+
+def _mediana(valores):
+    if not valores:
+        return 0.0
+    return float(_median(valores))
+
+
+def _median(valores):
+    # mesma conta do statistics.median, sem o import dele (~15 ms de cold
+    # start, ele puxa fractions/decimal/random)
+    ordenados = sorted(valores)
+    n = len(ordenados)
+    meio = n // 2
+    if n % 2:
+        return ordenados[meio]
+    return (ordenados[meio - 1] + ordenados[meio]) / 2
+
+
+def _fatias_dias(lista_datas, inicio):
+    # lista_datas já vem ordenada: cada dia é uma fatia contígua a partir
+    # de inicio, e o fim de cada uma sai por busca binária
+    fatias_dias = []
+    while inicio < len(lista_datas):
+        dia = lista_datas[inicio].date()
+        fim = bisect_left(lista_datas, datetime.combine(dia + timedelta(days=1), datetime.min.time()), inicio)
+        fatias_dias.append((dia, inicio, fim))
+        inicio = fim
+    return fatias_dias
+
+
+def _fatias_horas(lista_datas, inicio):
+    # mesma coisa por hora
+    fatias_horas = []
+    while inicio < len(lista_datas):
+        hora = lista_datas[inicio].replace(minute=0, second=0, microsecond=0)
+        fim = bisect_left(lista_datas, hora + timedelta(hours=1), inicio)
+        fatias_horas.append((hora, inicio, fim))
+        inicio = fim
+    return fatias_horas
+
+
+def _montar_historico_7d(lista_datas, colunas, inicio_periodo):
+    fatias_dias = _fatias_dias(lista_datas, inicio_periodo)
+    if not fatias_dias:
+        return {
+            "labels": [],
+            "cpu": [],
+            "ram": [],
+            "disco": [],
+            "temp": [],
+            "prob_falha": [],
+        }
+
+    fatias_dias = fatias_dias[-7:]
+
+    historico = {"labels": [d.strftime("%Y-%m-%d") for d, _, _ in fatias_dias]}
+    for nome in COLUNAS:
+        valores = colunas[nome]
+        historico[nome] = [float(_median(valores[i:f])) for _, i, f in fatias_dias]
+    return historico
@@ -0,0 +1,113 @@
+import heapq
+import math
+import os
+
+# detector de anomalias por métrica: média e variância móveis exponenciais
+# (EWMA) e o z-score de cada linha contra elas, sem reler o CSV (roda nas
+# colunas que a leitura acabou de converter). memória O(1) por métrica mais
+# as MAXIMO maiores anomalias. ETL_ANOMALIAS=0 desliga
+ATIVO = os.environ.get("ETL_ANOMALIAS", "1").lower() in ("1", "true", "sim")
+ALFA = float(os.environ.get("ETL_ANOMALIA_ALFA", "0.05"))
+LIMIAR_Z = float(os.environ.get("ETL_ANOMALIA_Z", "4"))
+# linhas de cada métrica antes de começar a apontar (a média ainda está chegando)
+AQUECIMENTO = int(os.environ.get("ETL_ANOMALIA_AQUECIMENTO", "30"))
+MAXIMO = int(os.environ.get("ETL_ANOMALIAS_MAX", "20"))
+
+METRICAS = ("cpu", "ram", "temp")
+
+
+def configuracao():
+    return {"ativo": ATIVO, "alfa": ALFA, "limiar_z": LIMIAR_Z, "aquecimento": AQUECIMENTO, "maximo": MAXIMO}
+
+
+def novo():
+    return Detector() if ATIVO else None
+
+
+class Detector:
+    # as linhas têm que chegar na ordem do arquivo. os dois motores passam
+    # as mesmas linhas válidas na mesma ordem, com float do python e a mesma
+    # conta, então o resultado sai idêntico
+
+    def __init__(self):
+        self.n = 0
+        # por métrica: [média, variância] (EWMA)
+        self.estados = {m: [0.0, 0.0] for m in METRICAS}
+        # heap das maiores: (|z|, ordem, data, métrica, valor, z)
+        self.maiores = []
+        self.total = 0
+        self.ordem = 0
+
+    def varrer(self, datas, cpu, ram, temp):
+        # uma volta só pelas colunas de novas linhas, com o estado em
+        # variáveis locais (bem mais barato que uma chamada por linha e
+        # métrica). o teste |z| > limiar vira d² > limiar² · variância: a
+        # raiz só é calculada pra quem já é anomalia
+        n = self.n
+        (media_cpu, var_cpu), (media_ram, var_ram), (media_temp, var_temp) = (
+            self.estados[m] for m in METRICAS
+        )
+        alfa = ALFA
+        resto = 1.0 - ALFA
+        limiar2 = LIMIAR_Z * LIMIAR_Z
+        aquecimento = AQUECIMENTO
+        registrar = self._registrar
+
+        for data, c, r, t in zip(datas, cpu, ram, temp):
+            if n == 0:
+                media_cpu, media_ram, media_temp = c, r, t
+                n = 1
+                continue
+
+            d = c - media_cpu
+            if n >= aquecimento and d * d > limiar2 * var_cpu and var_cpu > 0.0:
+                registrar(data, "cpu", c, d / math.sqrt(var_cpu))
+            media_cpu += alfa * d
+            var_cpu = resto * (var_cpu + alfa * d * d)
+
+            d = r - media_ram
+            if n >= aquecimento and d * d > limiar2 * var_ram and var_ram > 0.0:
+                registrar(data, "ram", r, d / math.sqrt(var_ram))
+            media_ram += alfa * d
+            var_ram = resto * (var_ram + alfa * d * d)
+
+            d = t - media_temp
+            if n >= aquecimento and d * d > limiar2 * var_temp and var_temp > 0.0:
+                registrar(data, "temp", t, d / math.sqrt(var_temp))
+            media_temp += alfa * d
+            var_temp = resto * (var_temp + alfa * d * d)
+
+            n += 1
+
+        self.n = n
+        self.estados = {
+            "cpu": [media_cpu, var_cpu],
+            "ram": [media_ram, var_ram],
+            "temp": [media_temp, var_temp],
+        }
+
+    def _registrar(self, data, nome, valor, z):
+        self.total += 1
+        self.ordem += 1
+        item = (abs(z), self.ordem, data, nome, valor, z)
+        if len(self.maiores) < MAXIMO:
+            heapq.heappush(self.maiores, item)
+        elif MAXIMO > 0:
+            heapq.heappushpop(self.maiores, item)
+
+    def resultado(self):
+        # as maiores em ordem de tempo (empate: ordem em que apareceram)
+        itens = sorted(self.maiores, key=lambda item: (item[2], item[1]))
+        return {
+            "total": self.total,
+            "limiar_z": LIMIAR_Z,
+            "itens": [
+                {
+                    "timestamp": data.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "metrica": nome,
+                    "valor": float(valor),
+                    "score": float(z),
+                }
+                for _, _, data, nome, valor, z in itens
+            ],
+        }
@@ -0,0 +1,139 @@
+# reprocessa um prefixo inteiro do trusted de uma vez, fora da Lambda: lista
+# os CSVs, agrupa por máquina e roda o mesmo _processar_objeto do index num
+# pool de processos. origem e destino podem ser bucket S3 ou pasta local
+# (espelho do bucket), então dá pra rodar tudo offline numa máquina só.
+#
+#   python backfill.py s3://vizor-trusted/ --destino s3://vizor-client
+#   python backfill.py ./espelho/trusted --destino ./saida --processos 8
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import index
+import metricas
+from espelho import ClienteEspelho
+
+# nome dos buckets quando origem/destino são pastas locais
+BALDE_ORIGEM_LOCAL = "origem-local"
+BALDE_DESTINO_LOCAL = "destino-local"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="backfill do ETL de manutenção")
+    parser.add_argument("origem", help="s3://bucket/prefixo ou pasta local com empresa/maquina/data/arquivo.csv")
+    parser.add_argument("--destino", default=f"s3://{index.BALDE_DESTINO}", help="s3://bucket ou pasta local")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--forcar", action="store_true", help="reprocessa mesmo o que o manifesto diz que não mudou")
+    args = parser.parse_args()
+
+    cliente, balde_origem, prefixo, _ = _montar_cliente(args.origem, args.destino)
+    grupos = _listar_por_maquina(cliente, balde_origem, prefixo)
+    total_arquivos = sum(len(chaves) for chaves in grupos)
+    print(f"[BACKFILL] {total_arquivos} arquivo(s) de {len(grupos)} máquina(s), {args.processos} processo(s)")
+
+    inicio = time.perf_counter()
+    resultados = []
+    # máquinas em paralelo; os arquivos de uma mesma máquina vão em ordem no
+    # mesmo processo (checkpoint e esboços dos dias anteriores dependem disso)
+    with ProcessPoolExecutor(
+        max_workers=max(1, args.processos),
+        initializer=_iniciar_processo,
+        initargs=(args.origem, args.destino, args.forcar),
+    ) as executor:
+        for parcial in executor.map(_processar_maquina, [(balde_origem, chaves) for chaves in grupos]):
+            resultados.extend(parcial)
+    duracao = time.perf_counter() - inicio
+
+    falhas = [r for r in resultados if not r["ok"]]
+    linhas = sum(r["linhas"] for r in resultados)
+    print(f"[BACKFILL] {len(resultados)} arquivo(s), {linhas} linha(s) em {duracao:.1f}s -> {args.destino}")
+    if duracao > 0:
+        print(f"[BACKFILL] {len(resultados) / duracao:.1f} arquivos/s, {linhas / duracao:,.0f} linhas/s")
+    inalterados = sum(1 for r in resultados if r["body"] == "Inalterado")
+    if inalterados:
+        print(f"[BACKFILL] {inalterados} arquivo(s) sem mudança desde a última saída (use --forcar pra refazer)")
+    for falha in falhas:
+        print(f"[BACKFILL] FALHA {falha['key']}: {falha['body']}")
+    return 1 if falhas else 0
+
+
+def _montar_cliente(origem, destino):
+    # devolve o cliente (S3, pastas ou os dois) e os nomes de bucket que o
+    # index vai enxergar
+    diretorios = {}
+    if origem.startswith("s3://"):
+        balde_origem, _, prefixo = origem[len("s3://"):].partition("/")
+    else:
+        balde_origem, prefixo = BALDE_ORIGEM_LOCAL, ""
+        diretorios[BALDE_ORIGEM_LOCAL] = origem
+
+    if destino.startswith("s3://"):
+        balde_destino = destino[len("s3://"):].strip("/")
+    else:
+        balde_destino = BALDE_DESTINO_LOCAL
+        diretorios[BALDE_DESTINO_LOCAL] = destino
+
+    remoto = None
+    if len(diretorios) < 2:
+        remoto = index._cliente()
+    cliente = ClienteEspelho(diretorios, remoto) if diretorios else remoto
+    return cliente, balde_origem, prefixo, balde_destino
+
+
+def _listar_por_maquina(cliente, balde, prefixo):
+    grupos = {}
+    parametros = {"Bucket": balde, "Prefix": prefixo}
+    while True:
+        resposta = cliente.list_objects_v2(**parametros)
+        for objeto in resposta.get("Contents", []):
+            chave = objeto["Key"]
+            partes = chave.split("/")
+            # mesmo layout que o index aceita: empresa/maquina/data/arquivo.csv
+            if len(partes) < 4 or not chave.lower().endswith(".csv"):
+                continue
+            grupos.setdefault((partes[0], partes[1]), []).append(chave)
+        if not resposta.get("IsTruncated"):
+            break
+        parametros["ContinuationToken"] = resposta["NextContinuationToken"]
+
+    # as chaves de cada máquina já vêm em ordem de data (ordem do S3)
+    return [sorted(chaves) for _, chaves in sorted(grupos.items())]
+
+
+def _iniciar_processo(origem, destino, forcar):
+    # cada processo monta o próprio cliente e aponta o index pra ele. o
+    # processo nasce de um fork do pai, que já listou com o cliente S3
+    # dele: herdado, esse cliente (e a sessão padrão do boto3) dividiria o
+    # pool de conexões keep-alive com o pai e os outros processos. então o
+    # index esquece o cliente e o boto3 a sessão, e o _cliente() monta tudo
+    # de novo aqui
+    index.cliente_s3 = None
+    if "boto3" in sys.modules:
+        sys.modules["boto3"].DEFAULT_SESSION = None
+    cliente, _, _, balde_destino = _montar_cliente(origem, destino)
+    index.cliente_s3 = cliente
+    index.BALDE_DESTINO = balde_destino
+    index.FORCAR = forcar
+
+
+def _processar_maquina(tarefa):
+    balde_origem, chaves = tarefa
+    resultados = []
+    for chave in chaves:
+        # Medicao de verdade mesmo com ETL_METRICAS=0: o resumo usa as linhas
+        medicao = metricas.Medicao()
+        try:
+            corpo = index._processar_objeto(balde_origem, chave, medicao, index.FORCAR)
+            ok = True
+        except Exception as erro:
+            print(f"Erro na ETL Python ({chave}):", erro)
+            corpo = str(erro)
+            ok = False
+        resultados.append({"key": chave, "ok": ok, "body": corpo, "linhas": medicao.contagens.get("linhas_lidas", 0)})
+    return resultados
+
+
+if __name__ == "__main__":
+    sys.exit(main())
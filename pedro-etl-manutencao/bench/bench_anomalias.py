@@ -0,0 +1,85 @@
+# mede quanto o detector de anomalias (anomalias.py) custa por linha: o
+# mesmo CSV sintético agregado com o detector ligado e desligado, nos dois
+# motores. a diferença por linha tem que ficar dentro do orçamento.
+#
+#   python bench/bench_anomalias.py --linhas 200000 --rodadas 5
+import argparse
+import io
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import agregacao  # noqa: E402
+import anomalias  # noqa: E402
+import colunar  # noqa: E402
+from leitura import iterar_linhas_dados  # noqa: E402
+
+# custo extra aceitável por linha válida, em nanossegundos
+ORCAMENTO_NS = 1000
+
+CABECALHO = "maquina,timestamp,cpu,ram,disco,uptime,temperatura,indoor,situacao,latitude,longitude"
+
+
+def gerar(linhas, semente):
+    # uma linha por minuto com ruído e alguns picos de temperatura
+    aleatorio = random.Random(semente)
+    saida = [CABECALHO]
+    for i in range(linhas):
+        minuto = i % 1440
+        dia = 1 + i // 1440
+        temp = 55 + 5 * math.sin(i / 120) + aleatorio.gauss(0, 1)
+        if aleatorio.random() < 0.001:
+            temp += 30
+        saida.append(
+            f"M1,2025-03-{1 + (dia - 1) % 28:02d} {minuto // 60:02d}:{minuto % 60:02d}:00,"
+            f"{aleatorio.uniform(20, 60):.2f},{aleatorio.gauss(50, 3):.1f},{aleatorio.uniform(40, 60):.3f},"
+            f"{i * 60},{temp:.2f},sim,Normal,-23.5,-46.6"
+        )
+    return "\n".join(saida).encode()
+
+
+def medir(funcao, csv, rodadas):
+    melhor = None
+    for _ in range(rodadas):
+        cabecalho, linhas = iterar_linhas_dados(io.BytesIO(csv))
+        inicio = time.perf_counter()
+        agregado = funcao(cabecalho, linhas)
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return melhor, agregado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas", type=int, default=200000)
+    parser.add_argument("--rodadas", type=int, default=5)
+    parser.add_argument("--semente", type=int, default=7)
+    args = parser.parse_args()
+
+    csv = gerar(args.linhas, args.semente)
+    motores = [("python", agregacao.agregar_linhas)]
+    if colunar.disponivel():
+        motores.append(("numpy", colunar.agregar))
+
+    estourou = False
+    for nome, funcao in motores:
+        anomalias.ATIVO = False
+        sem, _ = medir(funcao, csv, args.rodadas)
+        anomalias.ATIVO = True
+        com, agregado = medir(funcao, csv, args.rodadas)
+        por_linha = (com - sem) / args.linhas * 1e9
+        estourou = estourou or por_linha > ORCAMENTO_NS
+        print(
+            f"{nome:6} sem {sem * 1000:8.1f} ms  com {com * 1000:8.1f} ms  "
+            f"+{por_linha:6.0f} ns/linha (orçamento {ORCAMENTO_NS})  "
+            f"{agregado['anomalias']['total']} anomalia(s)"
+        )
+    return 1 if estourou else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# compara linhas/s do loop antigo (split + strip de todas as colunas +
+# strptime por linha) com o decodificador por cabeçalho do agregacao.
+#
+#   python bench/bench_decodificador.py --linhas 200000
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import agregacao  # noqa: E402
+from leitura import limpar_float  # noqa: E402
+
+CABECALHO = "maquina,timestamp,cpu,ram,disco,uptime,temperatura,indoor,situacao,latitude,longitude"
+
+
+def gerar_linhas(total, formato, semente):
+    aleatorio = random.Random(semente)
+    inicio = datetime(2025, 3, 1)
+    linhas = []
+    for i in range(total):
+        data = (inicio + timedelta(seconds=30 * i)).strftime(formato)
+        linhas.append(",".join([
+            "M1",
+            data,
+            f"{aleatorio.uniform(0, 100):.2f}",
+            f"{aleatorio.uniform(0, 100):.2f}",
+            f"{aleatorio.uniform(10, 99):.2f}",
+            str(i * 30),
+            f"{aleatorio.uniform(20, 95):.2f}",
+            "sim",
+            "Normal",
+            "-23.550520",
+            "-46.633308",
+        ]))
+    return linhas
+
+
+def loop_antigo(linhas, formatos):
+    # o que o index fazia antes: strip de tudo e strptime (tentando cada
+    # formato, como o parse_data do lambda_function) em toda linha
+    datas, cpu, ram, disco, temp = [], [], [], [], []
+    for linha in linhas:
+        colunas = [c.strip() for c in linha.split(",")]
+        if len(colunas) < 11:
+            continue
+        data = None
+        for formato in formatos:
+            try:
+                data = datetime.strptime(colunas[1].split(".")[0], formato)
+                break
+            except Exception:
+                continue
+        if data is None:
+            continue
+        datas.append(data)
+        cpu.append(limpar_float(colunas[2]))
+        ram.append(limpar_float(colunas[3]))
+        disco.append(limpar_float(colunas[4]))
+        temp.append(limpar_float(colunas[6]))
+    return len(datas)
+
+
+def loop_novo(linhas):
+    parcial = agregacao.novo_parcial(CABECALHO)
+    agregacao.acumular_linhas(linhas, parcial)
+    return parcial["n"]
+
+
+def medir(funcao, repeticoes):
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        validas = funcao()
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return validas, melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--linhas", type=int, default=200000)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    cenarios = [
+        ("AAAA-MM-DD HH:MM:SS", "%Y-%m-%d %H:%M:%S", ["%Y-%m-%d %H:%M:%S"]),
+        # pior caso do lambda_function: formato que só casa na 4ª tentativa
+        ("DD/MM/AAAA HH:MM:SS", "%d/%m/%Y %H:%M:%S",
+         ["%d/%m/%Y %H:%M", "%d-%m-%Y %H:%M", "%Y-%m-%d %H:%M", "%d/%m/%Y %H:%M:%S"]),
+    ]
+    for nome, formato, formatos_antigos in cenarios:
+        linhas = gerar_linhas(args.linhas, formato, args.semente)
+        validas_antigo, t_antigo = medir(lambda: loop_antigo(linhas, formatos_antigos), args.repeticoes)
+        validas_novo, t_novo = medir(lambda: loop_novo(linhas), args.repeticoes)
+        assert validas_antigo == validas_novo, (validas_antigo, validas_novo)
+
+        print(f"{nome}: {args.linhas} linhas")
+        print(f"  loop antigo   {args.linhas / t_antigo:12,.0f} linhas/s")
+        print(f"  decodificador {args.linhas / t_novo:12,.0f} linhas/s  ({t_antigo / t_novo:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
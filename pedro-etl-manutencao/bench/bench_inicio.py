@@ -0,0 +1,103 @@
+# mede o cold start do index: cada rodada é um processo novo que importa o
+# index, cria o cliente S3 (offline, sem rede) e faz a primeira e a segunda
+# invocação num CSV local. mostra a mediana de cada etapa.
+#
+#   python bench/bench_inicio.py --rodadas 10
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CABECALHO = "maquina,timestamp,cpu,ram,disco,uptime,temperatura,indoor,situacao,latitude,longitude"
+CHAVE = "Empresa/M1/2025-03-01/dados.csv"
+
+
+def preparar(pasta):
+    caminho = os.path.join(pasta, "origem", *CHAVE.split("/"))
+    os.makedirs(os.path.dirname(caminho))
+    linhas = [CABECALHO] + [
+        f"M1,2025-03-01 {h:02d}:{m:02d}:00,{(h * 7 + m) % 100}.5,40.2,55.0,{h * 3600},61.3,sim,Normal,-23.5,-46.6"
+        for h in range(24) for m in range(60)
+    ]
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        arquivo.write("\n".join(linhas) + "\n")
+
+
+def filho(pasta):
+    # roda num processo novo: nada do index está carregado ainda
+    inicio = time.perf_counter()
+    sys.path.insert(0, RAIZ)
+    import index
+    importacao = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        index._cliente()
+    cliente = time.perf_counter() - inicio
+
+    from espelho import ClienteEspelho
+    index.cliente_s3 = ClienteEspelho({"origem": os.path.join(pasta, "origem"), "destino": os.path.join(pasta, "destino")})
+    index.BALDE_DESTINO = "destino"
+    evento = {"Records": [{"s3": {"bucket": {"name": "origem"}, "object": {"key": CHAVE}}}]}
+
+    tempos = []
+    for _ in range(2):
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            resposta = index.lambda_handler(evento, None)
+        tempos.append(time.perf_counter() - inicio)
+        assert resposta["statusCode"] == 200, resposta
+
+    print(json.dumps({
+        "import": importacao,
+        "cliente": cliente,
+        "primeira": tempos[0],
+        "segunda": tempos[1],
+        "init_reportado": index.DURACAO_INIT_MS / 1000,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rodadas", type=int, default=10)
+    parser.add_argument("--filho", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.filho:
+        filho(args.filho)
+        return
+
+    ambiente = dict(os.environ)
+    # o boto3 precisa de uma região pra montar o cliente, mesmo sem rede
+    ambiente.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    medidas = []
+    with tempfile.TemporaryDirectory() as pasta:
+        preparar(pasta)
+        for _ in range(args.rodadas):
+            saida = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--filho", pasta],
+                env=ambiente, capture_output=True, text=True, check=True,
+            )
+            medidas.append(json.loads(saida.stdout.strip().splitlines()[-1]))
+
+    print(f"{args.rodadas} processos novos (mediana)")
+    for etapa, nome in [
+        ("import", "import do index"),
+        ("init_reportado", "init reportado (DURACAO_INIT_MS)"),
+        ("cliente", "criação do cliente S3"),
+        ("primeira", "primeira invocação"),
+        ("segunda", "segunda invocação (quente)"),
+    ]:
+        print(f"  {nome:34} {statistics.median(m[etapa] for m in medidas) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# mede o lambda_handler de ponta a ponta numa frota sintética
+# (frota_sintetica.py), com o S3 trocado pelo espelho em pastas locais. os
+# arquivos chegam em ordem de dia, um evento por arquivo (ou --lote
+# arquivos por evento), num processo novo (o primeiro evento é cold start).
+# mostra linhas/s, latência p50/p95/p99 por invocação, pico de RSS e bytes
+# gravados, e salva tudo em JSON pra comparar uma rodada com outra:
+#
+#   python bench/bench_lambda.py --maquinas 20 --dias 7 --saida atual.json
+#   python bench/bench_lambda.py --maquinas 20 --dias 7 --saida nova.json --comparar atual.json
+#
+# as ETL_* do ambiente valem normalmente (ETL_MOTOR, ETL_INCREMENTAL...)
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import frota_sintetica
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+VERSAO_RESULTADO = 1
+
+# o que entra na comparação e pra que lado é melhor (1: maior, -1: menor)
+COMPARADOS = {
+    "linhas_s": 1,
+    "latencia_ms.p50": -1,
+    "latencia_ms.p95": -1,
+    "latencia_ms.p99": -1,
+    "rss_pico_mb": -1,
+    "bytes_saida.total": -1,
+}
+
+
+def filho(pasta, chaves, lote):
+    # roda num processo novo: o RSS e o cold start são só do ETL
+    sys.path.insert(0, RAIZ)
+    import index
+    from espelho import ClienteEspelho
+
+    index.cliente_s3 = ClienteEspelho({
+        "origem": os.path.join(pasta, "origem"),
+        "destino": os.path.join(pasta, "destino"),
+    })
+    index.BALDE_DESTINO = "destino"
+
+    latencias = []
+    etapas = {}
+    contagens = {}
+    status = {}
+    for i in range(0, len(chaves), lote):
+        evento = {"Records": [
+            {"s3": {"bucket": {"name": "origem"}, "object": {"key": chave}}} for chave in chaves[i:i + lote]
+        ]}
+        saida = io.StringIO()
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(saida):
+            resposta = index.lambda_handler(evento, None)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        status[resposta["statusCode"]] = status.get(resposta["statusCode"], 0) + 1
+
+        # o registro EMF da invocação traz o tempo de cada etapa
+        for linha in saida.getvalue().splitlines():
+            if linha.startswith('{"_aws"'):
+                registro = json.loads(linha)
+                for nome, valor in registro.items():
+                    if nome.startswith("tempo_") and nome != "tempo_total":
+                        etapas[nome[6:]] = etapas.get(nome[6:], 0.0) + valor
+                    elif nome in index.metricas.CONTAGENS:
+                        contagens[nome] = contagens.get(nome, 0) + valor
+
+    print(json.dumps({
+        "latencias": latencias,
+        "status": status,
+        "etapas_ms": {nome: round(ms, 1) for nome, ms in sorted(etapas.items())},
+        "contagens": contagens,
+        # no linux o ru_maxrss vem em KiB
+        "rss_pico_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def percentil(ordenados, q):
+    # nearest-rank: sempre uma latência que aconteceu de verdade
+    return ordenados[max(0, math.ceil(q * len(ordenados)) - 1)]
+
+
+def bytes_saida(pasta):
+    # dashboards (pedro-client/{empresa}/...) e o resto (_frota, _quantis...)
+    dashboards = outros = 0
+    raiz = os.path.join(pasta, "destino")
+    for diretorio, _, arquivos in os.walk(raiz):
+        for nome in arquivos:
+            tamanho = os.path.getsize(os.path.join(diretorio, nome))
+            partes = os.path.relpath(diretorio, raiz).split(os.sep)
+            if len(partes) > 1 and partes[1].startswith("_"):
+                outros += tamanho
+            else:
+                dashboards += tamanho
+    return {"dashboards": dashboards, "outros": outros, "total": dashboards + outros}
+
+
+def medir(args, pasta):
+    arquivos = frota_sintetica.gerar(os.path.join(pasta, "origem"), **frota_sintetica.parametros(args))
+    chaves = [chave for chave, _, _ in arquivos]
+
+    ambiente = dict(os.environ)
+    ambiente.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    inicio = time.perf_counter()
+    processo = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--filho", pasta, "--lote", str(args.lote)],
+        input=json.dumps(chaves), env=ambiente, capture_output=True, text=True,
+    )
+    duracao = time.perf_counter() - inicio
+    if processo.returncode != 0:
+        sys.stderr.write(processo.stderr)
+        raise SystemExit(processo.returncode)
+    medida = json.loads(processo.stdout.strip().splitlines()[-1])
+
+    latencias = sorted(medida["latencias"])
+    tempo_handler = sum(latencias) / 1000
+    linhas = sum(a[1] for a in arquivos)
+    return {
+        "arquivos": len(arquivos),
+        "invocacoes": len(latencias),
+        "linhas": linhas,
+        "bytes_entrada": sum(a[2] for a in arquivos),
+        "tempo_handler_s": round(tempo_handler, 3),
+        "tempo_processo_s": round(duracao, 3),
+        "linhas_s": round(linhas / tempo_handler, 1),
+        "latencia_ms": {
+            "primeira": round(medida["latencias"][0], 2),
+            "p50": round(percentil(latencias, 0.50), 2),
+            "p95": round(percentil(latencias, 0.95), 2),
+            "p99": round(percentil(latencias, 0.99), 2),
+            "max": round(latencias[-1], 2),
+        },
+        "rss_pico_mb": round(medida["rss_pico_mb"], 1),
+        "bytes_saida": bytes_saida(pasta),
+        "status": medida["status"],
+        "etapas_ms": medida["etapas_ms"],
+        "contagens": medida["contagens"],
+    }
+
+
+def ambiente_atual():
+    sys.path.insert(0, RAIZ)
+    import colunar
+
+    return {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": colunar.np.__version__ if colunar.disponivel() else None,
+        "variaveis": {nome: valor for nome, valor in sorted(os.environ.items()) if nome.startswith("ETL_")},
+    }
+
+
+def comparar(atual, anterior):
+    print(f"comparado com {anterior['quando']}:")
+    for caminho, sentido in COMPARADOS.items():
+        antes, agora = anterior["resultado"], atual["resultado"]
+        for parte in caminho.split("."):
+            antes, agora = antes[parte], agora[parte]
+        variacao = (agora - antes) / antes * 100 if antes else 0.0
+        piorou = variacao * sentido < 0
+        print(f"  {caminho:20} {antes:>14,.1f} -> {agora:>14,.1f}  {variacao:+6.1f}%{'  (pior)' if piorou else ''}")
+    if anterior["config"] != atual["config"]:
+        print("  atenção: a configuração da frota não é a mesma")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    frota_sintetica.adicionar_argumentos(parser)
+    parser.add_argument("--lote", type=int, default=1, help="arquivos por evento")
+    parser.add_argument("--saida", help="JSON com o resultado")
+    parser.add_argument("--comparar", help="JSON de uma rodada anterior")
+    parser.add_argument("--pasta", help="usa essa pasta em vez de uma temporária (e deixa os arquivos lá)")
+    parser.add_argument("--filho", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.filho:
+        filho(args.filho, json.loads(sys.stdin.read()), args.lote)
+        return
+
+    if args.pasta:
+        os.makedirs(args.pasta, exist_ok=True)
+        resultado = medir(args, args.pasta)
+    else:
+        with tempfile.TemporaryDirectory() as pasta:
+            resultado = medir(args, pasta)
+
+    configuracao = {
+        **{nome: str(valor) for nome, valor in frota_sintetica.parametros(args).items()},
+        "lote": args.lote,
+    }
+    atual = {
+        "versao": VERSAO_RESULTADO,
+        "quando": datetime.now().isoformat(timespec="seconds"),
+        "config": configuracao,
+        "ambiente": ambiente_atual(),
+        "resultado": resultado,
+    }
+
+    latencia = resultado["latencia_ms"]
+    print(
+        f"{resultado['arquivos']} arquivo(s), {resultado['linhas']:,} linhas, "
+        f"{resultado['invocacoes']} invocação(ões) em {resultado['tempo_handler_s']:.2f} s"
+    )
+    print(f"  {resultado['linhas_s']:,.0f} linhas/s")
+    print(
+        f"  latência: primeira {latencia['primeira']:.1f} ms, p50 {latencia['p50']:.1f}, "
+        f"p95 {latencia['p95']:.1f}, p99 {latencia['p99']:.1f}, máx {latencia['max']:.1f}"
+    )
+    print(f"  pico de RSS: {resultado['rss_pico_mb']:.1f} MB")
+    print(
+        f"  saída: {resultado['bytes_saida']['total'] / 1e6:.2f} MB "
+        f"({resultado['bytes_saida']['dashboards'] / 1e6:.2f} MB de dashboards)"
+    )
+    print(f"  status: {resultado['status']}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            comparar(atual, json.load(arquivo))
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(atual, arquivo, ensure_ascii=False, indent=2)
+        print(f"resultado em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
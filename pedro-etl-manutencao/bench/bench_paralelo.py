@@ -0,0 +1,97 @@
+# compara a leitura serial com a paralela (paralelo.py) num CSV grande de
+# uma máquina só (vários dias de uma frota sintética, em alta frequência,
+# num arquivo): tempo de cada uma e se os agregados saem idênticos, nos
+# dois motores.
+#
+#   python bench/bench_paralelo.py --dias 14 --intervalo 2 --processos 4
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import frota_sintetica
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import colunar  # noqa: E402
+import index  # noqa: E402
+import paralelo  # noqa: E402
+from espelho import ClienteEspelho  # noqa: E402
+
+CHAVE = "Empresa01/M0001/2025-03-01/dados.csv"
+
+
+def preparar(pasta, args):
+    # os arquivos diários de uma máquina viram um CSV só (um cabeçalho)
+    diarios = os.path.join(pasta, "diarios")
+    arquivos = frota_sintetica.gerar(
+        diarios, maquinas_por_empresa=1, dias=args.dias, intervalo=args.intervalo,
+        quebradas=args.quebradas, virgula=0.0, semente=args.semente,
+    )
+    caminho = os.path.join(pasta, "origem", *CHAVE.split("/"))
+    os.makedirs(os.path.dirname(caminho))
+    with open(caminho, "wb") as saida:
+        for i, (chave, _, _) in enumerate(arquivos):
+            with open(os.path.join(diarios, *chave.split("/")), "rb") as diario:
+                if i:
+                    diario.readline()
+                saida.write(diario.read())
+    return os.path.getsize(caminho), sum(a[1] for a in arquivos)
+
+
+def comparavel(agregado):
+    # numpy e array("d") viram lista, datas viram texto
+    def converter(valor):
+        return valor.tolist() if hasattr(valor, "tolist") else str(valor)
+    return json.dumps(agregado, default=converter, sort_keys=True)
+
+
+def medir(paralelo_ligado, rodadas):
+    paralelo.ATIVO = paralelo_ligado
+    melhor = None
+    for _ in range(rodadas):
+        index.CACHE = index.cache.CacheAgregados(0)
+        inicio = time.perf_counter()
+        agregado = index._agregar_objeto("origem", CHAVE)
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return melhor, comparavel(agregado)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dias", type=int, default=14)
+    parser.add_argument("--intervalo", type=int, default=2, help="segundos entre leituras")
+    parser.add_argument("--quebradas", type=float, default=0.001)
+    parser.add_argument("--processos", type=int, default=paralelo.PROCESSOS)
+    parser.add_argument("--rodadas", type=int, default=3)
+    parser.add_argument("--semente", type=int, default=7)
+    args = parser.parse_args()
+
+    paralelo.PROCESSOS = args.processos
+    paralelo.LIMIAR_BYTES = 0
+    with tempfile.TemporaryDirectory() as pasta:
+        tamanho, linhas = preparar(pasta, args)
+        index.cliente_s3 = ClienteEspelho({"origem": os.path.join(pasta, "origem")})
+        print(f"{tamanho / 1e6:.1f} MB, {linhas:,} linhas, {len(paralelo.faixas(tamanho))} faixa(s)")
+
+        motores = [("python", "python")]
+        if colunar.disponivel():
+            motores.append(("numpy", "numpy"))
+        diferente = False
+        for nome, motor in motores:
+            index.MOTOR = motor
+            serial, esperado = medir(False, args.rodadas)
+            paralela, obtido = medir(True, args.rodadas)
+            diferente = diferente or esperado != obtido
+            print(
+                f"  {nome:6} serial {serial:6.2f} s  paralelo {paralela:6.2f} s  "
+                f"({serial / paralela:4.1f}x)  {'idêntico' if esperado == obtido else 'DIFERENTE'}"
+            )
+    return 1 if diferente else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# mede o erro de rank do p50 e o tamanho dos baldes da pirâmide
+# (piramide.py): gera semanas de 24 horas por dia, faz um balde por hora,
+# junta as horas em dias e os dias na semana (o mesmo caminho do S3, com
+# ida e volta pelo JSON) e compara o p50 com o rank exato.
+#
+#   python bench/bench_piramide.py --linhas-hora 60 --rodadas 20
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from bisect import bisect_left, bisect_right
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import piramide  # noqa: E402
+
+
+def gerar_hora(aleatorio, linhas, dia, hora):
+    # nível muda com o dia e com a hora, pra nenhuma hora sozinha ser a mediana
+    base = 30 + 3 * dia + 0.5 * hora
+    colunas = {
+        nome: [round(min(100.0, max(0.0, aleatorio.gauss(base, 10))), 2) for _ in range(linhas)]
+        for nome in piramide.METRICAS
+    }
+    colunas["prob_falha"] = [float(aleatorio.randint(0, 99)) for _ in range(linhas)]
+    return colunas
+
+
+def erro_rank(ordenados, valor, q):
+    total = len(ordenados)
+    baixo = bisect_left(ordenados, valor) / total
+    alto = bisect_right(ordenados, valor) / total
+    if baixo <= q <= alto:
+        return 0.0
+    return min(abs(q - baixo), abs(q - alto))
+
+
+def ida_e_volta(balde):
+    return json.loads(json.dumps(balde, separators=(",", ":")))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas-hora", type=int, default=60)
+    parser.add_argument("--rodadas", type=int, default=20)
+    parser.add_argument("--semente", type=int, default=7)
+    args = parser.parse_args()
+
+    aleatorio = random.Random(args.semente)
+    pior_dia = 0.0
+    pior_semana = 0.0
+    maior_dia = 0
+    tempo_horas = 0.0
+    tempo_juntar = 0.0
+
+    for _ in range(args.rodadas):
+        horas = [[gerar_hora(aleatorio, args.linhas_hora, d, h) for h in range(24)] for d in range(7)]
+
+        inicio = time.perf_counter()
+        baldes_horas = [[ida_e_volta(piramide.balde_linhas(h)) for h in dia] for dia in horas]
+        tempo_horas += time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        dias = [ida_e_volta(piramide.juntar_baldes(b)) for b in baldes_horas]
+        semana = piramide.juntar_baldes(dias)
+        tempo_juntar += time.perf_counter() - inicio
+
+        for dia, balde in zip(horas, dias):
+            maior_dia = max(maior_dia, len(json.dumps(balde, separators=(",", ":"))))
+            ordenados = sorted(v for h in dia for v in h["cpu"])
+            pior_dia = max(pior_dia, erro_rank(ordenados, balde["cpu"]["p50"], 0.5))
+        ordenados = sorted(v for dia in horas for h in dia for v in h["cpu"])
+        pior_semana = max(pior_semana, erro_rank(ordenados, semana["cpu"]["p50"], 0.5))
+
+    print(f"{args.rodadas} rodadas de 7 dias x 24 horas x {args.linhas_hora} linhas (k={piramide.K})")
+    print(f"  balde de um dia serializado: até {maior_dia / 1024:.1f} KiB (4 métricas)")
+    print(f"  baldes de hora de um dia: {tempo_horas / (7 * args.rodadas) * 1000:.1f} ms")
+    print(f"  junção horas -> dias -> semana: {tempo_juntar / args.rodadas * 1000:.1f} ms")
+    print(f"  p50 do dia: pior erro de rank {pior_dia:.4f} (limite documentado {piramide.ERRO_RANK})")
+    print(f"  p50 da semana: pior erro de rank {pior_semana:.4f} (limite documentado {piramide.ERRO_RANK})")
+
+
+if __name__ == "__main__":
+    main()
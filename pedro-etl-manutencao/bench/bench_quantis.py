@@ -0,0 +1,78 @@
+# mede o erro de rank e o tamanho dos esboços de quantis: gera 7 dias de
+# valores, faz um esboço por dia, junta os 7 e compara cada percentil com
+# o rank exato dos valores da semana inteira.
+#
+#   python bench/bench_quantis.py --linhas-dia 100000 --rodadas 20
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from bisect import bisect_left, bisect_right
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import quantis  # noqa: E402
+
+
+def gerar_dia(aleatorio, linhas, dia):
+    # cada dia com um nível diferente, pra mediana da semana não ser a de um dia só
+    base = 30 + 5 * dia
+    return [round(min(100.0, max(0.0, aleatorio.gauss(base, 12))), 2) for _ in range(linhas)]
+
+
+def erro_rank(ordenados, valor, q):
+    # distância entre q e o intervalo de ranks que o valor ocupa de verdade
+    total = len(ordenados)
+    baixo = bisect_left(ordenados, valor) / total
+    alto = bisect_right(ordenados, valor) / total
+    if baixo <= q <= alto:
+        return 0.0
+    return min(abs(q - baixo), abs(q - alto))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--linhas-dia", type=int, default=100000)
+    parser.add_argument("--rodadas", type=int, default=10)
+    parser.add_argument("--semente", type=int, default=7)
+    args = parser.parse_args()
+
+    aleatorio = random.Random(args.semente)
+    piores = {nome: 0.0 for nome in quantis.PERCENTIS}
+    maior_esboco = 0
+    tempo_esbocos = 0.0
+    tempo_juntar = 0.0
+
+    for _ in range(args.rodadas):
+        dias = [gerar_dia(aleatorio, args.linhas_dia, d) for d in range(7)]
+
+        inicio = time.perf_counter()
+        esbocos = [quantis.EsbocoQuantis().adicionar(valores) for valores in dias]
+        tempo_esbocos += time.perf_counter() - inicio
+
+        for esboco in esbocos:
+            # o que vai pro S3 é o JSON do esboço
+            maior_esboco = max(maior_esboco, len(json.dumps(esboco.para_dict(), separators=(",", ":"))))
+
+        inicio = time.perf_counter()
+        semana = quantis.EsbocoQuantis()
+        for esboco in esbocos:
+            semana.juntar(quantis.EsbocoQuantis.de_dict(esboco.para_dict()))
+        tempo_juntar += time.perf_counter() - inicio
+
+        ordenados = sorted(v for valores in dias for v in valores)
+        for nome, q in quantis.PERCENTIS.items():
+            piores[nome] = max(piores[nome], erro_rank(ordenados, semana.quantil(q), q))
+
+    print(f"{args.rodadas} rodadas de 7 dias x {args.linhas_dia} linhas (k={quantis.K})")
+    print(f"  maior esboço serializado: {maior_esboco / 1024:.1f} KiB por métrica")
+    print(f"  esboço de um dia: {tempo_esbocos / (7 * args.rodadas) * 1000:.1f} ms")
+    print(f"  junção da semana: {tempo_juntar / args.rodadas * 1000:.1f} ms")
+    for nome, pior in piores.items():
+        print(f"  {nome}: pior erro de rank {pior:.4f} (limite documentado {quantis.ERRO_RANK})")
+
+
+if __name__ == "__main__":
+    main()
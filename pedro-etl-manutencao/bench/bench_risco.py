@@ -0,0 +1,95 @@
+# confere e mede a avaliação da frota (risco.avaliar_frota): sorteia
+# métricas e situações pra N máquinas, com boa parte dos valores em cima
+# dos limiares (onde > e >= dariam diferente), compara campo a campo com
+# as funções por máquina e mostra o tempo das duas formas.
+#
+#   python bench/bench_risco.py --maquinas 100000 --rodadas 5
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import risco  # noqa: E402
+
+SITUACOES = ("Normal", "Alerta", "Critico", "ALERTA", "critico", "Desconhecido", "", None)
+
+
+def sortear_valor(aleatorio, limiares):
+    # metade uniforme, metade exatamente num limiar ou a um passo dele
+    if aleatorio.random() < 0.5:
+        return round(aleatorio.uniform(0, 110), aleatorio.choice((0, 1, 2)))
+    limiar = aleatorio.choice(limiares)
+    return limiar + aleatorio.choice((-1, -0.01, 0, 0.01, 1))
+
+
+def sortear_frota(aleatorio, quantidade):
+    limiares = sorted(set(risco.LIMIARES.values()))
+    frota = {"maquinas": [f"M{i}" for i in range(quantidade)]}
+    for campo in ("cpu", "ram", "disco", "temp"):
+        frota[campo] = [sortear_valor(aleatorio, limiares) for _ in range(quantidade)]
+    frota["situacao"] = [aleatorio.choice(SITUACOES) for _ in range(quantidade)]
+    return frota
+
+
+def escalar(frota, limiares):
+    resultados = []
+    for i, maquina in enumerate(frota["maquinas"]):
+        metricas = {
+            "cpu": frota["cpu"][i],
+            "ram": frota["ram"][i],
+            "disk": frota["disco"][i],
+            "temp": frota["temp"][i],
+            "situacao": frota["situacao"][i],
+        }
+        resultados.append((
+            risco.montar_ui_state(metricas, maquina, limiares),
+            risco.calcular_modelo_heuristico(metricas, limiares),
+        ))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--maquinas", type=int, default=100000)
+    parser.add_argument("--rodadas", type=int, default=5)
+    parser.add_argument("--semente", type=int, default=7)
+    args = parser.parse_args()
+
+    aleatorio = random.Random(args.semente)
+    # os limiares padrão e um conjunto alterado (reavaliação da frota)
+    alterados = {nome: valor - 5 for nome, valor in risco.LIMIARES.items()}
+    diferencas = 0
+    tempos_escalar = []
+    tempos_frota = []
+    for rodada in range(args.rodadas):
+        frota = sortear_frota(aleatorio, args.maquinas)
+        limiares = risco.LIMIARES if rodada % 2 == 0 else alterados
+
+        inicio = time.perf_counter()
+        esperado = escalar(frota, limiares)
+        tempos_escalar.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        avaliacao = risco.avaliar_frota(
+            frota["maquinas"], frota["cpu"], frota["ram"], frota["disco"], frota["temp"], frota["situacao"], limiares
+        )
+        tempos_frota.append(time.perf_counter() - inicio)
+
+        for i, par in enumerate(esperado):
+            if risco.por_maquina(avaliacao, i) != par:
+                diferencas += 1
+                if diferencas <= 5:
+                    print("DIFERENTE", frota["maquinas"][i], par, risco.por_maquina(avaliacao, i))
+
+    total = args.maquinas * args.rodadas
+    print(f"{total} máquinas em {args.rodadas} rodadas, {diferencas} diferença(s)")
+    print(f"  por máquina   {min(tempos_escalar) * 1000:9.1f} ms por rodada")
+    print(f"  frota (numpy) {min(tempos_frota) * 1000:9.1f} ms por rodada")
+    return 1 if diferencas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
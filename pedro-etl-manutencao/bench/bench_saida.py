@@ -0,0 +1,80 @@
+# mede bytes e tempo de serialização do JSON de dashboard em cada modo de
+# saída (indentado, compacto, gzip, zstd). o objeto medido é o que o
+# index gera pra um CSV sintético, rodando offline numa pasta temporária.
+#
+#   python bench/bench_saida.py --repeticoes 2000
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("ETL_QUANTIS", "0")
+os.environ.setdefault("ETL_FROTA", "0")
+
+import index  # noqa: E402
+import saida  # noqa: E402
+from espelho import ClienteEspelho  # noqa: E402
+
+CABECALHO = "maquina,timestamp,cpu,ram,disco,uptime,temperatura,indoor,situacao,latitude,longitude"
+
+
+def gerar_dashboard(pasta):
+    aleatorio = random.Random(1)
+    inicio = datetime(2025, 3, 1)
+    linhas = [CABECALHO]
+    for i in range(7 * 24 * 60):
+        data = inicio + timedelta(minutes=i)
+        linhas.append(
+            f"M1,{data:%Y-%m-%d %H:%M:%S},{aleatorio.uniform(0, 100):.2f},{aleatorio.uniform(0, 100):.2f},"
+            f"{aleatorio.uniform(10, 99):.2f},{i * 60},{aleatorio.uniform(20, 95):.2f},sim,Crítico,-23.550520,-46.633308"
+        )
+    chave = "Empresa/M1/2025-03-07/dados.csv"
+    caminho = os.path.join(pasta, "origem", *chave.split("/"))
+    os.makedirs(os.path.dirname(caminho))
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        arquivo.write("\n".join(linhas) + "\n")
+
+    index.cliente_s3 = ClienteEspelho({"origem": os.path.join(pasta, "origem"), "destino": os.path.join(pasta, "destino")})
+    index.BALDE_DESTINO = "destino"
+    with contextlib.redirect_stdout(io.StringIO()):
+        index._processar_objeto("origem", chave)
+    with open(os.path.join(pasta, "destino", "pedro-client", "Empresa", "2025-03-07", "M1.json"), "rb") as arquivo:
+        corpo = arquivo.read()
+    return json.loads(corpo)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticoes", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        dashboard = gerar_dashboard(pasta)
+
+    modos = [("indentado", "nenhuma"), ("compacto", "nenhuma"), ("compacto", "gzip")]
+    if saida.zstandard is not None:
+        modos.append(("compacto", "zstd"))
+
+    base = None
+    print(f"serializador compacto: {'orjson' if saida.orjson is not None else 'json (stdlib)'}")
+    for formato, compressao in modos:
+        inicio = time.perf_counter()
+        for _ in range(args.repeticoes):
+            corpo, _ = saida.serializar(dashboard, formato, compressao)
+        tempo = (time.perf_counter() - inicio) / args.repeticoes * 1e6
+        base = base or len(corpo)
+        print(
+            f"  {formato:9} {compressao:8} {len(corpo):6} bytes "
+            f"({100 * (1 - len(corpo) / base):5.1f}% menor) {tempo:8.1f} us/objeto"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# frota sintética no layout do trusted: empresa/maquina/AAAA-MM-DD/dados.csv,
+# um arquivo por máquina e dia, com as colunas que a leitura espera. cada
+# máquina tem níveis próprios (ciclo diário de CPU, RAM que sobe devagar,
+# disco enchendo, temperatura puxada pela CPU, reboots que zeram o uptime)
+# e a situação sai da temperatura. dá pra misturar linhas quebradas e
+# máquinas no formato com ; e vírgula decimal. mesma semente, mesmos bytes.
+#
+#   python bench/frota_sintetica.py /tmp/trusted --maquinas 20 --dias 7 --intervalo 60
+import argparse
+import math
+import os
+import random
+from datetime import datetime, timedelta
+
+CABECALHO = "maquina,timestamp,cpu,ram,disco,uptime,temperatura,indoor,situacao,latitude,longitude"
+# layout exportado por planilha: ; e vírgula decimal, data no formato brasileiro
+CABECALHO_VIRGULA = "Maquina;Timestamp;CPU;Memória;Disco;Uptime;Temperatura;Indoor;Situação;Latitude;Longitude"
+
+CIDADES = (
+    (-23.5505, -46.6333),
+    (-22.9068, -43.1729),
+    (-19.9167, -43.9345),
+    (-25.4284, -49.2733),
+    (-30.0346, -51.2177),
+    (-12.9777, -38.5016),
+    (-8.0476, -34.8770),
+    (-3.7319, -38.5267),
+)
+
+TIPOS_QUEBRADAS = ("curta", "data", "vazia", "lixo", "branca")
+
+
+def maquinas(empresas, por_empresa, semente):
+    # perfil fixo de cada máquina (não depende de dias nem de intervalo)
+    aleatorio = random.Random(semente)
+    resultado = []
+    for e in range(empresas):
+        for m in range(por_empresa):
+            latitude, longitude = aleatorio.choice(CIDADES)
+            resultado.append({
+                "empresa": f"Empresa{e + 1:02d}",
+                "maquina": f"M{m + 1:04d}",
+                "cpu": aleatorio.uniform(15, 55),
+                "ram": aleatorio.uniform(30, 70),
+                "disco": aleatorio.uniform(20, 80),
+                "temp": aleatorio.uniform(40, 60),
+                "latitude": latitude + aleatorio.uniform(-0.3, 0.3),
+                "longitude": longitude + aleatorio.uniform(-0.3, 0.3),
+                "indoor": aleatorio.choice(("sim", "não")),
+            })
+    return resultado
+
+
+def gerar(pasta, empresas=1, maquinas_por_empresa=10, dias=7, intervalo=60, inicio=datetime(2025, 3, 1),
+          quebradas=0.0, virgula=0.0, semente=7):
+    # grava a frota em pasta/ e devolve [(chave, linhas de dados, bytes)] em
+    # ordem de dia (a ordem em que os arquivos chegariam no trusted)
+    arquivos = []
+    frota = maquinas(empresas, maquinas_por_empresa, semente)
+    for dia in range(dias):
+        data = inicio + timedelta(days=dia)
+        for indice, perfil in enumerate(frota):
+            # semente por máquina e dia: gerar 3 ou 30 dias dá os mesmos primeiros dias
+            aleatorio = random.Random(f"{semente}/{indice}/{dia}")
+            formato_virgula = random.Random(f"{semente}/{indice}").random() < virgula
+            chave = f"{perfil['empresa']}/{perfil['maquina']}/{data:%Y-%m-%d}/dados.csv"
+            linhas = _linhas(perfil, aleatorio, data, dia, intervalo, quebradas, formato_virgula)
+            conteudo = ("\n".join(linhas) + "\n").encode("utf-8")
+            caminho = os.path.join(pasta, *chave.split("/"))
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, "wb") as arquivo:
+                arquivo.write(conteudo)
+            arquivos.append((chave, len(linhas) - 1, len(conteudo)))
+    return arquivos
+
+
+def _linhas(perfil, aleatorio, data, dia, intervalo, quebradas, formato_virgula):
+    separador = ";" if formato_virgula else ","
+    linhas = [CABECALHO_VIRGULA if formato_virgula else CABECALHO]
+    uptime = aleatorio.randint(0, 30 * 86400)
+    for segundo in range(0, 86400, intervalo):
+        momento = data + timedelta(seconds=segundo)
+        hora = segundo / 3600
+        uptime += intervalo
+        if aleatorio.random() < 0.0005:
+            uptime = 0
+
+        cpu = perfil["cpu"] + 20 * math.sin((hora - 9) / 24 * 2 * math.pi) + aleatorio.gauss(0, 6)
+        ram = perfil["ram"] + 0.5 * dia + aleatorio.gauss(0, 2)
+        disco = perfil["disco"] + 0.2 * dia + segundo / 86400 * 0.2
+        temp = perfil["temp"] + 0.25 * (cpu - perfil["cpu"]) + aleatorio.gauss(0, 1.5)
+        if aleatorio.random() < 0.002:
+            temp += aleatorio.uniform(15, 35)
+        cpu, ram, disco, temp = (min(100.0, max(0.0, v)) for v in (cpu, ram, disco, temp))
+        situacao = "Critico" if temp >= 85 else "Alerta" if temp >= 70 else "Normal"
+
+        if formato_virgula:
+            texto_data = momento.strftime("%d/%m/%Y %H:%M:%S")
+        else:
+            # parte dos arquivos reais vem com milissegundos
+            texto_data = momento.strftime("%Y-%m-%d %H:%M:%S") + (".000" if segundo % 7 == 0 else "")
+        colunas = [
+            perfil["maquina"],
+            texto_data,
+            f"{cpu:.2f}",
+            f"{ram:.2f}",
+            f"{disco:.3f}",
+            str(uptime),
+            f"{temp:.2f}",
+            perfil["indoor"],
+            situacao,
+            f"{perfil['latitude']:.6f}",
+            f"{perfil['longitude']:.6f}",
+        ]
+        if formato_virgula:
+            colunas = [c.replace(".", ",") if i in (2, 3, 4, 6, 9, 10) else c for i, c in enumerate(colunas)]
+
+        if quebradas and aleatorio.random() < quebradas:
+            colunas = _quebrar(colunas, aleatorio)
+            if colunas is None:
+                linhas.append("")
+                continue
+        linhas.append(separador.join(colunas))
+    return linhas
+
+
+def _quebrar(colunas, aleatorio):
+    # os defeitos que aparecem no trusted de verdade
+    tipo = aleatorio.choice(TIPOS_QUEBRADAS)
+    if tipo == "curta":
+        return colunas[:aleatorio.randint(1, 5)]
+    if tipo == "data":
+        return [colunas[0], aleatorio.choice(("", "n/a", "2025-13-45 99:99:99"))] + colunas[2:]
+    if tipo == "vazia":
+        indice = aleatorio.choice((2, 3, 4, 6))
+        return colunas[:indice] + [""] + colunas[indice + 1:]
+    if tipo == "lixo":
+        indice = aleatorio.choice((2, 3, 4, 6))
+        return colunas[:indice] + [aleatorio.choice(("erro", "NaN?", "--"))] + colunas[indice + 1:]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gera uma frota sintética no layout do trusted")
+    parser.add_argument("pasta")
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    arquivos = gerar(args.pasta, **parametros(args))
+    print(f"{len(arquivos)} arquivo(s), {sum(a[1] for a in arquivos):,} linhas, "
+          f"{sum(a[2] for a in arquivos) / 1e6:.1f} MB em {args.pasta}")
+
+
+def adicionar_argumentos(parser):
+    parser.add_argument("--empresas", type=int, default=1)
+    parser.add_argument("--maquinas", type=int, default=10, help="máquinas por empresa")
+    parser.add_argument("--dias", type=int, default=7)
+    parser.add_argument("--intervalo", type=int, default=60, help="segundos entre leituras")
+    parser.add_argument("--inicio", default="2025-03-01")
+    parser.add_argument("--quebradas", type=float, default=0.01, help="fração de linhas com defeito")
+    parser.add_argument("--virgula", type=float, default=0.2, help="fração de máquinas com ; e vírgula decimal")
+    parser.add_argument("--semente", type=int, default=7)
+
+
+def parametros(args):
+    return {
+        "empresas": args.empresas,
+        "maquinas_por_empresa": args.maquinas,
+        "dias": args.dias,
+        "intervalo": args.intervalo,
+        "inicio": datetime.strptime(args.inicio, "%Y-%m-%d"),
+        "quebradas": args.quebradas,
+        "virgula": args.virgula,
+        "semente": args.semente,
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from metricas import NULA
+
+# agregados já calculados, guardados no container quente entre invocações.
+# cada entrada lembra o ETag do CSV de onde saiu: o GET vai com
+# IfNoneMatch e, se o objeto não mudou, o S3 responde 304 sem corpo e o
+# agregado volta daqui sem baixar nem parsear nada. o limite é em bytes
+# (estimados) e sai o usado há mais tempo. ETL_CACHE_MB=0 desliga
+LIMITE_BYTES = int(float(os.environ.get("ETL_CACHE_MB", "128")) * 1024 * 1024)
+
+
+class CacheAgregados:
+    # compartilhado pelas threads do pool, por isso a trava
+
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self.acertos = 0
+        self.faltas = 0
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._trava = threading.Lock()
+
+    def buscar(self, cliente, balde, chave, medicao=NULA):
+        # devolve (agregado, None) se o objeto não mudou desde que foi
+        # guardado, ou (None, resposta do GET) pra quem chamou parsear
+        with self._trava:
+            entrada = self._entradas.get((balde, chave))
+        if entrada is None:
+            return None, self._falta(cliente.get_object(Bucket=balde, Key=chave), medicao)
+
+        etag, agregado, _ = entrada
+        try:
+            resposta = cliente.get_object(Bucket=balde, Key=chave, IfNoneMatch=etag)
+        except Exception as erro:
+            if _codigo_erro(erro) not in ("304", "NotModified"):
+                raise
+            with self._trava:
+                self.acertos += 1
+                if (balde, chave) in self._entradas:
+                    self._entradas.move_to_end((balde, chave))
+            medicao.somar("cache_acertos")
+            print(f"[ETL] {chave} não mudou (ETag {etag}), usando o agregado em memória")
+            return agregado, None
+        return None, self._falta(resposta, medicao)
+
+    def guardar(self, balde, chave, etag, agregado):
+        if self.limite_bytes <= 0 or not etag:
+            return
+        tamanho = _tamanho(agregado)
+        if tamanho > self.limite_bytes:
+            return
+        with self._trava:
+            anterior = self._entradas.pop((balde, chave), None)
+            if anterior is not None:
+                self._bytes -= anterior[2]
+            self._entradas[(balde, chave)] = (etag, agregado, tamanho)
+            self._bytes += tamanho
+            while self._bytes > self.limite_bytes:
+                _, (_, _, liberado) = self._entradas.popitem(last=False)
+                self._bytes -= liberado
+
+    def resumo(self):
+        with self._trava:
+            return {
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+            }
+
+    def _falta(self, resposta, medicao):
+        with self._trava:
+            self.faltas += 1
+        medicao.somar("cache_faltas")
+        return resposta
+
+
+def _codigo_erro(erro):
+    return getattr(erro, "response", {}).get("Error", {}).get("Code")
+
+
+def _tamanho(objeto):
+    # estimativa do que o agregado ocupa: arrays (array e numpy) contam o
+    # buffer, containers somam o que guardam
+    if isinstance(objeto, dict):
+        return sys.getsizeof(objeto) + sum(_tamanho(k) + _tamanho(v) for k, v in objeto.items())
+    if isinstance(objeto, (list, tuple)):
+        return sys.getsizeof(objeto) + sum(_tamanho(v) for v in objeto)
+    nbytes = getattr(objeto, "nbytes", None)
+    if nbytes is not None:
+        return sys.getsizeof(objeto) + (0 if getattr(objeto, "base", None) is None else nbytes)
+    return sys.getsizeof(objeto)
@@ -0,0 +1,394 @@
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+import anomalias
+import piramide
+import regressao
+import serie
+from leitura import FORMATOS_DATA, Decodificador, converter_float, layout_formato
+from metricas import NULA
+
+# numpy é opcional: sem ele (zip padrão da Lambda) o index usa o motor em
+# python puro. com ele (layer), as contas viram operações vetorizadas. o
+# import só acontece na primeira vez que alguém pergunta (fora do cold start)
+np = None
+_numpy_procurado = False
+
+# quantas linhas juntamos antes de converter pra array (limita a memória
+# das listas de texto temporárias)
+TAMANHO_LOTE = 65536
+
+# cada lote é convertido em pedaços desse tamanho: um pedaço com célula
+# quebrada volta pro caminho lento sozinho, o resto do lote não
+TAMANHO_PEDACO = 1024
+
+METRICAS = ("cpu", "ram", "disco", "temp")
+
+# tamanho fixo, separadores e fatias de cada formato de data (leitura.py)
+_LAYOUTS_DATAS = [layout_formato(formato) for formato in FORMATOS_DATA]
+_LARGURA_DATAS = max(tamanho for tamanho, _, _ in _LAYOUTS_DATAS) + 1
+_CAMPOS_TABELA = ("timestamp",) + METRICAS
+
+
+def disponivel():
+    global np, _numpy_procurado
+    if not _numpy_procurado:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+        _numpy_procurado = True
+    return np is not None
+
+
+def agregar(cabecalho, linhas_dados, medicao=NULA):
+    # mesmo contrato do agregacao.agregar_linhas, mas com colunas numpy:
+    # timestamps em datetime64[s] e métricas em float64 (float32 mudaria
+    # as medianas e o JSON tem que sair idêntico ao do motor python)
+    decodificador = Decodificador(cabecalho)
+    with medicao.etapa("linhas"):
+        lotes = _ler_lotes(linhas_dados, decodificador)
+    with medicao.etapa("medianas"):
+        return _finalizar(decodificador, *lotes, medicao)
+
+
+def _ler_lotes(linhas_dados, decodificador):
+    lotes_datas = []
+    lotes_metricas = {m: [] for m in METRICAS}
+    total_linhas = 0
+    colunas_ultima = None
+
+    # o python só separa as linhas em lotes (islice, sem loop por linha);
+    # separar as células, corte dos milissegundos e conversão são feitos
+    # no lote inteiro de uma vez
+    linhas_dados = iter(linhas_dados)
+    while True:
+        lote = list(islice(linhas_dados, TAMANHO_LOTE))
+        if not lote:
+            break
+        total_linhas += len(lote)
+        colunas_ultima = _fechar_lote(lote, decodificador, lotes_datas, lotes_metricas) or colunas_ultima
+    return total_linhas, colunas_ultima, lotes_datas, lotes_metricas
+
+
+def _finalizar(decodificador, total_linhas, colunas_ultima, lotes_datas, lotes_metricas, medicao):
+    completas = sum(lote.size for lote in lotes_datas)
+    medicao.somar("linhas_lidas", total_linhas)
+    medicao.somar("linhas_curtas", total_linhas - completas)
+
+    resultado = {
+        "total_linhas": total_linhas,
+        "colunas_ultima": [c.strip() for c in colunas_ultima] if colunas_ultima else None,
+        "posicoes": decodificador.posicoes,
+        "data_maxima": None,
+    }
+    if not lotes_datas:
+        return resultado
+
+    datas = np.concatenate(lotes_datas)
+    colunas = {m: np.concatenate(lotes_metricas[m]) for m in METRICAS}
+
+    # linhas com timestamp inválido viram NaT e saem de tudo
+    validas = ~np.isnat(datas)
+    medicao.somar("linhas_validas", int(validas.sum()))
+    medicao.somar("linhas_data_invalida", completas - int(validas.sum()))
+    if not validas.all():
+        datas = datas[validas]
+        colunas = {m: v[validas] for m, v in colunas.items()}
+    if datas.size == 0:
+        return resultado
+
+    # detector de anomalias: é sequencial (EWMA), então roda em python nas
+    # colunas já convertidas, na ordem do arquivo, igual ao motor python
+    detector = anomalias.novo()
+    if detector is not None:
+        detector.varrer(datas.tolist(), colunas["cpu"].tolist(), colunas["ram"].tolist(), colunas["temp"].tolist())
+        resultado["anomalias"] = detector.resultado()
+
+    # mesma conta do agregacao.calcular_prob_falha_simples, linha a linha
+    prob = np.minimum(99.0, np.floor(colunas["temp"] * 0.7 + colunas["disco"] * 0.3))
+
+    data_maxima = datas.max()
+    dias = datas.astype("datetime64[D]")
+    mascara_dia = dias == data_maxima.astype("datetime64[D]")
+    mascara_semana = datas >= data_maxima - np.timedelta64(7, "D")
+
+    resultado["data_maxima"] = data_maxima.astype(datetime)
+    resultado["medianas"] = {
+        "dia": {m: _mediana(colunas[m][mascara_dia]) for m in METRICAS},
+        "semanal": {m: _mediana(colunas[m][mascara_semana]) for m in METRICAS},
+    }
+    resultado["somas_regressao"] = _somas_regressao(prob)
+    resultado["tempos_semana"] = _tempos(datas[mascara_semana], prob[mascara_semana], data_maxima)
+    resultado["somas_tempo"] = _somas_janelas(*resultado["tempos_semana"])
+    if serie.PONTOS:
+        mascara_serie = datas >= data_maxima - np.timedelta64(serie.JANELA_SEGUNDOS, "s")
+        resultado["serie_detalhada"] = _serie_detalhada(
+            datas[mascara_serie], {**colunas, "prob_falha": prob}, mascara_serie
+        )
+    resultado["historico_7d"] = _historico(dias[mascara_semana], {
+        "cpu": colunas["cpu"][mascara_semana],
+        "ram": colunas["ram"][mascara_semana],
+        "disco": colunas["disco"][mascara_semana],
+        "temp": colunas["temp"][mascara_semana],
+        "prob_falha": prob[mascara_semana],
+    })
+
+    # valores de cada um dos 7 dias que terminam em data_maxima (pros
+    # esboços), em ordem de tempo como no motor python: o esboço depende
+    # da ordem em que os valores entram
+    ultimo_dia = data_maxima.astype("datetime64[D]")
+    mascara_dias = dias > ultimo_dia - np.timedelta64(7, "D")
+    resultado["dias_semana"] = _fatias(
+        datas[mascara_dias], {m: colunas[m][mascara_dias] for m in METRICAS}, "D"
+    )
+
+    if piramide.ATIVO:
+        # e hora a hora dos mesmos dias, pros resumos da pirâmide
+        resultado["horas"] = [
+            (hora, piramide.balde_linhas(valores))
+            for hora, valores in _fatias(datas[mascara_dias], {
+                **{m: colunas[m][mascara_dias] for m in METRICAS},
+                "prob_falha": prob[mascara_dias],
+            }, "h")
+        ]
+    return resultado
+
+
+def _fechar_lote(lote, decodificador, lotes_datas, lotes_metricas):
+    # devolve as colunas da última linha completa do lote (ou None)
+    separador = decodificador.separador
+    posicoes = decodificador.posicoes
+    textos_datas = []
+    ultima = None
+    for i in range(0, len(lote), TAMANHO_PEDACO):
+        parte = lote[i:i + TAMANHO_PEDACO]
+        # ponto decimal: o loadtxt (parser em C) separa e converte só as
+        # colunas usadas, sem um str por célula. pedaço com linha curta,
+        # célula vazia ou lixo (ou com vírgula decimal) vai pelo split
+        tabela = _ler_tabela(parte, decodificador) if separador == "," else None
+        if tabela is not None:
+            textos_datas.extend(tabela["timestamp"].tolist())
+            for m in METRICAS:
+                lotes_metricas[m].append(tabela[m])
+            ultima = parte[-1]
+            continue
+
+        parte, largura, ultima_parte = _acertar_larguras(parte, separador, decodificador.largura_minima)
+        if not parte:
+            continue
+        # todas as linhas com o mesmo número de colunas: um split só no
+        # pedaço inteiro e cada coluna é uma fatia da lista
+        celulas = separador.join(parte).split(separador)
+        textos_datas.extend(celulas[posicoes["timestamp"]::largura])
+        for m in METRICAS:
+            lotes_metricas[m].append(_converter_floats(celulas[posicoes[m]::largura], separador == ";"))
+        ultima = ultima_parte
+
+    if ultima is None:
+        return None
+    lotes_datas.append(_converter_datas(textos_datas, decodificador))
+    return ultima.split(separador)
+
+
+def _ler_tabela(linhas, decodificador):
+    # as colunas das datas e métricas, mais a última que a leitura exige:
+    # linha sem ela (curta pro motor python) faz o loadtxt recusar o pedaço
+    posicoes = decodificador.posicoes
+    colunas = [posicoes[c] for c in _CAMPOS_TABELA]
+    tipos = [(c, object if c == "timestamp" else np.float64) for c in _CAMPOS_TABELA]
+    if decodificador.largura_minima - 1 not in colunas:
+        colunas.append(decodificador.largura_minima - 1)
+        tipos.append(("largura", "U1"))
+    try:
+        return np.loadtxt(linhas, delimiter=decodificador.separador, usecols=colunas, dtype=tipos, comments=None, ndmin=1)
+    except ValueError:
+        return None
+
+
+def _acertar_larguras(linhas, separador, largura_minima):
+    # devolve (linhas, largura, última completa) com todas as linhas do
+    # mesmo tamanho. as que estão fora do tamanho mais comum: incompletas
+    # (menos de largura_minima colunas) saem, as outras são cortadas ou
+    # completadas com "". as colunas que a leitura usa estão todas antes de
+    # largura_minima, então nada muda nelas
+    separadores = [linha.count(separador) for linha in linhas]
+    largura = separadores[0] + 1
+    if min(separadores) == max(separadores) and largura >= largura_minima:
+        return linhas, largura, linhas[-1]
+
+    largura = max(Counter(separadores).most_common(1)[0][0] + 1, largura_minima)
+    acertadas = []
+    ultima = None
+    for linha, quantidade in zip(linhas, separadores):
+        if quantidade + 1 == largura:
+            acertadas.append(linha)
+            ultima = linha
+        elif quantidade + 1 >= largura_minima:
+            acertadas.append(separador.join((linha.split(separador) + [""] * largura)[:largura]))
+            ultima = linha
+    return acertadas, largura, ultima
+
+
+def _converter_datas(textos, decodificador):
+    # os formatos de data aceitos têm tamanho fixo: cada um é conferido
+    # (separadores e dígitos) e convertido no lote inteiro, direto dos
+    # códigos dos caracteres. o que não casa com nenhum, ou casa mas é uma
+    # data que não existe, vai pro decodificador do motor python, texto a
+    # texto, e sai igual nos dois motores
+    n = len(textos)
+    datas = np.full(n, np.datetime64("NaT"), dtype="datetime64[s]")
+    if n == 0:
+        return datas
+    comprimentos = np.fromiter(map(len, textos), dtype=np.int64, count=n)
+    # só o começo de cada texto importa (o maior formato mais o "." dos
+    # milissegundos): lixo comprido não faz o array crescer
+    codigos = np.array(textos, dtype=f"U{_LARGURA_DATAS}").view(np.uint32).reshape(n, _LARGURA_DATAS)
+    pendentes = np.ones(n, dtype=bool)
+
+    for tamanho, separadores, fatias in _LAYOUTS_DATAS:
+        # texto do tamanho do formato ou com ".milissegundos" logo depois
+        # (o split(".")[0] do motor python)
+        mascara = (comprimentos == tamanho) | ((comprimentos > tamanho) & (codigos[:, tamanho] == ord(".")))
+        for posicao, caractere in separadores:
+            mascara &= codigos[:, posicao] == ord(caractere)
+        mascara &= pendentes
+        if not mascara.any():
+            continue
+        indices = np.flatnonzero(mascara)
+        # sem sinal: o que vem antes do "0" dá a volta e também fica > 9
+        digitos = codigos[indices, :tamanho] - np.uint32(ord("0"))
+        posicoes = [p for a, b in fatias.values() for p in range(a, b)]
+        numericos = (digitos[:, posicoes] <= 9).all(axis=1)
+
+        campos = {}
+        for diretiva, (a, b) in fatias.items():
+            campos[diretiva] = digitos[:, a:b].astype(np.int64) @ (10 ** np.arange(b - a - 1, -1, -1))
+        segundo = campos.get("S", 0)
+        validas = (
+            numericos & (campos["Y"] >= 1) & (campos["m"] >= 1) & (campos["m"] <= 12) & (campos["d"] >= 1)
+            & (campos["H"] <= 23) & (campos["M"] <= 59) & (segundo <= 59)
+        )
+        meses = np.where(validas, (campos["Y"] - 1970) * 12 + campos["m"] - 1, 0).astype("datetime64[M]")
+        dias = meses.astype("datetime64[D]") + np.where(validas, campos["d"] - 1, 0)
+        # dia 31 num mês de 30 (ou 29/02 fora de ano bissexto) cai no mês seguinte
+        validas &= dias.astype("datetime64[M]") == meses
+        segundos = (campos["H"] * 3600 + campos["M"] * 60 + segundo).astype("timedelta64[s]")
+        datas[indices[validas]] = (dias.astype("datetime64[s]") + segundos)[validas]
+        pendentes[indices[validas]] = False
+
+    for i in np.flatnonzero(pendentes):
+        data = decodificador.data(textos[i])
+        if data is not None:
+            datas[i] = data
+    return datas
+
+
+def _converter_floats(textos, virgula_decimal):
+    # float() do python aceita os mesmos textos que o limpar_float (espaços
+    # inclusive); o que ele recusa (célula vazia, lixo, vírgula decimal)
+    # passa pelo converter_float
+    if virgula_decimal:
+        textos = [t.replace(",", ".") for t in textos]
+    try:
+        return np.fromiter(map(float, textos), dtype=np.float64, count=len(textos))
+    except ValueError:
+        return np.fromiter(map(converter_float, textos), dtype=np.float64, count=len(textos))
+
+
+def _mediana(valores):
+    if valores.size == 0:
+        return 0.0
+    return float(np.median(valores))
+
+
+def _somas_regressao(prob):
+    # as probabilidades são inteiras, então em int64 as somas são exatas e
+    # batem com as somas acumuladas pelo motor python
+    n = int(prob.size)
+    y = prob.astype(np.int64)
+    x = np.arange(n, dtype=np.int64)
+    return {
+        "n": n,
+        "soma_x": n * (n - 1) // 2,
+        "soma_y": float(y.sum()),
+        "soma_x2": (n - 1) * n * (2 * n - 1) // 6,
+        "soma_xy": float((x * y).sum()),
+        "primeira": float(prob[0]),
+        "ultima": float(prob[-1]),
+    }
+
+
+def _tempos(datas, prob, data_maxima):
+    # segundos até a data_maxima e prob inteira, em ordem de tempo
+    ordem = np.argsort(datas, kind="stable")
+    return (datas[ordem] - data_maxima).astype(np.int64), prob[ordem].astype(np.int64)
+
+
+def _somas_janelas(t, p):
+    # mesmas somas do regressao.somas_janelas: soma acumulada em int64
+    # (exata pra uma semana de linhas) e cada janela é um searchsorted +
+    # subtração
+    prefixos = {
+        "soma_t": np.concatenate(([0], np.cumsum(t))),
+        "soma_p": np.concatenate(([0], np.cumsum(p))),
+        "soma_tt": np.concatenate(([0], np.cumsum(t * t))),
+        "soma_tp": np.concatenate(([0], np.cumsum(t * p))),
+    }
+    total = t.size
+    somas = {}
+    for nome, duracao in regressao.HORIZONTES.items():
+        i = int(np.searchsorted(t, -duracao, side="left"))
+        somas[nome] = {"n": total - i}
+        for soma, prefixo in prefixos.items():
+            somas[nome][soma] = int(prefixo[total] - prefixo[i])
+    return somas
+
+
+def _serie_detalhada(datas, colunas, mascara):
+    # mesma escolha de pontos do serie.reduzir: ordem estável por tempo e
+    # um argmin/argmax por balde (os dois devolvem o primeiro empatado)
+    ordem = np.argsort(datas, kind="stable")
+    textos = np.datetime_as_string(datas[ordem], unit="s")
+    n = int(ordem.size)
+    resultado = {"janela_horas": serie.JANELA_SEGUNDOS / 3600, "pontos_max": serie.PONTOS}
+    for nome in serie.COLUNAS:
+        valores = colunas[nome][mascara][ordem]
+        if n <= serie.PONTOS:
+            indices = np.arange(n)
+        else:
+            escolhidos = []
+            for i, f in serie.baldes(n):
+                menor = i + int(np.argmin(valores[i:f]))
+                maior = i + int(np.argmax(valores[i:f]))
+                escolhidos.extend(sorted({menor, maior}))
+            indices = np.array(escolhidos, dtype=np.int64)
+        resultado[nome] = {"t": textos[indices].tolist(), "v": valores[indices].tolist()}
+    return resultado
+
+
+def _fatias(datas, colunas, unidade):
+    # mesmas fatias do motor python: ordem estável por tempo e uma fatia
+    # contígua por dia ("D") ou hora ("h")
+    ordem = np.argsort(datas, kind="stable")
+    chaves = datas[ordem].astype(f"datetime64[{unidade}]")
+    unicas, inicios = np.unique(chaves, return_index=True)
+    fins = np.append(inicios[1:], chaves.size)
+    ordenadas = {nome: valores[ordem] for nome, valores in colunas.items()}
+    return [
+        (chave.astype(datetime), {nome: valores[i:f] for nome, valores in ordenadas.items()})
+        for chave, i, f in zip(unicas, inicios.tolist(), fins.tolist())
+    ]
+
+
+def _historico(dias, colunas):
+    if dias.size == 0:
+        return {"labels": [], "cpu": [], "ram": [], "disco": [], "temp": [], "prob_falha": []}
+
+    dias_ordenados = np.unique(dias)[-7:]
+    historico = {"labels": [str(d) for d in dias_ordenados]}
+    for nome, valores in colunas.items():
+        historico[nome] = [float(np.median(valores[dias == d])) for d in dias_ordenados]
+    return historico
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+# até esse tamanho o ETag é o MD5 do conteúdo
+LIMITE_MD5 = 1024 * 1024
+
+
+class ClienteEspelho:
+    # o pedaço da API do cliente S3 que o ETL usa, em cima de diretórios
+    # locais: cada bucket aponta pra uma pasta e a chave é o caminho dentro
+    # dela. bucket sem pasta vai pro cliente remoto (se tiver um)
+
+    def __init__(self, diretorios, remoto=None):
+        self.diretorios = {balde: os.path.abspath(pasta) for balde, pasta in diretorios.items()}
+        self.remoto = remoto
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if Bucket not in self.diretorios:
+            return self._remoto().get_object(Bucket=Bucket, Key=Key, **kwargs)
+        caminho = self._caminho(Bucket, Key)
+        if not os.path.isfile(caminho):
+            raise _erro("NoSuchKey", "GetObject")
+        etag = _etag(caminho)
+        if kwargs.get("IfMatch", etag) != etag:
+            raise _erro("PreconditionFailed", "GetObject")
+        if kwargs.get("IfNoneMatch") == etag:
+            raise _erro("304", "GetObject")
+
+        inicio = 0
+        if kwargs.get("Range"):
+            # só o formato que o ETL usa: bytes=inicio-
+            inicio = int(kwargs["Range"].split("=")[1].split("-")[0])
+        corpo = open(caminho, "rb")
+        corpo.seek(inicio)
+        return {
+            "Body": corpo,
+            "ETag": etag,
+            "ContentLength": os.path.getsize(caminho) - inicio,
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        if Bucket not in self.diretorios:
+            return self._remoto().head_object(Bucket=Bucket, Key=Key, **kwargs)
+        caminho = self._caminho(Bucket, Key)
+        if not os.path.isfile(caminho):
+            raise _erro("404", "HeadObject")
+        return {"ETag": _etag(caminho), "ContentLength": os.path.getsize(caminho)}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if Bucket not in self.diretorios:
+            return self._remoto().put_object(Bucket=Bucket, Key=Key, Body=Body, **kwargs)
+        caminho = self._caminho(Bucket, Key)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        # grava num temporário e troca: quem lê nunca vê arquivo pela metade.
+        # o nome leva a thread: threads do mesmo processo gravam a mesma
+        # chave ao mesmo tempo (a frota, o feed de mudanças)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporario, "wb") as arquivo:
+            arquivo.write(Body)
+
+        if "IfMatch" not in kwargs and "IfNoneMatch" not in kwargs:
+            os.replace(temporario, caminho)
+            return {"ETag": _etag(caminho)}
+
+        # escrita condicional: confere e troca segurando uma trava, pra
+        # processos do backfill em paralelo se comportarem como o S3
+        with _Trava(caminho):
+            existe = os.path.isfile(caminho)
+            if kwargs.get("IfNoneMatch") == "*" and existe:
+                os.remove(temporario)
+                raise _erro("PreconditionFailed", "PutObject")
+            if "IfMatch" in kwargs and (not existe or _etag(caminho) != kwargs["IfMatch"]):
+                os.remove(temporario)
+                raise _erro("PreconditionFailed", "PutObject")
+            os.replace(temporario, caminho)
+            return {"ETag": _etag(caminho)}
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        if Bucket not in self.diretorios:
+            return self._remoto().list_objects_v2(Bucket=Bucket, Prefix=Prefix, **kwargs)
+        raiz = self.diretorios[Bucket]
+        depois_de = kwargs.get("StartAfter", "")
+        chaves = []
+        # só desce na pasta do prefixo (o S3 lista o bucket inteiro, aqui não precisa)
+        inicio = os.path.join(raiz, *Prefix.split("/")[:-1])
+        for pasta, _, arquivos in os.walk(inicio):
+            for nome in arquivos:
+                if nome.endswith((".tmp", ".lock")):
+                    continue
+                chave = os.path.relpath(os.path.join(pasta, nome), raiz).replace(os.sep, "/")
+                if chave.startswith(Prefix) and chave > depois_de:
+                    chaves.append(chave)
+        # tudo numa página só (sem IsTruncated), na ordem do S3
+        return {
+            "Contents": [
+                {
+                    "Key": chave,
+                    "Size": os.path.getsize(self._caminho(Bucket, chave)),
+                    "ETag": _etag(self._caminho(Bucket, chave)),
+                }
+                for chave in sorted(chaves)
+            ],
+            "IsTruncated": False,
+        }
+
+    def _caminho(self, balde, chave):
+        return os.path.join(self.diretorios[balde], *chave.split("/"))
+
+    def _remoto(self):
+        if self.remoto is None:
+            raise ValueError("bucket sem pasta local e sem cliente S3 configurado")
+        return self.remoto
+
+
+class _Trava:
+    # arquivo .lock criado com O_EXCL: só um processo consegue por vez
+    def __init__(self, caminho):
+        self.caminho = f"{caminho}.lock"
+
+    def __enter__(self):
+        while True:
+            try:
+                os.close(os.open(self.caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except FileExistsError:
+                time.sleep(0.001)
+
+    def __exit__(self, *erro):
+        os.remove(self.caminho)
+
+
+def _etag(caminho):
+    # arquivo pequeno (JSONs de saída, checkpoints): MD5 do conteúdo, igual
+    # ao S3. CSV grande: tamanho e mtime, que mudam quando ele cresce
+    info = os.stat(caminho)
+    if info.st_size <= LIMITE_MD5:
+        with open(caminho, "rb") as arquivo:
+            return f'"{hashlib.md5(arquivo.read()).hexdigest()}"'
+    return f'"{info.st_size:x}-{info.st_mtime_ns:x}"'
+
+
+def _erro(codigo, operacao):
+    return ClientError({"Error": {"Code": codigo}}, operacao)
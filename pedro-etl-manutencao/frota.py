@@ -0,0 +1,179 @@
+import json
+import random
+import time
+
+# um resumo da frota por empresa e dia, pro painel não ter que baixar o
+# JSON de cada máquina. fica fora de pedro-client/{empresa}/{data}/ pra não
+# aparecer como máquina pra quem lista essa pasta.
+#
+# cada máquina grava só o próprio objeto ({prefixo}/{empresa}/{data}/
+# {maquina}.json), sem disputa com as outras; o resumo da empresa
+# ({prefixo}/{empresa}/{data}.json) é uma compactação desses objetos
+PREFIXO_FROTA = "pedro-client/_frota"
+VERSAO_FROTA = 1
+
+# quantas vezes tenta de novo quando outra invocação gravou no meio
+TENTATIVAS = 8
+
+SEVERIDADES = ("INFO", "ALERTA", "CRITICO")
+NIVEIS_RISCO = ("low", "medium", "high")
+
+
+def chave_frota(empresa, data_str):
+    return f"{PREFIXO_FROTA}/{empresa}/{data_str}.json"
+
+
+def chave_maquina(empresa, data_str, maquina_id):
+    return f"{PREFIXO_FROTA}/{empresa}/{data_str}/{maquina_id}.json"
+
+
+def resumo_maquina(dashboard_json):
+    # só o que a visão geral da empresa mostra
+    return {
+        "status": dashboard_json["status"],
+        "severity": dashboard_json["ui"]["severity"],
+        "prob": dashboard_json["risk_model"]["prob"],
+        "riskLevel": dashboard_json["risk_model"]["riskLevel"],
+        "latitude": dashboard_json["raw_metrics"]["latitude"],
+        "longitude": dashboard_json["raw_metrics"]["longitude"],
+        "last_update": dashboard_json["last_update"],
+    }
+
+
+def atualizar(cliente, balde, empresa, data_str, maquina_id, dashboard_json):
+    # grava o objeto dessa máquina (só ela escreve nele, então não tem
+    # disputa nem escrita condicional). devolve (gravou, entrada anterior
+    # da máquina ou None)
+    chave = chave_maquina(empresa, data_str, maquina_id)
+    entrada = resumo_maquina(dashboard_json)
+    objeto, _ = _carregar(cliente, balde, chave, lambda: _vazia_maquina(empresa, data_str, maquina_id))
+    anterior = objeto["resumo"]
+    if anterior == entrada:
+        # nada mudou pra essa máquina, não precisa gravar
+        return False, anterior
+
+    objeto["resumo"] = entrada
+    cliente.put_object(
+        Bucket=balde,
+        Key=chave,
+        Body=json.dumps(objeto, ensure_ascii=False, separators=(",", ":")),
+        ContentType="application/json",
+    )
+    return True, anterior
+
+
+def compactar(cliente, balde, empresa, data_str):
+    # refaz o resumo da empresa a partir dos objetos das máquinas. o resumo
+    # guarda o ETag de cada objeto que já entrou nele, então só os que
+    # mudaram são lidos de novo. a listagem fica dentro do alterar: se
+    # outra compactação gravou no meio, a nova tentativa relê o resumo e,
+    # se ela já viu tudo que essa viu, não grava nada. devolve se gravou
+    prefixo = f"{PREFIXO_FROTA}/{empresa}/{data_str}/"
+
+    def alterar(frota):
+        etags = frota.setdefault("etags", {})
+        mudou = False
+        for chave, etag in _listar(cliente, balde, prefixo):
+            maquina_id = chave[len(prefixo):-len(".json")]
+            if etag is not None and etags.get(maquina_id) == etag:
+                continue
+            objeto, etag_lido = _carregar(cliente, balde, chave, lambda: _vazia_maquina(empresa, data_str, maquina_id))
+            if objeto["resumo"] is None or etags.get(maquina_id) == etag_lido:
+                continue
+            etags[maquina_id] = etag_lido
+            frota["maquinas"][maquina_id] = objeto["resumo"]
+            mudou = True
+        if mudou:
+            # ordem fixa: o mesmo conjunto de máquinas gera sempre o mesmo JSON
+            frota["maquinas"] = dict(sorted(frota["maquinas"].items()))
+            frota["etags"] = dict(sorted(etags.items()))
+            frota["contagens"] = _contar(frota["maquinas"])
+        return mudou
+
+    return atualizar_condicional(cliente, balde, chave_frota(empresa, data_str), lambda: _vazia(empresa, data_str), alterar)
+
+
+def atualizar_condicional(cliente, balde, chave, vazio, alterar):
+    # lê o JSON, aplica alterar(objeto) (que devolve False se não mudou
+    # nada) e grava de volta com escrita condicional (If-Match no ETag
+    # lido, ou If-None-Match se ainda não existe). se outra invocação
+    # gravou antes, o S3 recusa e a gente relê e tenta de novo: nenhuma
+    # atualização se perde
+    for tentativa in range(TENTATIVAS):
+        objeto, etag = _carregar(cliente, balde, chave, vazio)
+        if not alterar(objeto):
+            return False
+
+        condicao = {"IfMatch": etag} if etag is not None else {"IfNoneMatch": "*"}
+        try:
+            cliente.put_object(
+                Bucket=balde,
+                Key=chave,
+                Body=json.dumps(objeto, ensure_ascii=False, separators=(",", ":")),
+                ContentType="application/json",
+                **condicao,
+            )
+            return True
+        except Exception as erro:
+            if _codigo_erro(erro) not in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409"):
+                raise
+        # espera um pouco (cada vez mais, com sorteio) antes de reler
+        time.sleep(random.uniform(0, 0.05 * (2 ** tentativa)))
+
+    raise RuntimeError(f"não deu pra atualizar {chave} depois de {TENTATIVAS} tentativas")
+
+
+def _carregar(cliente, balde, chave, vazio):
+    try:
+        resposta = cliente.get_object(Bucket=balde, Key=chave)
+    except Exception as erro:
+        if _codigo_erro(erro) in ("NoSuchKey", "404"):
+            return vazio(), None
+        raise
+    objeto = json.loads(resposta["Body"].read())
+    novo = vazio()
+    if objeto.get("versao") != novo["versao"]:
+        # formato antigo: recomeça, cada máquina se reinsere na próxima execução
+        objeto = novo
+    return objeto, resposta["ETag"]
+
+
+def _listar(cliente, balde, prefixo):
+    # (chave, ETag) dos objetos das máquinas; sem ETag na listagem, None
+    # (e o objeto é lido sempre)
+    parametros = {"Bucket": balde, "Prefix": prefixo}
+    while True:
+        resposta = cliente.list_objects_v2(**parametros)
+        for objeto in resposta.get("Contents", []):
+            if objeto["Key"].endswith(".json"):
+                yield objeto["Key"], objeto.get("ETag")
+        if not resposta.get("IsTruncated"):
+            return
+        parametros["ContinuationToken"] = resposta["NextContinuationToken"]
+
+
+def _vazia_maquina(empresa, data_str, maquina_id):
+    return {"versao": VERSAO_FROTA, "company": empresa, "date": data_str, "machine": maquina_id, "resumo": None}
+
+
+def _vazia(empresa, data_str):
+    return {
+        "versao": VERSAO_FROTA,
+        "company": empresa,
+        "date": data_str,
+        "maquinas": {},
+        "contagens": _contar({}),
+    }
+
+
+def _contar(maquinas):
+    severidade = dict.fromkeys(SEVERIDADES, 0)
+    risco = dict.fromkeys(NIVEIS_RISCO, 0)
+    for maquina in maquinas.values():
+        severidade[maquina["severity"]] = severidade.get(maquina["severity"], 0) + 1
+        risco[maquina["riskLevel"]] = risco.get(maquina["riskLevel"], 0) + 1
+    return {"total": len(maquinas), "severity": severidade, "riskLevel": risco}
+
+
+def _codigo_erro(erro):
+    return getattr(erro, "response", {}).get("Error", {}).get("Code")
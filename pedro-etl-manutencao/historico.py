@@ -0,0 +1,199 @@
+import os
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import agregacao
+import colunar
+import incremental
+import metricas
+import regressao
+
+# o trusted é particionado por dia (empresa/maquina/data/arquivo.csv), então
+# o CSV do evento sozinho quase sempre só tem um dia. aqui entram os
+# arquivos das partições dos 6 dias anteriores (e os outros do mesmo dia):
+# todos os GETs saem ao mesmo tempo e as linhas de cada arquivo se juntam
+# às do CSV do evento no histórico, nas medianas e nas regressões
+DIAS = 7
+WORKERS = int(os.environ.get("ETL_HISTORICO_WORKERS", "6"))
+
+
+def listar_chaves(cliente, balde, empresa, maquina_id, data_maxima, chave_origem):
+    return list(listar_objetos(cliente, balde, empresa, maquina_id, data_maxima, chave_origem))
+
+
+def listar_objetos(cliente, balde, empresa, maquina_id, data_maxima, chave_origem):
+    # {chave: [etag, tamanho]} dos CSVs da janela (o manifesto guarda isso
+    # pra saber se algum mudou). uma listagem só, começando na partição
+    # mais antiga da janela: as datas ISO ordenam igual às chaves do S3
+    ultimo = data_maxima.date()
+    primeiro = ultimo - timedelta(days=DIAS - 1)
+    prefixo = f"{empresa}/{maquina_id}/"
+    parametros = {"Bucket": balde, "Prefix": prefixo, "StartAfter": f"{prefixo}{primeiro:%Y-%m-%d}"}
+
+    objetos = {}
+    while True:
+        resposta = cliente.list_objects_v2(**parametros)
+        for objeto in resposta.get("Contents", []):
+            chave = objeto["Key"]
+            partes = chave.split("/")
+            if len(partes) < 4 or chave == chave_origem or not chave.lower().endswith(".csv"):
+                continue
+            dia = _data_particao(partes[2])
+            if dia is None or dia < primeiro:
+                continue
+            if dia > ultimo:
+                return objetos
+            objetos[chave] = [objeto.get("ETag"), objeto.get("Size")]
+        if not resposta.get("IsTruncated"):
+            return objetos
+        parametros["ContinuationToken"] = resposta["NextContinuationToken"]
+
+
+def carregar(balde, chaves, agregar_objeto, medicao=metricas.NULA):
+    # agregar_objeto(balde, chave, medicao) -> agregado de um arquivo. cada
+    # arquivo numa thread com a própria Medicao (ela não é compartilhável);
+    # no fim só as contagens vão pra do arquivo do evento, os tempos se
+    # sobrepõem e ficam na etapa "historico" de quem chamou. devolve
+    # {chave: agregado} dos que deu pra ler
+    def tarefa(chave):
+        medicao_arquivo = metricas.nova()
+        try:
+            return agregar_objeto(balde, chave, medicao_arquivo), medicao_arquivo
+        except Exception as erro:
+            # histórico é complemento: arquivo com problema fica de fora
+            print(f"[ETL] Histórico: não deu pra ler {chave}:", erro)
+            return None, medicao_arquivo
+
+    if not chaves:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(WORKERS, len(chaves)))) as executor:
+        resultados = list(executor.map(tarefa, chaves))
+
+    agregados = {}
+    for chave, (agregado, medicao_arquivo) in zip(chaves, resultados):
+        for nome, valor in medicao_arquivo.contagens.items():
+            medicao.somar(nome, valor)
+        if agregado is not None and agregado["data_maxima"] is not None:
+            agregados[chave] = agregado
+    return agregados
+
+
+def juntar(agregado, anteriores, usar_numpy):
+    # cópia do agregado do CSV do evento com historico_7d, medianas e as
+    # duas regressões refeitos sobre as linhas de todos os arquivos (os 7
+    # dias que terminam na data_maxima dele). o resto (última linha,
+    # dias_semana pros esboços) continua sendo só do CSV do evento
+    ultimo = agregado["data_maxima"].date()
+    primeiro = ultimo - timedelta(days=DIAS - 1)
+    por_dia = {}
+    for fonte in [agregado] + anteriores:
+        for dia, colunas in fonte["dias_semana"]:
+            if primeiro <= dia <= ultimo:
+                por_dia.setdefault(dia, []).append(colunas)
+
+    juntar_valores = _juntar_numpy if usar_numpy else _juntar_python
+    mediana = colunar._mediana if usar_numpy else agregacao._mediana
+    dias = sorted(por_dia)
+    colunas_dias = {}
+    for dia in dias:
+        colunas_dias[dia] = {m: juntar_valores([c[m] for c in por_dia[dia]]) for m in agregacao.METRICAS}
+        colunas_dias[dia]["prob_falha"] = _prob_falha(colunas_dias[dia], usar_numpy)
+
+    historico = {"labels": [dia.strftime("%Y-%m-%d") for dia in dias]}
+    for nome in agregacao.COLUNAS:
+        historico[nome] = [mediana(colunas_dias[dia][nome]) for dia in dias]
+
+    resultado = dict(agregado)
+    resultado["historico_7d"] = historico
+    resultado["medianas"] = {
+        "dia": {m: mediana(colunas_dias[ultimo][m]) for m in agregacao.METRICAS},
+        "semanal": {
+            m: mediana(juntar_valores([colunas_dias[dia][m] for dia in dias])) for m in agregacao.METRICAS
+        },
+    }
+    fontes = [agregado] + anteriores
+    resultado["somas_regressao"] = _somas_regressao(fontes)
+    resultado["somas_tempo"] = _somas_tempo(agregado["data_maxima"], fontes, usar_numpy)
+    return resultado
+
+
+def _somas_regressao(fontes):
+    # regressão por índice sobre as linhas dos arquivos um depois do outro,
+    # em ordem de data (a mesma conta do paralelo.juntar_parciais)
+    n = 0
+    soma_y = soma_xy = 0.0
+    primeira = ultima = None
+    for fonte in sorted(fontes, key=lambda f: f["data_maxima"]):
+        somas = fonte["somas_regressao"]
+        if not somas["n"]:
+            continue
+        if n == 0:
+            primeira = somas["primeira"]
+        soma_xy += somas["soma_xy"] + n * somas["soma_y"]
+        soma_y += somas["soma_y"]
+        n += somas["n"]
+        ultima = somas["ultima"]
+    return {
+        "n": n,
+        "soma_x": n * (n - 1) // 2,
+        "soma_y": soma_y,
+        "soma_x2": (n - 1) * n * (2 * n - 1) // 6,
+        "soma_xy": soma_xy,
+        "primeira": primeira,
+        "ultima": ultima,
+    }
+
+
+def _somas_tempo(data_maxima, fontes, usar_numpy):
+    # janelas de 1h/24h/7d até a data_maxima do evento. cada arquivo entra
+    # com as próprias linhas, deslocadas pra essa data_maxima; as somas são
+    # inteiras, então somar as janelas de cada um dá o mesmo que juntar as
+    # linhas. o CSV do evento no modo incremental só tem somas por minuto
+    segundo_maximo = (data_maxima - incremental.EPOCA) // incremental.UM_SEGUNDO
+    total = {nome: dict.fromkeys(("n", "soma_t", "soma_p", "soma_tt", "soma_tp"), 0) for nome in regressao.HORIZONTES}
+    for fonte in fontes:
+        if "minutos_tempo" in fonte:
+            somas = incremental._somas_tempo(fonte["minutos_tempo"], segundo_maximo)
+        else:
+            deslocamento = int((fonte["data_maxima"] - data_maxima).total_seconds())
+            segundos, probs = fonte["tempos_semana"]
+            # linhas depois da data_maxima do evento (outro arquivo do mesmo
+            # dia) ficam de fora, igual ao que vem depois da última linha
+            if usar_numpy:
+                fim = int(colunar.np.searchsorted(segundos, -deslocamento, side="right"))
+                somas = colunar._somas_janelas(segundos[:fim] + deslocamento, probs[:fim])
+            else:
+                fim = bisect_right(segundos, -deslocamento)
+                somas = regressao.somas_janelas([t + deslocamento for t in segundos[:fim]], probs[:fim])
+        for nome, janela in somas.items():
+            for campo, valor in janela.items():
+                total[nome][campo] += valor
+    return total
+
+
+def _data_particao(texto):
+    try:
+        return datetime.strptime(texto, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _juntar_python(partes):
+    valores = array("d")
+    for parte in partes:
+        valores.extend(parte)
+    return valores
+
+
+def _juntar_numpy(partes):
+    return colunar.np.concatenate(partes)
+
+
+def _prob_falha(colunas, usar_numpy):
+    # mesma conta de cada motor pra prob_falha de cada linha
+    if usar_numpy:
+        np = colunar.np
+        return np.minimum(99.0, np.floor(colunas["temp"] * 0.7 + colunas["disco"] * 0.3))
+    return array("d", map(agregacao.calcular_prob_falha_simples, colunas["temp"], colunas["disco"]))
@@ -0,0 +1,445 @@
+import base64
+import json
+from array import array
+from datetime import datetime, timedelta
+
+import agregacao
+import anomalias
+import piramide
+import quantis
+import regressao
+import serie
+from leitura import LeitorLinhas
+from metricas import NULA
+
+# checkpoint por CSV de origem (o trusted é particionado por dia, então
+# cada partição tem o seu e uma não invalida a outra), ao lado dos JSONs
+# de saída
+PREFIXO_ESTADO = "pedro-client/_state"
+VERSAO_CHECKPOINT = 4
+
+# datas do checkpoint vão como microssegundos desde essa época (mais
+# compacto que texto)
+EPOCA = datetime(1970, 1, 1)
+UM_SEGUNDO = timedelta(seconds=1)
+UM_MICROSSEGUNDO = timedelta(microseconds=1)
+
+# dias que terminam no dia da data_maxima: o recorte do historico_7d e dos
+# esboços de quantis
+DIAS = 7
+
+
+def chave_checkpoint(chave_origem):
+    return f"{PREFIXO_ESTADO}/{chave_origem}.json"
+
+
+def agregar(cliente, balde_origem, chave_origem, balde_estado, chave_estado, medicao=NULA):
+    # quase o resultado do agregacao.agregar_linhas, mas só lendo do S3 os
+    # bytes que chegaram depois do último checkpoint. o CSV do trusted
+    # cresce por append; se ETag/tamanho/cauda mostrarem que ele foi
+    # reescrito, a gente volta pra leitura completa.
+    #
+    # o checkpoint não guarda linhas, só resumos que dá pra somar (o
+    # tamanho não cresce com o CSV):
+    #   - por dia dos últimos 7, um esboço KLL (quantis.EsbocoQuantis) por
+    #     coluna. enquanto o dia tem menos de quantis.K linhas o esboço não
+    #     compactou e as medianas saem iguais às da leitura completa;
+    #     depois disso o erro de rank fica em quantis.ERRO_RANK
+    #   - por minuto dos últimos 7 dias, as somas da regressão contra o
+    #     tempo (inteiras, exatas). a janela começa no minuto cheio: só
+    #     difere da leitura completa se a data_maxima não cair no segundo
+    #     0 ou se as datas tiverem fração de segundo
+    #   - o detector de anomalias e as somas da regressão por índice, como
+    #     sempre (exatos)
+    #   - com ETL_SERIE_PONTOS, as linhas da janela da série (ela precisa
+    #     dos pontos); com a pirâmide ligada, os baldes de hora já juntados
+    # e a mediana semanal sai dos 7 dias de calendário até a data_maxima
+    # (a leitura completa corta em data_maxima - 7 dias)
+    cabeca = cliente.head_object(Bucket=balde_origem, Key=chave_origem)
+    etag = cabeca["ETag"]
+    tamanho = cabeca["ContentLength"]
+
+    checkpoint, etag_checkpoint = _carregar(cliente, balde_estado, chave_estado)
+    leitura = None
+    if _pode_continuar(checkpoint, balde_origem, chave_origem, etag, tamanho):
+        leitura = _ler_continuacao(cliente, balde_origem, chave_origem, etag, tamanho, checkpoint)
+        if leitura is None:
+            print(f"[ETL] {chave_origem} foi reescrito, refazendo do zero.")
+    elif checkpoint is not None:
+        print(f"[ETL] Checkpoint não serve pra {chave_origem}, refazendo do zero.")
+
+    if leitura is None:
+        leitura = _ler_completo(cliente, balde_origem, chave_origem, etag)
+
+    parcial, estado, leitor, linhas, cabecalho_lido = leitura
+    with medicao.etapa("linhas"):
+        agregacao.acumular_linhas(linhas, parcial, medicao)
+        _incorporar(estado, parcial)
+
+    # o checkpoint só cobre linhas completas: a última linha sem \n entra
+    # no resultado de agora, mas é relida na próxima vez
+    novo_checkpoint = None
+    if cabecalho_lido:
+        with medicao.etapa("checkpoint"):
+            novo_checkpoint = json.dumps(
+                _montar_checkpoint(parcial, estado, leitor, balde_origem, chave_origem, etag, tamanho),
+                separators=(",", ":"),
+            )
+
+    with medicao.etapa("linhas"):
+        if leitor.fragmento.strip():
+            agregacao.acumular_linhas([leitor.fragmento], parcial, medicao)
+            _incorporar(estado, parcial)
+
+    with medicao.etapa("medianas"):
+        agregado = _finalizar(parcial, estado)
+
+    if novo_checkpoint is not None:
+        _gravar(cliente, balde_estado, chave_estado, novo_checkpoint, etag_checkpoint)
+    return agregado
+
+
+def _gravar(cliente, balde, chave, corpo, etag):
+    # escrita condicional contra o checkpoint lido: se outra invocação do
+    # mesmo CSV gravou no meio, fica o dela (ele também é válido, o
+    # _pode_continuar confere ETag e tamanho na próxima)
+    condicao = {"IfMatch": etag} if etag is not None else {"IfNoneMatch": "*"}
+    try:
+        cliente.put_object(Bucket=balde, Key=chave, Body=corpo, ContentType="application/json", **condicao)
+    except Exception as erro:
+        if _codigo_erro(erro) not in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409"):
+            raise
+        print(f"[ETL] Checkpoint {chave} gravado por outra invocação no meio, mantendo o dela.")
+
+
+def _carregar(cliente, balde, chave):
+    try:
+        resposta = cliente.get_object(Bucket=balde, Key=chave)
+    except Exception as erro:
+        # primeira vez desse CSV (ou checkpoint sumiu): leitura completa
+        if _codigo_erro(erro) in ("NoSuchKey", "404"):
+            return None, None
+        raise
+    return json.loads(resposta["Body"].read()), resposta["ETag"]
+
+
+def _codigo_erro(erro):
+    return getattr(erro, "response", {}).get("Error", {}).get("Code")
+
+
+def _configuracao():
+    # o que muda o que o checkpoint guarda: com outra, ele não serve
+    return {
+        "k": quantis.K,
+        "serie": [serie.PONTOS, serie.JANELA_SEGUNDOS],
+        "piramide": [piramide.ATIVO, piramide.K],
+    }
+
+
+def _pode_continuar(checkpoint, balde_origem, chave_origem, etag, tamanho):
+    if checkpoint is None or checkpoint.get("versao") != VERSAO_CHECKPOINT:
+        return False
+    if checkpoint["configuracao"] != _configuracao():
+        return False
+    origem = checkpoint["origem"]
+    if origem["bucket"] != balde_origem or origem["key"] != chave_origem:
+        return False
+    if etag == origem["etag"]:
+        return True
+    # ETag mudou: só é append se o arquivo cresceu. do mesmo tamanho (ou
+    # menor) é reescrita, mesmo que a cauda bata
+    return tamanho > origem["tamanho"]
+
+
+def _ler_completo(cliente, balde_origem, chave_origem, etag):
+    resposta = cliente.get_object(Bucket=balde_origem, Key=chave_origem, IfMatch=etag)
+    leitor = LeitorLinhas(resposta["Body"])
+    linhas = (l for l in leitor.linhas() if l.strip())
+    cabecalho = next(linhas, None)
+    return agregacao.novo_parcial(cabecalho), _novo_estado(), leitor, linhas, cabecalho is not None
+
+
+def _ler_continuacao(cliente, balde_origem, chave_origem, etag, tamanho, checkpoint):
+    offset = checkpoint["offset"]
+    cauda = base64.b64decode(checkpoint["cauda"])
+    parcial = _para_parcial(checkpoint)
+    estado = _para_estado(checkpoint)
+
+    if tamanho == offset:
+        # mesmo ETag e nada depois da última linha completa
+        leitor = LeitorLinhas(_CorpoVazio(), inicio=offset)
+        leitor.cauda = cauda
+        return parcial, estado, leitor, leitor.linhas(), True
+
+    # GET parcial a partir de um pouco antes do offset: os bytes da cauda
+    # têm que bater, senão o arquivo foi reescrito e não só cresceu
+    inicio = offset - len(cauda)
+    resposta = cliente.get_object(
+        Bucket=balde_origem,
+        Key=chave_origem,
+        Range=f"bytes={inicio}-",
+        IfMatch=etag,
+    )
+    corpo = resposta["Body"]
+    if corpo.read(len(cauda)) != cauda:
+        corpo.close()
+        return None
+
+    leitor = LeitorLinhas(corpo, inicio=offset)
+    leitor.cauda = cauda
+    linhas = (l for l in leitor.linhas() if l.strip())
+    print(f"[ETL] Continuando {chave_origem} a partir do byte {offset} ({tamanho - offset} novos)")
+    return parcial, estado, leitor, linhas, True
+
+
+class _CorpoVazio:
+    def read(self, tamanho=-1):
+        return b""
+
+
+def _novo_estado():
+    # resumos da janela: esboços por dia, somas por minuto, linhas da
+    # série e baldes da pirâmide por hora
+    return {"data_maxima": None, "dias": {}, "minutos": {}, "serie": [], "horas": {}}
+
+
+def _incorporar(estado, parcial):
+    # as linhas válidas que o acumular_linhas acabou de pôr no parcial
+    # entram nos resumos e saem do parcial (ele fica só com as somas)
+    lista_datas = parcial["datas"]
+    if not lista_datas:
+        return
+    colunas = parcial["colunas"]
+    if estado["data_maxima"] is None or max(lista_datas) > estado["data_maxima"]:
+        estado["data_maxima"] = max(lista_datas)
+    data_maxima = estado["data_maxima"]
+    inicio_dias = datetime.combine(data_maxima.date() - timedelta(days=DIAS - 1), datetime.min.time())
+    inicio_serie = data_maxima - timedelta(seconds=serie.JANELA_SEGUNDOS)
+    segundo_maximo = (data_maxima - EPOCA) // UM_SEGUNDO
+    corte_minutos = segundo_maximo - max(regressao.HORIZONTES.values())
+
+    # uma volta nas linhas: somas por minuto e índices por dia/hora
+    minutos = estado["minutos"]
+    por_dia = {}
+    por_hora = {}
+    probs = colunas["prob_falha"]
+    for i, data in enumerate(lista_datas):
+        segundo = (data - EPOCA) // UM_SEGUNDO
+        if segundo >= corte_minutos:
+            minuto = segundo - segundo % 60
+            d = segundo - minuto
+            p = int(probs[i])
+            somas = minutos.get(minuto)
+            if somas is None:
+                somas = minutos[minuto] = [0, 0, 0, 0, 0]
+            somas[0] += 1
+            somas[1] += d
+            somas[2] += d * d
+            somas[3] += p
+            somas[4] += d * p
+        if data >= inicio_dias:
+            por_dia.setdefault(data.date(), []).append(i)
+            if piramide.ATIVO:
+                por_hora.setdefault(data.replace(minute=0, second=0, microsecond=0), []).append(i)
+        if serie.PONTOS and data >= inicio_serie:
+            estado["serie"].append((data, [colunas[nome][i] for nome in agregacao.COLUNAS]))
+
+    # cada dia na ordem do arquivo, como na leitura completa
+    for dia, indices in sorted(por_dia.items()):
+        esbocos = estado["dias"].setdefault(dia, {nome: quantis.EsbocoQuantis() for nome in agregacao.COLUNAS})
+        for nome, esboco in esbocos.items():
+            valores = colunas[nome]
+            esboco.adicionar([valores[i] for i in indices])
+    for hora, indices in sorted(por_hora.items()):
+        novo = piramide.balde_linhas({nome: [colunas[nome][i] for i in indices] for nome in agregacao.COLUNAS})
+        anterior = estado["horas"].get(hora)
+        estado["horas"][hora] = novo if anterior is None else piramide.juntar_baldes([anterior, novo])
+
+    # a data máxima só cresce: o que saiu da janela não volta
+    estado["dias"] = {dia: e for dia, e in estado["dias"].items() if dia >= inicio_dias.date()}
+    estado["horas"] = {hora: b for hora, b in estado["horas"].items() if hora >= inicio_dias}
+    estado["minutos"] = {m: s for m, s in minutos.items() if m >= corte_minutos}
+    estado["serie"] = [linha for linha in estado["serie"] if linha[0] >= inicio_serie]
+
+    del lista_datas[:]
+    for valores in colunas.values():
+        del valores[:]
+
+
+def _finalizar(parcial, estado):
+    # mesmo dicionário do agregacao.finalizar, montado dos resumos
+    agregado = {
+        "total_linhas": parcial["total_linhas"],
+        "colunas_ultima": parcial["colunas_ultima"],
+        "posicoes": parcial["posicoes"],
+        "data_maxima": None,
+    }
+    data_maxima = estado["data_maxima"]
+    if data_maxima is None:
+        return agregado
+
+    agregado["somas_regressao"] = agregacao.somas_regressao(parcial)
+    if parcial["detector"] is not None:
+        agregado["anomalias"] = parcial["detector"].resultado()
+
+    dias = sorted(estado["dias"])
+    valores = {dia: {nome: _valores(e) for nome, e in estado["dias"][dia].items()} for dia in dias}
+    ultimo = data_maxima.date()
+    agregado["data_maxima"] = data_maxima
+    agregado["medianas"] = {
+        "dia": {m: agregacao._mediana(valores[ultimo][m]) for m in agregacao.METRICAS},
+        "semanal": {
+            m: agregacao._mediana(array("d", (v for dia in dias for v in valores[dia][m])))
+            for m in agregacao.METRICAS
+        },
+    }
+    historico = {"labels": [dia.strftime("%Y-%m-%d") for dia in dias]}
+    for nome in agregacao.COLUNAS:
+        historico[nome] = [float(agregacao._median(valores[dia][nome])) for dia in dias]
+    agregado["historico_7d"] = historico
+
+    # o historico.juntar soma os minutos com as linhas dos outros arquivos
+    agregado["minutos_tempo"] = estado["minutos"]
+    agregado["somas_tempo"] = _somas_tempo(estado["minutos"], (data_maxima - EPOCA) // UM_SEGUNDO)
+
+    if serie.PONTOS:
+        # ordem estável por tempo, igual ao agregacao.ordenar
+        linhas = sorted(estado["serie"], key=lambda linha: linha[0])
+        agregado["serie_detalhada"] = serie.reduzir(
+            [data for data, _ in linhas],
+            {nome: array("d", (v[j] for _, v in linhas)) for j, nome in enumerate(agregacao.COLUNAS)},
+        )
+
+    agregado["dias_semana"] = [(dia, {m: valores[dia][m] for m in agregacao.METRICAS}) for dia in dias]
+    if piramide.ATIVO:
+        agregado["horas"] = sorted(estado["horas"].items())
+    return agregado
+
+
+def _valores(esboco):
+    # os valores do dia de volta do esboço, cada um repetido pelo peso do
+    # nível (2^h): a mediana deles é a do esboço, e enquanto ele não
+    # compactou são as próprias linhas do dia
+    valores = array("d")
+    for h, nivel in enumerate(esboco.niveis):
+        for valor in nivel:
+            valores.extend(array("d", [valor]) * (1 << h))
+    return valores
+
+
+def _somas_tempo(minutos, segundo_maximo):
+    # mesmas somas do regressao.somas_janelas. cada minuto guarda as somas
+    # com d = segundos desde o início dele; com c = início - data_maxima,
+    # t = c + d e as somas em t saem das em d (tudo int, exato)
+    somas = {}
+    for nome, duracao in regressao.HORIZONTES.items():
+        n = soma_t = soma_p = soma_tt = soma_tp = 0
+        for minuto, (quantos, soma_d, soma_dd, soma_pm, soma_dp) in minutos.items():
+            if minuto < segundo_maximo - duracao:
+                continue
+            c = minuto - segundo_maximo
+            n += quantos
+            soma_t += c * quantos + soma_d
+            soma_p += soma_pm
+            soma_tt += c * c * quantos + 2 * c * soma_d + soma_dd
+            soma_tp += c * soma_pm + soma_dp
+        somas[nome] = {"n": n, "soma_t": soma_t, "soma_p": soma_p, "soma_tt": soma_tt, "soma_tp": soma_tp}
+    return somas
+
+
+def _montar_checkpoint(parcial, estado, leitor, balde_origem, chave_origem, etag, tamanho):
+    return {
+        "versao": VERSAO_CHECKPOINT,
+        "configuracao": _configuracao(),
+        "origem": {"bucket": balde_origem, "key": chave_origem, "etag": etag, "tamanho": tamanho},
+        "offset": leitor.offset,
+        "cabecalho": parcial["cabecalho"],
+        "cauda": base64.b64encode(leitor.cauda).decode("ascii"),
+        "total_linhas": parcial["total_linhas"],
+        "colunas_ultima": parcial["colunas_ultima"],
+        "regressao": {
+            "n": parcial["n"],
+            "soma_y": parcial["soma_y"],
+            "soma_xy": parcial["soma_xy"],
+            "primeira": parcial["primeira"],
+            "ultima": parcial["ultima"],
+        },
+        "anomalias": _estado_detector(parcial["detector"]),
+        "data_maxima": _microssegundos(estado["data_maxima"]),
+        "dias": {
+            dia.strftime("%Y-%m-%d"): {nome: e.para_dict() for nome, e in esbocos.items()}
+            for dia, esbocos in sorted(estado["dias"].items())
+        },
+        "minutos": [[minuto] + somas for minuto, somas in sorted(estado["minutos"].items())],
+        "serie": [[_microssegundos(data)] + valores for data, valores in estado["serie"]],
+        "horas": [[_microssegundos(hora), balde] for hora, balde in sorted(estado["horas"].items())],
+    }
+
+
+def _para_parcial(checkpoint):
+    # só as somas: as linhas já estão nos resumos do estado
+    parcial = agregacao.novo_parcial(checkpoint["cabecalho"])
+    parcial["total_linhas"] = checkpoint["total_linhas"]
+    parcial["colunas_ultima"] = checkpoint["colunas_ultima"]
+    parcial.update(checkpoint["regressao"])
+    parcial["detector"] = _para_detector(checkpoint["anomalias"])
+    return parcial
+
+
+def _para_estado(checkpoint):
+    return {
+        "data_maxima": _data(checkpoint["data_maxima"]),
+        "dias": {
+            datetime.strptime(dia, "%Y-%m-%d").date(): {
+                nome: quantis.EsbocoQuantis.de_dict(e) for nome, e in esbocos.items()
+            }
+            for dia, esbocos in checkpoint["dias"].items()
+        },
+        "minutos": {linha[0]: linha[1:] for linha in checkpoint["minutos"]},
+        "serie": [(_data(linha[0]), linha[1:]) for linha in checkpoint["serie"]],
+        "horas": {_data(hora): balde for hora, balde in checkpoint["horas"]},
+    }
+
+
+def _microssegundos(data):
+    return None if data is None else (data - EPOCA) // UM_MICROSSEGUNDO
+
+
+def _data(microssegundos):
+    return None if microssegundos is None else EPOCA + timedelta(microseconds=microssegundos)
+
+
+def _estado_detector(detector):
+    # o detector continua de onde parou: médias/variâncias e as maiores
+    # anomalias até aqui
+    if detector is None:
+        return None
+    return {
+        "configuracao": anomalias.configuracao(),
+        # cópia: a linha sem \n do fim ainda passa pelo detector depois daqui
+        "n": detector.n,
+        "estados": {nome: list(estado) for nome, estado in detector.estados.items()},
+        "total": detector.total,
+        "ordem": detector.ordem,
+        "maiores": [
+            [abs_z, ordem, _microssegundos(data), nome, valor, z]
+            for abs_z, ordem, data, nome, valor, z in detector.maiores
+        ],
+    }
+
+
+def _para_detector(estado):
+    # checkpoint de outra configuração (ou com o detector desligado) não
+    # serve: o detector recomeça a partir das linhas novas
+    detector = anomalias.novo()
+    if detector is None or estado is None or estado["configuracao"] != anomalias.configuracao():
+        return detector
+    detector.n = estado["n"]
+    detector.estados = estado["estados"]
+    detector.total = estado["total"]
+    detector.ordem = estado["ordem"]
+    detector.maiores = [
+        (abs_z, ordem, _data(microssegundos), nome, valor, z)
+        for abs_z, ordem, microssegundos, nome, valor, z in estado["maiores"]
+    ]
+    return detector
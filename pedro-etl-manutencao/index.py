@@ -1,252 +1,704 @@
+import time
+
+# marca o começo do init (cold start) pra medir quanto ele custou
+_INICIO_INIT = time.perf_counter()
+
 import json
-import math
 import os
-from statistics import median
-from datetime import datetime, timedelta
-from collections import defaultdict
-# pip install boto3
-import boto3
-
-cliente_s3 = boto3.client("s3")
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+import agregacao
+import anomalias
+import cache
+import colunar
+import frota
+import historico
+import incremental
+import manifesto
+import mapa
+import metricas
+import mudancas
+import paralelo
+import perfil
+import piramide
+import quantis
+import regressao
+import saida
+import serie
+from leitura import iterar_linhas_dados, limpar_float as _limpar_float
+from risco import (
+    calcular_modelo_heuristico as _calcular_modelo_heuristico,
+    montar_ui_state as _montar_ui_state,
+)
+
+# o cliente do S3 (e o próprio boto3, que é o import mais caro) só é criado
+# quando alguma invocação precisa dele. backfill e benchmarks podem trocar
+# por outro cliente antes disso
+cliente_s3 = None
+_trava_cliente = threading.Lock()
 
 # bucket de destino -> onde vão os JSONs que o Node vai ler
 BALDE_DESTINO = os.environ.get("DEST_BUCKET", "vizor-client")
 
+# quantos arquivos processamos ao mesmo tempo quando o evento chega em lote
+MAX_WORKERS = int(os.environ.get("ETL_MAX_WORKERS", "8"))
 
-def lambda_handler(evento, contexto):
-    try:
-        #pega as infos básicas do evento S3 (quem chamou o Lambda)
-        registro = evento["Records"][0]
-        balde_origem = registro["s3"]["bucket"]["name"]
-        #nome do arquivo que chegou no trusted
-        chave_origem = registro["s3"]["object"]["key"].replace("+", " ")
+# motor das agregações: auto (numpy se tiver), numpy ou python
+MOTOR = os.environ.get("ETL_MOTOR", "auto").lower()
 
-        print(f"[ETL] Arquivo recebido: s3://{balde_origem}/{chave_origem}")
+# modo incremental: checkpoint por máquina e GET só dos bytes novos do CSV
+INCREMENTAL = os.environ.get("ETL_INCREMENTAL", "0").lower() in ("1", "true", "sim")
 
-        #esperamos algo do tipo: empresa/maquina/data/arquivo.csv
-        partes_caminho = chave_origem.split("/")
-        if len(partes_caminho) < 4:
-            print("Arquivo fora da pasta esperada (empresa/maquina/data/...).")
-            return {"statusCode": 200, "body": "Ignorado"}
+# esboços de quantis por dia: a mediana semanal junta os 7 dias de partições
+# (com 0 ela volta a ser só do arquivo atual)
+QUANTIS = os.environ.get("ETL_QUANTIS", "1").lower() in ("1", "true", "sim")
 
-        empresa = partes_caminho[0]     
-        maquina_id = partes_caminho[1]  
+# resumo da frota por empresa e dia, atualizado a cada máquina processada
+FROTA = os.environ.get("ETL_FROTA", "1").lower() in ("1", "true", "sim")
 
-        # lê o CSV do bucket trusted
-        resposta = cliente_s3.get_object(Bucket=balde_origem, Key=chave_origem)
-        conteudo_csv = resposta["Body"].read().decode("utf-8")
+# índice do mapa por tile (geohash) por empresa e dia. cada tile lista as
+# máquinas com o mesmo resumo da frota (frota.resumo_maquina), então só
+# liga junto com ela
+MAPA = FROTA and os.environ.get("ETL_MAPA", "1").lower() in ("1", "true", "sim")
 
-        linhas = [l for l in conteudo_csv.strip().split("\n") if l.strip()]
-        if len(linhas) < 2:
-            print("CSV sem dados (só cabeçalho?).")
-            return {"statusCode": 200, "body": "CSV vazio"}
+# histórico de 7 dias com as partições dos dias anteriores da máquina
+# (baixadas em paralelo, até ETL_HISTORICO_WORKERS por arquivo do evento)
+HISTORICO = os.environ.get("ETL_HISTORICO", "1").lower() in ("1", "true", "sim")
 
-        cabecalho = linhas[0]     
-        linhas_dados = linhas[1:]
+# conexões mantidas abertas pro pool de threads (cada thread faz GETs e PUTs,
+# e cada uma delas ainda pode buscar as partições do histórico)
+CONEXOES_S3 = int(os.environ.get(
+    "ETL_CONEXOES_S3",
+    str(max(10, 2 * MAX_WORKERS, MAX_WORKERS * historico.WORKERS if HISTORICO else 0)),
+))
 
-        # listas gerais para montar medianas, regressão e histórico
-        lista_datas = []
-        lista_cpu = []
-        lista_ram = []
-        lista_disco = []
-        lista_temp = []
-        lista_prob_falha_hist = []
+# manifesto por CSV de origem: o que não mudou desde a última saída nem é
+# baixado. ETL_FORCAR=1 (ou "forcar": true no evento) reprocessa mesmo assim
+MANIFESTO = os.environ.get("ETL_MANIFESTO", "1").lower() in ("1", "true", "sim")
+FORCAR = os.environ.get("ETL_FORCAR", "0").lower() in ("1", "true", "sim")
 
-        formato_data = "%Y-%m-%d %H:%M:%S"
+# agregados dos CSVs já vistos por esse container (ETL_CACHE_MB)
+CACHE = cache.CacheAgregados(cache.LIMITE_BYTES)
 
-        # varre cada linha do CSV e extrai os campos que importam
-        for linha in linhas_dados:
-            colunas = [c.strip() for c in linha.split(",")]
-            if len(colunas) < 11:
-                continue
+# imports e configuração acima = init do container
+DURACAO_INIT_MS = (time.perf_counter() - _INICIO_INIT) * 1000
+_primeira_invocacao = True
 
-            texto_timestamp = colunas[1]
 
-            try:
-                texto_timestamp_limpo = texto_timestamp.split(".")[0]
-                data_linha = datetime.strptime(texto_timestamp_limpo, formato_data)
-            except Exception:
-                # se não der pra converter a data, a gente ignora essa linha
-                continue
-
-            cpu_linha = _limpar_float(colunas[2])
-            ram_linha = _limpar_float(colunas[3])
-            disco_linha = _limpar_float(colunas[4])
-            temp_linha = _limpar_float(colunas[6])
-
-            lista_datas.append(data_linha)
-            lista_cpu.append(cpu_linha)
-            lista_ram.append(ram_linha)
-            lista_disco.append(disco_linha)
-            lista_temp.append(temp_linha)
-
-            # probabilidade histórica de falha 
-            prob_hist = _calcular_prob_falha_simples(temp=temp_linha, disco=disco_linha)
-            lista_prob_falha_hist.append(prob_hist)
-
-        if not lista_datas:
-            print("Nenhuma linha com timestamp válido.")
-            return {"statusCode": 200, "body": "Sem timestamps válidos"}
-
-        # data mais recente do CSV (vamos usar isso para chavear por dia)
-        data_maxima = max(lista_datas)
-
-        # pega a última linha capturada (estado mais recente da máquina)
-        ultima_linha = linhas_dados[-1]
-        colunas_ultima = [c.strip() for c in ultima_linha.split(",")]
-
-        cpu_atual = _limpar_float(colunas_ultima[2])
-        ram_atual = _limpar_float(colunas_ultima[3])
-        disco_atual = _limpar_float(colunas_ultima[4])
-        uptime_atual = colunas_ultima[5]
-        temp_atual = _limpar_float(colunas_ultima[6])
-        timestamp_atual = colunas_ultima[1]
-        situacao_atual = colunas_ultima[8] if len(colunas_ultima) > 8 else "Desconhecido"
-        latitude = _limpar_float(colunas_ultima[9]) if len(colunas_ultima) > 9 else 0.0
-        longitude = _limpar_float(colunas_ultima[10]) if len(colunas_ultima) > 10 else 0.0
-
-        # status resumido pro mapa e cards
-        situacao_lower = (situacao_atual or "").lower()
-        if situacao_lower == "critico":
-            status_resumido = "critico"
-        elif situacao_lower == "alerta":
-            status_resumido = "alerta"
-        else:
-            status_resumido = "ok"
-
-        # pacotinho com as métricas atuais 
-        metricas_atuais = {
-            "cpu": cpu_atual,
-            "ram": ram_atual,
-            "disk": disco_atual,
-            "uptime": uptime_atual,
-            "temp": temp_atual,
-            "timestamp": timestamp_atual,
-            "situacao": situacao_atual,
-            "latitude": latitude,
-            "longitude": longitude,
-        }
+def lambda_handler(evento, contexto):
+    # ETL_PERFIL=1 ou "perfil": true no evento: cProfile + tracemalloc nessa
+    # invocação, com os arquivos em ETL_PERFIL_DESTINO
+    if perfil.pedido(evento):
+        # sem o pool de threads: o cProfile só enxerga a thread que o ligou
+        return perfil.executar(lambda e, c: _executar(e, c, sequencial=True), evento, contexto, _cliente)
+    return _executar(evento, contexto)
+
+
+def _executar(evento, contexto, sequencial=False):
+    global _primeira_invocacao
+    cold_start = _primeira_invocacao
+    if _primeira_invocacao:
+        _primeira_invocacao = False
+        print(f"[ETL] Cold start: init do módulo levou {DURACAO_INIT_MS:.1f} ms")
+
+    inicio = time.perf_counter()
+    medicao = metricas.nova()
+    resposta = _tratar_evento(evento, medicao, sequencial)
+
+    # um registro de métricas (EMF) por invocação, somando todos os arquivos
+    medicao.emitir(
+        (time.perf_counter() - inicio) * 1000,
+        statusCode=resposta["statusCode"],
+        cold_start=cold_start,
+        init_ms=round(DURACAO_INIT_MS, 3) if cold_start else 0.0,
+        incremental=INCREMENTAL,
+        cache=CACHE.resumo(),
+    )
+    return resposta
+
+
+def _tratar_evento(evento, medicao, sequencial):
 
-        # medianas do dia e da última semana (pras KPIs)
-        data_ref = data_maxima.date() 
+    try:
+        registros = _extrair_registros(evento)
+    except Exception as erro:
+        print("Erro na ETL Python:", erro)
+        return {"statusCode": 500, "body": str(erro)}
 
-        medianas_dia = {
-            "cpu": _mediana_ultimo_dia(lista_cpu, lista_datas, data_ref),
-            "ram": _mediana_ultimo_dia(lista_ram, lista_datas, data_ref),
-            "disco": _mediana_ultimo_dia(lista_disco, lista_datas, data_ref),
-            "temp": _mediana_ultimo_dia(lista_temp, lista_datas, data_ref),
-        }
+    if not registros:
+        print("Evento sem Records S3. Ignorando.")
+        return {"statusCode": 400, "body": "Sem Records"}
+
+    # vários arquivos da mesma máquina e do mesmo dia no lote viram um
+    # processamento só (o mais recente): os dois gravariam o mesmo JSON
+    grupos = _agrupar_por_saida(registros)
+    print(f"[ETL] {len(registros)} registro(s) recebidos, {len(grupos)} saída(s) distintas")
+
+    forcar = FORCAR or str(evento.get("forcar", "")).lower() in ("1", "true", "sim")
+    if forcar:
+        print("[ETL] Forçando o reprocessamento (manifesto ignorado)")
+
+    # uma saída só roda na thread principal, sem pool: é o caso em que o
+    # CSV grande pode ser lido em processos (paralelo.usar)
+    workers = max(1, min(MAX_WORKERS, len(grupos)))
+    sequencial = sequencial or workers == 1
+    with (_ExecutorLocal() if sequencial else ThreadPoolExecutor(max_workers=workers)) as executor:
+        # cada arquivo mede numa Medicao própria (uma por thread) e no fim
+        # tudo é somado na da invocação
+        futuros = []
+        for grupo in grupos:
+            medicao_arquivo = metricas.nova()
+            juntados = list(dict.fromkeys(r["key"] for r in grupo[:-1] if r["key"] != grupo[-1]["key"]))
+            futuro = executor.submit(
+                _processar_objeto, grupo[-1]["bucket"], grupo[-1]["key"], medicao_arquivo, forcar, juntados
+            )
+            futuros.append((grupo, medicao_arquivo, futuro))
+
+        resultados = []
+        falhas = []
+        for grupo, medicao_arquivo, futuro in futuros:
+            try:
+                corpo = futuro.result()
+                ok = True
+            except Exception as erro:
+                print(f"Erro na ETL Python ({grupo[-1]['key']}):", erro)
+                corpo = str(erro)
+                ok = False
+            medicao.juntar(medicao_arquivo)
+            medicao.somar("arquivos")
+            if not ok:
+                medicao.somar("falhas")
+
+            for registro in grupo:
+                resultados.append({
+                    "bucket": registro["bucket"],
+                    "key": registro["key"],
+                    "ok": ok,
+                    "body": corpo,
+                    "processado_como": grupo[-1]["key"],
+                })
+                if not ok and registro["id"] is not None and registro["id"] not in falhas:
+                    falhas.append(registro["id"])
+
+    total_falhas = sum(1 for r in resultados if not r["ok"])
+    if total_falhas == 0:
+        status = 200
+    elif total_falhas == len(resultados):
+        status = 500
+    else:
+        status = 207
 
-        inicio_semana = data_maxima - timedelta(days=7)
-        medianas_semanal = {
-            "cpu": _mediana_periodo(lista_cpu, lista_datas, inicio_semana),
-            "ram": _mediana_periodo(lista_ram, lista_datas, inicio_semana),
-            "disco": _mediana_periodo(lista_disco, lista_datas, inicio_semana),
-            "temp": _mediana_periodo(lista_temp, lista_datas, inicio_semana),
-        }
+    # batchItemFailures é o formato de resposta parcial do SQS: só as
+    # mensagens que falharam voltam pra fila
+    return {
+        "statusCode": status,
+        "body": resultados[0]["body"] if len(resultados) == 1 else (
+            f"{len(resultados) - total_falhas}/{len(resultados)} processados"
+        ),
+        "resultados": resultados,
+        "batchItemFailures": [{"itemIdentifier": f} for f in falhas],
+    }
 
-        bloco_medianas = {
-            "dia": medianas_dia,
-            "semanal": medianas_semanal
-        }
 
-        # regressão da probabilidade de falha (tendência ao longo do tempo)
-        regressao_risco = _calcular_regressao_probabilidade(lista_prob_falha_hist)
-
-        # bloco de UI e modelo heurístico de risco
-        estado_ui = _montar_ui_state(metricas_atuais, maquina_id)
-        modelo_heuristico = _calcular_modelo_heuristico(metricas_atuais)
-
-        # histórico real dos últimos 7 dias 
-        historico_7d = _montar_historico_7d(
-            lista_datas,
-            lista_cpu,
-            lista_ram,
-            lista_disco,
-            lista_temp,
-            lista_prob_falha_hist,
-            inicio_semana,
-        )
+class _ExecutorLocal:
+    # mesma interface do ThreadPoolExecutor, mas roda na hora, na thread atual
+    def __enter__(self):
+        return self
 
-        # monta o JSON que o Node vai consumir
-        dashboard_json = {
-            "machine_id": maquina_id,         
-            "company": empresa,
-            "status": status_resumido,       
-            "last_update": metricas_atuais["timestamp"],
-            "raw_metrics": {
-                "cpu": f"{metricas_atuais['cpu']:.1f}%",
-                "ram": f"{metricas_atuais['ram']:.1f}%",
-                "disco": f"{metricas_atuais['disk']:.1f}%",
-                "temp": f"{metricas_atuais['temp']:.1f}°C",
-                "uptime": metricas_atuais["uptime"],
-                "latitude": metricas_atuais["latitude"],
-                "longitude": metricas_atuais["longitude"],
-            },
-            "ui": estado_ui,
-            "risk_model": modelo_heuristico,
-            "medianas": bloco_medianas,
-            "regressao_risco": regressao_risco,
-            "historico_7d": historico_7d,
-        }
+    def __exit__(self, *erro):
+        return False
 
-        # define a chave de destino no bucket client
-        data_str = data_maxima.strftime("%Y-%m-%d")
-        chave_destino = f"pedro-client/{empresa}/{data_str}/{maquina_id}.json"
+    def submit(self, funcao, *args):
+        futuro = Future()
+        try:
+            futuro.set_result(funcao(*args))
+        except Exception as erro:
+            futuro.set_exception(erro)
+        return futuro
 
-        cliente_s3.put_object(
-            Bucket=BALDE_DESTINO,
-            Key=chave_destino,
-            Body=json.dumps(dashboard_json, ensure_ascii=False, indent=2),
-            ContentType="application/json",
-        )
 
-        print(f"JSON de Dashboard salvo em: s3://{BALDE_DESTINO}/{chave_destino}")
-        return {"statusCode": 200, "body": "Sucesso"}
+def _extrair_registros(evento):
+    # aceita notificação direta do S3 ou SQS com a notificação do S3 no body
+    registros = []
+    for registro in (evento or {}).get("Records") or []:
+        if "s3" in registro:
+            registros.append(_registro_s3(registro, None))
+            continue
 
-    except Exception as erro:
-        print("Erro na ETL Python:", erro)
-        return {"statusCode": 500, "body": str(erro)}
+        if "body" in registro:
+            id_mensagem = registro.get("messageId")
+            corpo = registro["body"]
+            if isinstance(corpo, str):
+                try:
+                    corpo = json.loads(corpo)
+                except ValueError:
+                    # mensagem que não é JSON nunca vai dar certo, não volta pra fila
+                    print(f"Mensagem {id_mensagem} sem JSON válido. Ignorando.")
+                    continue
+            for interno in corpo.get("Records") or []:
+                if "s3" in interno:
+                    registros.append(_registro_s3(interno, id_mensagem))
 
+    return registros
 
-# funções auxiliares
-def _limpar_float(valor):
-    if valor is None or valor == "":
-        return 0.0
-    try:
-        return float(str(valor).replace(",", ".").strip())
-    except ValueError:
-        return 0.0
+
+def _registro_s3(registro, id_mensagem):
+    return {
+        "id": id_mensagem,
+        "bucket": registro["s3"]["bucket"]["name"],
+        "key": registro["s3"]["object"]["key"].replace("+", " "),
+        "event_time": registro.get("eventTime", ""),
+    }
 
 
-def _mediana_ultimo_dia(lista_valores, lista_datas, data_ref):
-    valores = [
-        v for v, d in zip(lista_valores, lista_datas)
-        if d.date() == data_ref
+def _agrupar_por_saida(registros):
+    # a saída é pedro-client/{empresa}/{data}/{maquina}.json, então só se
+    # juntam registros da mesma empresa, máquina e partição de dia. dias
+    # diferentes da mesma máquina são saídas diferentes e todos rodam
+    grupos = {}
+    for registro in registros:
+        partes = registro["key"].split("/")
+        if len(partes) >= 4:
+            chave_grupo = (registro["bucket"], partes[0], partes[1], partes[2])
+        else:
+            # fora do layout esperado, processa sozinho (vai ser ignorado)
+            chave_grupo = (registro["bucket"], registro["key"])
+        grupos.setdefault(chave_grupo, []).append(registro)
+
+    # o último de cada grupo é o mais novo (eventTime, depois a chave que
+    # carrega a data da partição)
+    return [
+        sorted(grupo, key=lambda r: (r["event_time"], r["key"]))
+        for grupo in grupos.values()
     ]
-    if not valores:
-        return 0.0
-    return float(median(valores))
 
 
-def _mediana_periodo(lista_valores, lista_datas, inicio_periodo):
-    valores = [
-        v for v, d in zip(lista_valores, lista_datas)
-        if d >= inicio_periodo
-    ]
-    if not valores:
-        return 0.0
-    return float(median(valores))
+def _processar_objeto(balde_origem, chave_origem, medicao=metricas.NULA, forcar=False, juntados=()):
+    # medicao junta tempos por etapa e contagens desse arquivo (S3 incluso,
+    # pelo cliente embrulhado). juntados: CSVs mais antigos da mesma
+    # partição que vieram no mesmo lote e não rodam sozinhos (os esboços
+    # e o manifesto deles saem daqui)
+    print(f"[ETL] Arquivo recebido: s3://{balde_origem}/{chave_origem}")
+    cliente = metricas.medir_cliente(_cliente(), medicao)
+
+    #esperamos algo do tipo: empresa/maquina/data/arquivo.csv
+    partes_caminho = chave_origem.split("/")
+    if len(partes_caminho) < 4:
+        print("Arquivo fora da pasta esperada (empresa/maquina/data/...).")
+        return "Ignorado"
+
+    empresa = partes_caminho[0]
+    maquina_id = partes_caminho[1]
+
+    if not MANIFESTO:
+        return _gerar_saida(cliente, balde_origem, chave_origem, empresa, maquina_id, medicao, juntados=juntados)
+
+    # HEAD do CSV + manifesto: mesma origem e mesma configuração, a saída
+    # que está no bucket já é a certa (nada de GET nem PUT)
+    configuracao = _configuracao_saida()
+    with medicao.etapa("manifesto"):
+        registro, origem = manifesto.conferir(cliente, BALDE_DESTINO, balde_origem, chave_origem, configuracao)
+        if registro is not None and not forcar:
+            if _entradas_mudaram(cliente, balde_origem, empresa, maquina_id, registro):
+                print(f"[ETL] {chave_origem} não mudou, mas outro CSV da janela de 7 dias mudou.")
+                registro = None
+    if registro is not None and not forcar:
+        print(f"[ETL] {chave_origem} não mudou desde a última saída (ETag {origem['etag']}), pulando.")
+        medicao.somar("arquivos_inalterados")
+        return "Inalterado"
+
+    # HEAD dos juntados antes do GET, igual ao do evento
+    with medicao.etapa("manifesto"):
+        origens_juntados = [manifesto.ler_origem(cliente, balde_origem, chave) for chave in juntados]
+
+    entradas = {}
+    resultado = _gerar_saida(cliente, balde_origem, chave_origem, empresa, maquina_id, medicao, entradas, juntados)
+    with medicao.etapa("manifesto"):
+        manifesto.registrar(cliente, BALDE_DESTINO, origem, configuracao, resultado, entradas)
+        for origem_juntado in origens_juntados:
+            manifesto.registrar(
+                cliente, BALDE_DESTINO, origem_juntado, configuracao, resultado,
+                _entradas_juntado(entradas, origem, origem_juntado),
+            )
+    return resultado
+
+
+def _entradas_juntado(entradas, origem, origem_juntado):
+    # a janela vista do CSV juntado: a mesma listagem, sem ele e com o do
+    # evento (que a listagem dele traria)
+    if not entradas:
+        return entradas
+    objetos = {chave: valor for chave, valor in entradas["objetos"].items() if chave != origem_juntado["key"]}
+    objetos[origem["key"]] = [origem["etag"], origem["tamanho"]]
+    return {"data_maxima": entradas["data_maxima"], "objetos": objetos}
+
+
+def _entradas_mudaram(cliente, balde_origem, empresa, maquina_id, registro):
+    # com histórico ou quantis a saída também depende dos outros CSVs da
+    # máquina na janela de 7 dias: uma listagem da mesma janela, e qualquer
+    # ETag diferente (ou CSV novo ou sumido) refaz a saída
+    entradas = registro.get("entradas")
+    if not entradas:
+        return False
+    atuais = historico.listar_objetos(
+        cliente,
+        balde_origem,
+        empresa,
+        maquina_id,
+        datetime.fromisoformat(entradas["data_maxima"]),
+        registro["origem"]["key"],
+    )
+    return atuais != entradas["objetos"]
+
+
+def _agregar_objeto(balde_origem, chave_origem, medicao=metricas.NULA):
+    # agregado de um CSV inteiro (o do evento ou um do histórico)
+    cliente = metricas.medir_cliente(_cliente(), medicao)
+
+    # GET condicional: CSV que não mudou desde a última vez nesse
+    # container volta do cache (304, sem corpo nem parse)
+    agregado, resposta = CACHE.buscar(cliente, balde_origem, chave_origem, medicao)
+    if agregado is not None:
+        return agregado
+
+    if paralelo.usar(resposta.get("ContentLength") or 0):
+        # CSV grande: faixas do arquivo lidas em processos separados
+        agregado = paralelo.agregar(
+            resposta, balde_origem, chave_origem, _cliente_processo, _usar_motor_colunar(), medicao
+        )
+        CACHE.guardar(balde_origem, chave_origem, resposta.get("ETag"), agregado)
+        return agregado
+
+    # lê o CSV do bucket trusted em streaming: o texto vai passando linha a
+    # linha e só ficam guardados os números que as medianas precisam
+    with medicao.etapa("linhas"):
+        cabecalho, linhas_dados = iterar_linhas_dados(resposta["Body"])
+
+    # motor colunar (numpy) quando disponível, senão python puro. os dois
+    # devolvem o mesmo dicionário e o JSON final sai idêntico
+    if _usar_motor_colunar():
+        agregado = colunar.agregar(cabecalho, linhas_dados, medicao)
+    else:
+        agregado = agregacao.agregar_linhas(cabecalho, linhas_dados, medicao)
+    CACHE.guardar(balde_origem, chave_origem, resposta.get("ETag"), agregado)
+    return agregado
+
+
+def _configuracao_saida():
+    # o que muda o conteúdo da saída além do CSV (o motor não muda: os
+    # dois dão o mesmo JSON)
+    return {
+        "destino": BALDE_DESTINO,
+        "quantis": QUANTIS,
+        "historico": HISTORICO,
+        "serie": [serie.PONTOS, serie.JANELA_SEGUNDOS],
+        "anomalias": anomalias.configuracao(),
+        "frota": FROTA,
+        "mapa": [MAPA, mapa.PRECISAO],
+        "piramide": [piramide.ATIVO, piramide.K],
+        "mudancas": mudancas.ATIVO,
+        "json": saida.FORMATO,
+        "compressao": saida.COMPRESSAO,
+    }
 
 
-def _calcular_prob_falha_simples(temp, disco):
-    pontuacao_hw = (temp * 0.7) + (disco * 0.3)
-    prob_falha = min(99, math.floor(pontuacao_hw))
-    return float(prob_falha)
+def _gerar_saida(cliente, balde_origem, chave_origem, empresa, maquina_id, medicao, entradas=None, juntados=()):
+    # entradas (se vier): recebe os outros CSVs da janela que a saída usou,
+    # pro manifesto. juntados: os do mesmo lote e partição que não rodam
+    # sozinhos, pros esboços
+    if INCREMENTAL:
+        # só os bytes novos do CSV, somados ao checkpoint dele
+        agregado = incremental.agregar(
+            cliente,
+            balde_origem,
+            chave_origem,
+            BALDE_DESTINO,
+            incremental.chave_checkpoint(chave_origem),
+            medicao,
+        )
+    else:
+        agregado = _agregar_objeto(balde_origem, chave_origem, medicao)
+
+    if agregado["total_linhas"] == 0:
+        print("CSV sem dados (só cabeçalho?).")
+        return "CSV vazio"
+
+    if agregado["data_maxima"] is None:
+        print("Nenhuma linha com timestamp válido.")
+        return "Sem timestamps válidos"
+
+    if HISTORICO or (QUANTIS and entradas is not None):
+        # os outros arquivos da máquina nos 7 dias até a data_maxima: o
+        # histórico lê todos e a semana dos quantis sai dos esboços deles
+        with medicao.etapa("historico"):
+            objetos_janela = historico.listar_objetos(
+                cliente, balde_origem, empresa, maquina_id, agregado["data_maxima"], chave_origem
+            )
+        if entradas is not None:
+            entradas["data_maxima"] = agregado["data_maxima"].isoformat()
+            entradas["objetos"] = objetos_janela
+
+    # CSVs com as linhas em memória (o do evento e os do histórico)
+    em_memoria = {chave_origem}
+    anteriores = {}
+    if HISTORICO:
+        # todos de uma vez: a latência fica perto da do GET mais lento
+        with medicao.etapa("historico"):
+            anteriores = historico.carregar(balde_origem, list(objetos_janela), _agregar_objeto, medicao)
+            if anteriores:
+                agregado = historico.juntar(agregado, list(anteriores.values()), _usar_motor_colunar())
+                em_memoria.update(anteriores)
+        if anteriores:
+            print(f"[ETL] Histórico de 7 dias com {len(anteriores)} arquivo(s) de outras partições")
+
+    # os juntados precisam dos próprios esboços: o histórico já leu (são da
+    # mesma partição), sem ele é um GET de cada
+    lidos_juntados = {}
+    if QUANTIS and juntados:
+        lidos_juntados = {chave: anteriores[chave] for chave in juntados if chave in anteriores}
+        faltando = [chave for chave in juntados if chave not in lidos_juntados]
+        if faltando:
+            with medicao.etapa("historico"):
+                lidos_juntados.update(historico.carregar(balde_origem, faltando, _agregar_objeto, medicao))
+
+    # data mais recente do CSV (vamos usar isso para chavear por dia)
+    data_maxima = agregado["data_maxima"]
+
+    # métricas atuais vêm da última linha capturada, nas posições que o
+    # cabeçalho indicou
+    colunas_ultima = agregado["colunas_ultima"]
+    posicoes = agregado["posicoes"]
+    cpu_atual = _limpar_float(colunas_ultima[posicoes["cpu"]])
+    ram_atual = _limpar_float(colunas_ultima[posicoes["ram"]])
+    disco_atual = _limpar_float(colunas_ultima[posicoes["disco"]])
+    uptime_atual = _campo(colunas_ultima, posicoes.get("uptime"), "")
+    temp_atual = _limpar_float(colunas_ultima[posicoes["temp"]])
+    timestamp_atual = colunas_ultima[posicoes["timestamp"]]
+    situacao_atual = _campo(colunas_ultima, posicoes.get("situacao"), "Desconhecido")
+    latitude = _limpar_float(_campo(colunas_ultima, posicoes.get("latitude"), 0.0))
+    longitude = _limpar_float(_campo(colunas_ultima, posicoes.get("longitude"), 0.0))
+
+    # status resumido pro mapa e cards
+    situacao_lower = (situacao_atual or "").lower()
+    if situacao_lower == "critico":
+        status_resumido = "critico"
+    elif situacao_lower == "alerta":
+        status_resumido = "alerta"
+    else:
+        status_resumido = "ok"
+
+    # pacotinho com as métricas atuais 
+    metricas_atuais = {
+        "cpu": cpu_atual,
+        "ram": ram_atual,
+        "disk": disco_atual,
+        "uptime": uptime_atual,
+        "temp": temp_atual,
+        "timestamp": timestamp_atual,
+        "situacao": situacao_atual,
+        "latitude": latitude,
+        "longitude": longitude,
+    }
 
+    # medianas do dia e da última semana (pras KPIs)
+    bloco_medianas = agregado["medianas"]
+    percentis_semanais = None
+    if QUANTIS:
+        # cada dia do arquivo vira um esboço no bucket; a semana sai da junção
+        # dos esboços de todas as partições dos últimos 7 dias
+        with medicao.etapa("quantis"):
+            salvos = quantis.salvar_dias(
+                cliente, BALDE_DESTINO, empresa, maquina_id, chave_origem, agregado["dias_semana"]
+            )
+            for chave, agregado_juntado in lidos_juntados.items():
+                salvos.update(quantis.salvar_dias(
+                    cliente, BALDE_DESTINO, empresa, maquina_id, chave, agregado_juntado["dias_semana"]
+                ))
+            percentis_semanais = quantis.semanais(
+                cliente, BALDE_DESTINO, empresa, maquina_id, data_maxima, salvos
+            )
+        origens = percentis_semanais.pop("origens")
+        if set(origens) - {quantis.nome_origem(chave) for chave in em_memoria}:
+            # os esboços pegam arquivos que não estão em memória: a semana
+            # vem deles. se não, a mediana das linhas já é a exata
+            bloco_medianas = {
+                "dia": bloco_medianas["dia"],
+                "semanal": {m: percentis_semanais[m]["p50"] for m in quantis.METRICAS},
+            }
+
+    # regressão da probabilidade de falha (tendência ao longo do tempo)
+    with medicao.etapa("regressao"):
+        regressao_risco = _regressao_de_somas(**agregado["somas_regressao"])
+        # a mesma tendência contra o tempo real, em janelas de 1h/24h/7d e
+        # com projeção em horas (é o que o agendamento de manutenção usa)
+        regressao_tempo = regressao.por_tempo(agregado["somas_tempo"])
+
+    # bloco de UI e modelo heurístico de risco
+    estado_ui = _montar_ui_state(metricas_atuais, maquina_id)
+    modelo_heuristico = _calcular_modelo_heuristico(metricas_atuais)
+
+    # histórico real dos últimos 7 dias 
+    historico_7d = agregado["historico_7d"]
+
+    # monta o JSON que o Node vai consumir
+    dashboard_json = {
+        "machine_id": maquina_id,         
+        "company": empresa,
+        "status": status_resumido,       
+        "last_update": metricas_atuais["timestamp"],
+        "raw_metrics": {
+            "cpu": f"{metricas_atuais['cpu']:.1f}%",
+            "ram": f"{metricas_atuais['ram']:.1f}%",
+            "disco": f"{metricas_atuais['disk']:.1f}%",
+            "temp": f"{metricas_atuais['temp']:.1f}°C",
+            "uptime": metricas_atuais["uptime"],
+            "latitude": metricas_atuais["latitude"],
+            "longitude": metricas_atuais["longitude"],
+        },
+        "ui": estado_ui,
+        "risk_model": modelo_heuristico,
+        "medianas": bloco_medianas,
+        "regressao_risco": regressao_risco,
+        "regressao_tempo": regressao_tempo,
+        "historico_7d": historico_7d,
+    }
+    if percentis_semanais is not None:
+        dashboard_json["percentis_semanais"] = percentis_semanais
+    if "anomalias" in agregado:
+        # picos do arquivo inteiro (EWMA/z-score por métrica), não só da última linha
+        dashboard_json["anomalias"] = agregado["anomalias"]
+    if "serie_detalhada" in agregado:
+        # ETL_SERIE_PONTOS: série das últimas horas pros gráficos intradiários
+        dashboard_json["serie_detalhada"] = agregado["serie_detalhada"]
+
+    # define a chave de destino no bucket client
+    data_str = data_maxima.strftime("%Y-%m-%d")
+    chave_destino = f"pedro-client/{empresa}/{data_str}/{maquina_id}.json"
+
+    # compacto por padrão; ETL_JSON=indentado volta o formato antigo (debug)
+    inicio_serializacao = time.perf_counter()
+    with medicao.etapa("serializacao"):
+        corpo_json, extras = saida.serializar(dashboard_json)
+    tempo_serializacao = (time.perf_counter() - inicio_serializacao) * 1000
+
+    cliente.put_object(
+        Bucket=BALDE_DESTINO,
+        Key=chave_destino,
+        Body=corpo_json,
+        **extras,
+    )
+
+    print(
+        f"JSON de Dashboard salvo em: s3://{BALDE_DESTINO}/{chave_destino} "
+        f"({len(corpo_json)} bytes, {saida.FORMATO}/{saida.COMPRESSAO}, {tempo_serializacao:.2f} ms)"
+    )
+
+    # daqui pra baixo é tudo derivado (frota, mapa, mudanças, pirâmide): o
+    # dashboard da máquina já está gravado, então uma falha só vai pro log
+    if FROTA:
+        # o objeto dessa máquina e depois o resumo da empresa refeito deles
+        _complementar(
+            "frota", medicao, frota.atualizar, cliente, BALDE_DESTINO, empresa, data_str, maquina_id, dashboard_json
+        )
+        if _complementar("frota", medicao, frota.compactar, cliente, BALDE_DESTINO, empresa, data_str):
+            print(f"Resumo da frota atualizado: s3://{BALDE_DESTINO}/{frota.chave_frota(empresa, data_str)}")
+
+    if MAPA:
+        # roda mesmo sem mudança na máquina: se uma execução caiu no meio, a
+        # próxima conserta (sem mudança é só um GET do registro dela)
+        tiles = _complementar(
+            "mapa", medicao, mapa.atualizar, cliente, BALDE_DESTINO, empresa, data_str, maquina_id,
+            frota.resumo_maquina(dashboard_json),
+        )
+        for tile in tiles or []:
+            print(f"Tile do mapa atualizado: s3://{BALDE_DESTINO}/{mapa.chave_tile(empresa, data_str, tile)}")
+
+    if mudancas.ATIVO:
+        # status/severidade contra o último visto da máquina: mudou, vira evento
+        evento = _complementar(
+            "mudancas", medicao, mudancas.registrar, cliente, BALDE_DESTINO, empresa, maquina_id, dashboard_json,
+            data_maxima,
+        )
+        if evento is not None:
+            print(
+                f"[ETL] Mudança de status: {evento['from']['status']} -> {evento['to']['status']} "
+                f"em s3://{BALDE_DESTINO}/{mudancas.chave_evento(evento)}"
+            )
+
+    if piramide.ATIVO:
+        # resumos por hora dos dias do arquivo; dia e semana saem da junção
+        dias_piramide = _complementar(
+            "piramide", medicao, piramide.atualizar, cliente, BALDE_DESTINO, empresa, maquina_id, chave_origem,
+            agregado["horas"],
+        )
+        if dias_piramide is not None:
+            print(f"[ETL] Pirâmide hora/dia/semana atualizada para {len(dias_piramide)} dia(s)")
+    return "Sucesso"
 
-def _calcular_regressao_probabilidade(lista_prob):
-    n = len(lista_prob)
+
+def _complementar(etapa, medicao, funcao, *args):
+    # atualização derivada depois do PUT do dashboard: falhou (disputa que
+    # não acabou nas tentativas, S3 fora), fica no log e na contagem e o
+    # registro segue como processado. devolve None quando falha
+    try:
+        with medicao.etapa(etapa):
+            return funcao(*args)
+    except Exception as erro:
+        print(f"[ETL] {etapa}: não deu pra atualizar ({erro}); o dashboard já foi gravado")
+        medicao.somar("complementos_falhos")
+        return None
+
+
+def _cliente():
+    global cliente_s3
+    if cliente_s3 is None:
+        with _trava_cliente:
+            if cliente_s3 is None:
+                inicio = time.perf_counter()
+                # pip install boto3
+                import boto3
+                from botocore.config import Config
+
+                cliente_s3 = boto3.client("s3", config=Config(
+                    max_pool_connections=CONEXOES_S3,
+                    tcp_keepalive=True,
+                    retries={"mode": "adaptive", "max_attempts": 5},
+                ))
+                print(f"[ETL] Cliente S3 criado em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    return cliente_s3
+
+
+def _cliente_processo():
+    # cliente de um processo filho do modo paralelo: depois do fork o pool
+    # de conexões e as credenciais do boto3 não podem ser divididos com o
+    # pai, então é uma sessão nova com a mesma configuração. o espelho
+    # (backfill e benchmarks) é só arquivo e pode ser usado direto
+    cliente = _cliente()
+    if getattr(cliente, "meta", None) is None:
+        return cliente
+    import boto3
+
+    return boto3.session.Session().client("s3", config=cliente.meta.config)
+
+
+def _campo(colunas, posicao, padrao):
+    if posicao is None or posicao >= len(colunas):
+        return padrao
+    return colunas[posicao]
+
+
+def _usar_motor_colunar():
+    # ETL_MOTOR=auto usa numpy se estiver instalado (layer), python força o puro
+    if MOTOR == "python":
+        return False
+    if MOTOR == "numpy" and not colunar.disponivel():
+        raise RuntimeError("ETL_MOTOR=numpy mas o numpy não está instalado")
+    return colunar.disponivel()
+
+
+def _regressao_de_somas(n, soma_x, soma_y, soma_x2, soma_xy, primeira, ultima):
     if n == 0:
         return {
             "inclinacao": 0.0,
@@ -257,7 +709,7 @@ def _calcular_regressao_probabilidade(lista_prob):
         }
 
     if n == 1:
-        prob = _limitar_prob(lista_prob[0])
+        prob = _limitar_prob(primeira)
         return {
             "inclinacao": 0.0,
             "intercepto": prob,
@@ -266,15 +718,9 @@ def _calcular_regressao_probabilidade(lista_prob):
             "prob_proxima_regressao": prob,
         }
 
-    lista_x = list(range(n))
-    soma_x = sum(lista_x)
-    soma_y = sum(lista_prob)
-    soma_x2 = sum(x * x for x in lista_x)
-    soma_xy = sum(x * y for x, y in zip(lista_x, lista_prob))
-
     denominador = (n * soma_x2) - (soma_x ** 2)
     if denominador == 0:
-        prob = _limitar_prob(lista_prob[-1])
+        prob = _limitar_prob(ultima)
         return {
             "inclinacao": 0.0,
             "intercepto": prob,
@@ -310,154 +756,3 @@ def _calcular_regressao_probabilidade(lista_prob):
 
 def _limitar_prob(valor):
     return max(0.0, min(99.0, float(valor)))
-
-
-def _montar_ui_state(metricas, maquina_id):
-    situacao = metricas["situacao"]
-    cpu = metricas["cpu"]
-    ram = metricas["ram"]
-    temp = metricas["temp"]
-
-    estado_ui = {
-        "severity": "INFO",
-        "color": "green",
-        "icon": "check-circle",
-        "title": "Operação Normal",
-        "message": "Monitoramento ativo. Parâmetros estáveis.",
-        "action": "Nenhuma ação necessária",
-    }
-
-    if situacao == "Critico" or cpu > 90 or ram > 90 or temp > 75:
-        estado_ui = {
-            "severity": "CRITICO",
-            "color": "red",
-            "icon": "alert-triangle",
-            "title": f"Falha Crítica em {maquina_id}",
-            "message": _determinar_mensagem_erro(metricas),
-            "action": "Intervenção Imediata / Reboot Forçado",
-        }
-    elif situacao == "Alerta" or cpu > 70 or ram > 70:
-        estado_ui = {
-            "severity": "ALERTA",
-            "color": "yellow",
-            "icon": "alert-circle",
-            "title": "Atenção Requerida",
-            "message": _determinar_mensagem_erro(metricas),
-            "action": "Verificar processos ou limpar cache",
-        }
-
-    return estado_ui
-
-
-def _determinar_mensagem_erro(metricas):
-    if metricas["cpu"] > 80:
-        return "Uso de processador extremamente alto."
-    if metricas["ram"] > 80:
-        return "Memória RAM no limite."
-    if metricas["disk"] > 90:
-        return "Disco quase cheio. Risco de travamento."
-    if metricas["temp"] > 75:
-        return "Temperatura está muito alta!."
-    return "Hardware com valores elevados."
-
-
-def _calcular_modelo_heuristico(metricas):
-    cpu = metricas["cpu"]
-    ram = metricas["ram"]
-    disco = metricas["disk"]
-    temp = metricas["temp"]
-    status = (metricas["situacao"] or "").lower()
-
-    pontuacao_hw = (temp * 0.7) + (disco * 0.3)
-    prob_falha = min(99, math.floor(pontuacao_hw))
-
-    pontuacao_sw = (cpu * 0.6) + (ram * 0.4)
-    nivel_estresse = math.floor(pontuacao_sw)
-
-    dias_manutencao = "45+ dias"
-    if status == "critico" or prob_falha > 80:
-        dias_manutencao = "IMEDIATA"
-    elif prob_falha > 60:
-        dias_manutencao = "7 dias"
-    elif prob_falha > 40:
-        dias_manutencao = "15 dias"
-
-    causa = "Desgaste Natural"
-    recomendacao = "Monitoramento Padrão"
-    nivel_risco = "low"
-
-    if status == "critico" or prob_falha > 80:
-        nivel_risco = "high"
-        if temp > 80:
-            causa = "Estresse Térmico (Perigo)"
-            recomendacao = "Verificar Arrefecimento"
-        else:
-            causa = "Falha de Hardware Iminente"
-            recomendacao = "Agendar Troca de Player"
-    elif status == "alerta" or prob_falha > 60:
-        nivel_risco = "medium"
-        causa = "Operação em Limite Térmico"
-        recomendacao = "Monitorar temperatura ambiente"
-    elif nivel_estresse > 85:
-        causa = "Sobrecarga de Software"
-        recomendacao = "Reiniciar ou Otimizar Conteúdo"
-
-    return {
-        "prob": float(prob_falha),
-        "stress": float(nivel_estresse),
-        "days": dias_manutencao,
-        "cause": causa,
-        "rec": recomendacao,
-        "riskLevel": nivel_risco,
-    }
-
-
-def _montar_historico_7d(lista_datas, lista_cpu, lista_ram, lista_disco,
-                        lista_temp, lista_prob, inicio_periodo):
-
-    por_dia_cpu = defaultdict(list)
-    por_dia_ram = defaultdict(list)
-    por_dia_disco = defaultdict(list)
-    por_dia_temp = defaultdict(list)
-    por_dia_prob = defaultdict(list)
-
-    for data, cpu, ram, disco, temp, prob in zip(
-        lista_datas, lista_cpu, lista_ram, lista_disco, lista_temp, lista_prob
-    ):
-        if data < inicio_periodo:
-            continue
-        dia = data.date()
-        por_dia_cpu[dia].append(cpu)
-        por_dia_ram[dia].append(ram)
-        por_dia_disco[dia].append(disco)
-        por_dia_temp[dia].append(temp)
-        por_dia_prob[dia].append(prob)
-
-    if not por_dia_cpu:
-        return {
-            "labels": [],
-            "cpu": [],
-            "ram": [],
-            "disco": [],
-            "temp": [],
-            "prob_falha": [],
-        }
-
-    dias_ordenados = sorted(por_dia_cpu.keys())
-    dias_ordenados = dias_ordenados[-7:]
-
-    labels = [d.strftime("%Y-%m-%d") for d in dias_ordenados]
-    hist_cpu = [float(median(por_dia_cpu[d])) for d in dias_ordenados]
-    hist_ram = [float(median(por_dia_ram[d])) for d in dias_ordenados]
-    hist_disco = [float(median(por_dia_disco[d])) for d in dias_ordenados]
-    hist_temp = [float(median(por_dia_temp[d])) for d in dias_ordenados]
-    hist_prob = [float(median(por_dia_prob[d])) for d in dias_ordenados]
-
-    return {
-        "labels": labels,
-        "cpu": hist_cpu,
-        "ram": hist_ram,
-        "disco": hist_disco,
-        "temp": hist_temp,
-        "prob_falha": hist_prob,
-    }
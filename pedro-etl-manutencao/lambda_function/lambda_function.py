@@ -1,209 +1,354 @@
+import time
+_inicio_init = time.perf_counter() # Pra medir o init (cold start)
+
 import json
 import math
 import os
-from statistics import median
+import threading
 from datetime import datetime, timedelta
 from collections import defaultdict
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 
-cliente_s3 = boto3.client("s3")
+# Cliente S3 (e o boto3) só são criados na primeira invocação que precisa
+cliente_s3 = None
+_trava_cliente = threading.Lock()
 BALDE_DESTINO = os.environ.get("DEST_BUCKET", "vizor-client")
+MAX_WORKERS = int(os.environ.get("ETL_MAX_WORKERS", "8"))
+
+DURACAO_INIT_MS = (time.perf_counter() - _inicio_init) * 1000
+_primeira_invocacao = True
 
 def lambda_handler(evento, contexto):
+    global _primeira_invocacao
     print("--- INICIO ETL PYTHON (PEDRO) ---")
+    if _primeira_invocacao:
+        _primeira_invocacao = False
+        print(f"Cold start: init levou {DURACAO_INIT_MS:.1f} ms")
     print(f"Evento recebido: {json.dumps(evento)}")
 
-    try:
-        # 1. Extração do Evento
-        if "Records" not in evento:
-            print("ERRO: Evento sem Records. Ignorando.")
-            return {"statusCode": 400, "body": "Sem Records"}
-            
-        registro = evento["Records"][0]
-        balde_origem = registro["s3"]["bucket"]["name"]
-        chave_original = registro["s3"]["object"]["key"].replace("+", " ")
+    # 1. Extração do Evento (S3 direto ou SQS com a notificação do S3 no body)
+    if "Records" not in evento:
+        print("ERRO: Evento sem Records. Ignorando.")
+        return {"statusCode": 400, "body": "Sem Records"}
 
-        print(f"Tentando baixar: s3://{balde_origem}/{chave_original}")
+    arquivos = []
+    for registro in evento["Records"]:
+        if "s3" in registro:
+            arquivos.append((None, registro))
+        elif "body" in registro:
+            try:
+                corpo = json.loads(registro["body"]) if isinstance(registro["body"], str) else registro["body"]
+            except ValueError:
+                print(f"AVISO: Mensagem {registro.get('messageId')} sem JSON válido. Ignorando.")
+                continue
+            for interno in corpo.get("Records") or []:
+                if "s3" in interno:
+                    arquivos.append((registro.get("messageId"), interno))
 
-        # 2. Leitura Inteligente do S3 (Tenta com e sem prefixo 'trusted/')
-        conteudo_csv = None
-        chave_final = chave_original
+    if not arquivos:
+        print("ERRO: Evento sem Records S3. Ignorando.")
+        return {"statusCode": 400, "body": "Sem Records"}
 
-        try:
-            # Tentativa 1: Chave exata do evento
-            resp = cliente_s3.get_object(Bucket=balde_origem, Key=chave_original)
-            conteudo_csv = resp["Body"].read().decode("utf-8")
-        except cliente_s3.exceptions.NoSuchKey:
-            print(f"AVISO: Arquivo não encontrado em '{chave_original}'.")
-            
-            # Tentativa 2: Remove 'trusted/' se existir, ou adiciona se não existir
-            if chave_original.startswith("trusted/"):
-                chave_final = chave_original.replace("trusted/", "", 1)
-            else:
-                chave_final = f"trusted/{chave_original}"
-            
-            print(f"Tentando alternativa: '{chave_final}'")
+    # Arquivos da mesma Empresa/Maquina/Data no lote viram um processamento só
+    # (gravariam o mesmo JSON): fica o mais novo (eventTime e depois a chave).
+    # Dias diferentes da mesma máquina são saídas diferentes e rodam todos
+    grupos = {}
+    for id_msg, registro in arquivos:
+        balde = registro["s3"]["bucket"]["name"]
+        chave = registro["s3"]["object"]["key"].replace("+", " ")
+        caminho = chave[len("trusted/"):] if chave.startswith("trusted/") else chave
+        partes = caminho.split("/")
+        grupo = (balde, partes[0], partes[1], partes[2]) if len(partes) >= 3 else (balde, chave)
+        grupos.setdefault(grupo, []).append((registro.get("eventTime", ""), chave, balde, id_msg))
+
+    # Pool limitado de threads (o client do boto3 é thread-safe)
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(grupos)))) as executor:
+        futuros = []
+        for itens in grupos.values():
+            itens.sort(key=lambda item: (item[0], item[1]))
+            _, chave, balde, _ = itens[-1]
+            futuros.append((itens, executor.submit(_processar_arquivo, balde, chave)))
+
+        resultados = []
+        falhas = []
+        for itens, futuro in futuros:
             try:
-                resp = cliente_s3.get_object(Bucket=balde_origem, Key=chave_final)
-                conteudo_csv = resp["Body"].read().decode("utf-8")
-                print("SUCESSO: Arquivo encontrado na tentativa alternativa.")
+                corpo, ok = futuro.result(), True
             except Exception as e:
-                print(f"ERRO FATAL: Arquivo não existe nem como '{chave_original}' nem '{chave_final}'.")
-                raise e
-
-        # 3. Processamento do Caminho (Para definir empresa e máquina)
-        # Removemos 'trusted/' apenas para parsing lógico
-        caminho_limpo = chave_final
-        if caminho_limpo.startswith("trusted/"):
-            caminho_limpo = caminho_limpo.replace("trusted/", "", 1)
-            
-        partes = caminho_limpo.split("/")
-        # Esperado: Empresa/Maquina/Data/arquivo.csv
-        if len(partes) < 2:
-            print("ERRO: Estrutura de pastas inválida.")
-            return {"statusCode": 400, "body": "Path invalido"}
-
-        empresa = partes[0]
-        maquina_id = partes[1]
-        print(f"Processando para Empresa: {empresa}, Máquina: {maquina_id}")
-
-        # 4. Parsing do CSV
-        linhas = [l for l in conteudo_csv.strip().split("\n") if l.strip()]
-        if len(linhas) < 2:
-            print("ERRO: CSV vazio ou apenas cabeçalho.")
-            return {"statusCode": 200, "body": "CSV vazio"}
-
-        linhas_dados = linhas[1:]
+                print(f"ERRO FATAL PYTHON ({itens[-1][1]}): {str(e)}")
+                corpo, ok = str(e), False
+
+            for _, chave, balde, id_msg in itens:
+                resultados.append({"bucket": balde, "key": chave, "ok": ok, "body": corpo})
+                if not ok and id_msg is not None and id_msg not in falhas:
+                    falhas.append(id_msg)
+
+    total_falhas = sum(1 for r in resultados if not r["ok"])
+    status = 200 if total_falhas == 0 else (500 if total_falhas == len(resultados) else 207)
+
+    # batchItemFailures = resposta parcial do SQS (só as mensagens com erro voltam pra fila)
+    return {
+        "statusCode": status,
+        "body": resultados[0]["body"] if len(resultados) == 1 else f"{len(resultados) - total_falhas}/{len(resultados)} processados",
+        "resultados": resultados,
+        "batchItemFailures": [{"itemIdentifier": f} for f in falhas],
+    }
+
+def _cliente():
+    global cliente_s3
+    if cliente_s3 is None:
+        with _trava_cliente:
+            if cliente_s3 is None:
+                inicio = time.perf_counter()
+                import boto3
+                from botocore.config import Config
+                cliente_s3 = boto3.client("s3", config=Config(
+                    max_pool_connections=max(10, 2 * MAX_WORKERS),
+                    tcp_keepalive=True,
+                    retries={"mode": "adaptive", "max_attempts": 5},
+                ))
+                print(f"Cliente S3 criado em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    return cliente_s3
+
+def _processar_arquivo(balde_origem, chave_original):
+    s3 = _cliente()
+    print(f"Tentando baixar: s3://{balde_origem}/{chave_original}")
+
+    # 2. Leitura Inteligente do S3 (Tenta com e sem prefixo 'trusted/')
+    conteudo_csv = None
+    chave_final = chave_original
+
+    try:
+        # Tentativa 1: Chave exata do evento
+        resp = s3.get_object(Bucket=balde_origem, Key=chave_original)
+        conteudo_csv = resp["Body"].read().decode("utf-8")
+    except s3.exceptions.NoSuchKey:
+        print(f"AVISO: Arquivo não encontrado em '{chave_original}'.")
         
-        # Listas para estatísticas
-        dados = defaultdict(list)
-        prob_falhas = []
-        timestamps_validos = []
-
-        # Formatos de data suportados (Brasileiro e ISO)
-        def parse_data(t):
-            t = t.split(".")[0].strip()
-            fmts = ["%d/%m/%Y %H:%M", "%d-%m-%Y %H:%M", "%Y-%m-%d %H:%M", "%d/%m/%Y %H:%M:%S"]
-            for fmt in fmts:
-                try: return datetime.strptime(t, fmt)
-                except: continue
-            return None
-
-        # Loop de Dados
-        for linha in linhas_dados:
-            cols = [c.strip() for c in linha.split(",")]
-            if len(cols) < 7: continue
-
-            dt = parse_data(cols[1]) # Coluna Timestamp
-            if not dt: continue
-
-            # Índices baseados no seu CSV: CPU(2), RAM(3), Disco(4), Temp(6)
-            cpu = _safe_float(cols[2])
-            ram = _safe_float(cols[3])
-            disco = _safe_float(cols[4])
-            temp = _safe_float(cols[6])
-
-            dados["cpu"].append(cpu)
-            dados["ram"].append(ram)
-            dados["disco"].append(disco)
-            dados["temp"].append(temp)
-            timestamps_validos.append(dt)
-            
-            # Cálculo de Probabilidade Histórica (Simples)
-            prob = min(99, math.floor((temp * 0.7) + (disco * 0.3)))
-            prob_falhas.append(prob)
-
-        if not timestamps_validos:
-            print("ERRO: Nenhum timestamp válido encontrado no CSV.")
-            return {"statusCode": 200, "body": "Sem dados validos"}
-
-        # 5. Dados Atuais (Última Linha)
-        ult_cols = linhas_dados[-1].split(",")
-        # Mapeamento do seu CSV para o JSON
-        metricas_atuais = {
-            "cpu": _safe_float(ult_cols[2]),
-            "ram": _safe_float(ult_cols[3]),
-            "disk": _safe_float(ult_cols[4]),
-            "uptime": ult_cols[5],
-            "temp": _safe_float(ult_cols[6]),
-            "timestamp": ult_cols[1],
-            "situacao": ult_cols[8] if len(ult_cols) > 8 else "Normal",
-            # Indices 9 e 10 para Lat/Long conforme seu CSV
-            "latitude": _safe_float(ult_cols[9]) if len(ult_cols) > 9 else 0.0,
-            "longitude": _safe_float(ult_cols[10]) if len(ult_cols) > 10 else 0.0
-        }
+        # Tentativa 2: Remove 'trusted/' se existir, ou adiciona se não existir
+        if chave_original.startswith("trusted/"):
+            chave_final = chave_original.replace("trusted/", "", 1)
+        else:
+            chave_final = f"trusted/{chave_original}"
+        
+        print(f"Tentando alternativa: '{chave_final}'")
+        try:
+            resp = s3.get_object(Bucket=balde_origem, Key=chave_final)
+            conteudo_csv = resp["Body"].read().decode("utf-8")
+            print("SUCESSO: Arquivo encontrado na tentativa alternativa.")
+        except Exception as e:
+            print(f"ERRO FATAL: Arquivo não existe nem como '{chave_original}' nem '{chave_final}'.")
+            raise e
 
-        # 6. Cálculos de Inteligência (Medianas e Regressão)
-        data_max = max(timestamps_validos)
-        dt_ref = data_max.date()
-        dt_sem = data_max - timedelta(days=7)
-
-        # Helper para medianas
-        def calc_med(lista, datas, filtro_func):
-            vals = [v for v, d in zip(lista, datas) if filtro_func(d)]
-            return float(median(vals)) if vals else 0.0
-
-        medianas = {
-            "dia": {
-                "cpu": calc_med(dados["cpu"], timestamps_validos, lambda d: d.date() == dt_ref),
-                "ram": calc_med(dados["ram"], timestamps_validos, lambda d: d.date() == dt_ref),
-                "temp": calc_med(dados["temp"], timestamps_validos, lambda d: d.date() == dt_ref)
-            },
-            "semanal": {
-                "cpu": calc_med(dados["cpu"], timestamps_validos, lambda d: d >= dt_sem),
-                "ram": calc_med(dados["ram"], timestamps_validos, lambda d: d >= dt_sem),
-                "temp": calc_med(dados["temp"], timestamps_validos, lambda d: d >= dt_sem)
-            }
-        }
+    # 3. Processamento do Caminho (Para definir empresa e máquina)
+    # Removemos 'trusted/' apenas para parsing lógico
+    caminho_limpo = chave_final
+    if caminho_limpo.startswith("trusted/"):
+        caminho_limpo = caminho_limpo.replace("trusted/", "", 1)
+        
+    partes = caminho_limpo.split("/")
+    # Esperado: Empresa/Maquina/Data/arquivo.csv
+    if len(partes) < 2:
+        print("ERRO: Estrutura de pastas inválida.")
+        return "Path invalido"
+
+    empresa = partes[0]
+    maquina_id = partes[1]
+    print(f"Processando para Empresa: {empresa}, Máquina: {maquina_id}")
 
-        # Regressão Linear Simples para Risco
-        regressao = _calcular_regressao(prob_falhas)
+    # 4. Parsing do CSV
+    linhas = [l for l in conteudo_csv.strip().split("\n") if l.strip()]
+    if len(linhas) < 2:
+        print("ERRO: CSV vazio ou apenas cabeçalho.")
+        return "CSV vazio"
+
+    linhas_dados = linhas[1:]
+    
+    # Listas para estatísticas
+    dados = defaultdict(list)
+    prob_falhas = []
+    timestamps_validos = []
+
+    # Posições das colunas pelo nome no cabeçalho (cai no layout fixo se faltar algum)
+    pos = _posicoes_cabecalho(linhas[0])
+
+    # Formatos de data suportados (Brasileiro e ISO). O formato que casar
+    # primeiro vale pro arquivo todo: passa a ser tentado antes dos outros
+    # e vira um leitor por fatias (sem strptime nem exceção por linha)
+    fmts = ["%d/%m/%Y %H:%M", "%d-%m-%Y %H:%M", "%Y-%m-%d %H:%M", "%d/%m/%Y %H:%M:%S"]
+    rapido = []
+    def parse_data(t):
+        t = t.split(".")[0].strip()
+        if rapido:
+            dt = rapido[0](t)
+            if dt: return dt
+        for i, fmt in enumerate(fmts):
+            try: dt = datetime.strptime(t, fmt)
+            except: continue
+            if i: fmts.insert(0, fmts.pop(i))
+            if not rapido: rapido.append(_compilar_formato(fmt))
+            return dt
+        return None
+
+    # Loop de Dados
+    for linha in linhas_dados:
+        cols = [c.strip() for c in linha.split(",")]
+        if len(cols) < 7: continue
+
+        dt = parse_data(cols[pos["timestamp"]]) # Coluna Timestamp
+        if not dt: continue
+
+        # Índices baseados no seu CSV: CPU(2), RAM(3), Disco(4), Temp(6)
+        cpu = _safe_float(cols[pos["cpu"]])
+        ram = _safe_float(cols[pos["ram"]])
+        disco = _safe_float(cols[pos["disco"]])
+        temp = _safe_float(cols[pos["temp"]])
+
+        dados["cpu"].append(cpu)
+        dados["ram"].append(ram)
+        dados["disco"].append(disco)
+        dados["temp"].append(temp)
+        timestamps_validos.append(dt)
         
-        # Modelo Heurístico
-        modelo_risco = _calcular_modelo_heuristico(metricas_atuais)
-
-        # Montagem do JSON Final
-        dashboard_json = {
-            "machine_id": maquina_id,
-            "company": empresa,
-            "status": "critico" if metricas_atuais["situacao"].lower() == "critico" else "ok",
-            "last_update": metricas_atuais["timestamp"],
-            "raw_metrics": {
-                "cpu": f"{metricas_atuais['cpu']:.1f}%",
-                "ram": f"{metricas_atuais['ram']:.1f}%",
-                "disco": f"{metricas_atuais['disk']:.1f}%",
-                "temp": f"{metricas_atuais['temp']:.1f}°C",
-                "latitude": metricas_atuais["latitude"],
-                "longitude": metricas_atuais["longitude"]
-            },
-            "risk_model": modelo_risco,
-            "medianas": medianas,
-            "regressao_risco": regressao
+        # Cálculo de Probabilidade Histórica (Simples)
+        prob = min(99, math.floor((temp * 0.7) + (disco * 0.3)))
+        prob_falhas.append(prob)
+
+    if not timestamps_validos:
+        print("ERRO: Nenhum timestamp válido encontrado no CSV.")
+        return "Sem dados validos"
+
+    # 5. Dados Atuais (Última Linha)
+    ult_cols = linhas_dados[-1].split(",")
+    # Mapeamento do seu CSV para o JSON
+    metricas_atuais = {
+        "cpu": _safe_float(ult_cols[pos["cpu"]]),
+        "ram": _safe_float(ult_cols[pos["ram"]]),
+        "disk": _safe_float(ult_cols[pos["disco"]]),
+        "uptime": ult_cols[pos["uptime"]],
+        "temp": _safe_float(ult_cols[pos["temp"]]),
+        "timestamp": ult_cols[pos["timestamp"]],
+        "situacao": ult_cols[pos["situacao"]] if len(ult_cols) > pos["situacao"] else "Normal",
+        # Indices 9 e 10 para Lat/Long conforme seu CSV
+        "latitude": _safe_float(ult_cols[pos["latitude"]]) if len(ult_cols) > pos["latitude"] else 0.0,
+        "longitude": _safe_float(ult_cols[pos["longitude"]]) if len(ult_cols) > pos["longitude"] else 0.0
+    }
+
+    # 6. Cálculos de Inteligência (Medianas e Regressão)
+    data_max = max(timestamps_validos)
+    dt_ref = data_max.date()
+    dt_sem = data_max - timedelta(days=7)
+
+    # Helper para medianas (statistics só aqui: o import dele é caro no cold start)
+    from statistics import median
+    def calc_med(lista, datas, filtro_func):
+        vals = [v for v, d in zip(lista, datas) if filtro_func(d)]
+        return float(median(vals)) if vals else 0.0
+
+    medianas = {
+        "dia": {
+            "cpu": calc_med(dados["cpu"], timestamps_validos, lambda d: d.date() == dt_ref),
+            "ram": calc_med(dados["ram"], timestamps_validos, lambda d: d.date() == dt_ref),
+            "temp": calc_med(dados["temp"], timestamps_validos, lambda d: d.date() == dt_ref)
+        },
+        "semanal": {
+            "cpu": calc_med(dados["cpu"], timestamps_validos, lambda d: d >= dt_sem),
+            "ram": calc_med(dados["ram"], timestamps_validos, lambda d: d >= dt_sem),
+            "temp": calc_med(dados["temp"], timestamps_validos, lambda d: d >= dt_sem)
         }
+    }
+
+    # Regressão Linear Simples para Risco
+    regressao = _calcular_regressao(prob_falhas)
+    
+    # Modelo Heurístico
+    modelo_risco = _calcular_modelo_heuristico(metricas_atuais)
 
-        # 7. Upload
-        # Define caminho: pedro-client/Empresa/Data/Maquina.json
-        data_str = data_max.strftime("%d-%m-%Y")
-        chave_destino = f"pedro-client/{empresa}/{data_str}/{maquina_id}.json"
+    # Montagem do JSON Final
+    dashboard_json = {
+        "machine_id": maquina_id,
+        "company": empresa,
+        "status": "critico" if metricas_atuais["situacao"].lower() == "critico" else "ok",
+        "last_update": metricas_atuais["timestamp"],
+        "raw_metrics": {
+            "cpu": f"{metricas_atuais['cpu']:.1f}%",
+            "ram": f"{metricas_atuais['ram']:.1f}%",
+            "disco": f"{metricas_atuais['disk']:.1f}%",
+            "temp": f"{metricas_atuais['temp']:.1f}°C",
+            "latitude": metricas_atuais["latitude"],
+            "longitude": metricas_atuais["longitude"]
+        },
+        "risk_model": modelo_risco,
+        "medianas": medianas,
+        "regressao_risco": regressao
+    }
 
-        print(f"Salvando JSON em: s3://{BALDE_DESTINO}/{chave_destino}")
-        
-        cliente_s3.put_object(
-            Bucket=BALDE_DESTINO,
-            Key=chave_destino,
-            Body=json.dumps(dashboard_json, ensure_ascii=False, indent=2),
-            ContentType="application/json"
-        )
+    # 7. Upload
+    # Define caminho: pedro-client/Empresa/Data/Maquina.json
+    data_str = data_max.strftime("%d-%m-%Y")
+    chave_destino = f"pedro-client/{empresa}/{data_str}/{maquina_id}.json"
 
-        return {"statusCode": 200, "body": "Sucesso Python"}
+    print(f"Salvando JSON em: s3://{BALDE_DESTINO}/{chave_destino}")
+    
+    s3.put_object(
+        Bucket=BALDE_DESTINO,
+        Key=chave_destino,
+        Body=json.dumps(dashboard_json, ensure_ascii=False, indent=2),
+        ContentType="application/json"
+    )
 
-    except Exception as e:
-        print(f"ERRO FATAL PYTHON: {str(e)}")
-        # Importante: Retornar erro 200 com mensagem de erro evita retries infinitos no Lambda assíncrono, 
-        # mas para debug é melhor ver o log.
-        return {"statusCode": 500, "body": str(e)}
+    return "Sucesso Python"
 
 # --- Funções Auxiliares ---
+# Layout fixo do CSV do trusted e nomes aceitos no cabeçalho pra cada campo
+_POSICOES_PADRAO = {"timestamp": 1, "cpu": 2, "ram": 3, "disco": 4, "uptime": 5,
+                    "temp": 6, "situacao": 8, "latitude": 9, "longitude": 10}
+_NOMES_COLUNAS = {"timestamp": ("timestamp", "data"), "cpu": ("cpu",), "ram": ("ram",),
+                  "disco": ("disco",), "uptime": ("uptime",), "temp": ("temperatura", "temp"),
+                  "situacao": ("situacao", "status"), "latitude": ("latitude", "lat"),
+                  "longitude": ("longitude", "lng", "lon")}
+
+def _posicoes_cabecalho(cabecalho):
+    nomes = [n.strip().strip('"').lower() for n in cabecalho.split(",")]
+    pos = dict(_POSICOES_PADRAO)
+    for campo, aceitos in _NOMES_COLUNAS.items():
+        for nome in aceitos:
+            if nome in nomes:
+                pos[campo] = nomes.index(nome)
+                break
+    # o loop só garante 7 colunas: se algum campo obrigatório ficou fora
+    # disso, o cabeçalho não é confiável e vale o layout fixo
+    if any(pos[c] >= 7 for c in ("timestamp", "cpu", "ram", "disco", "uptime", "temp")):
+        return dict(_POSICOES_PADRAO)
+    return pos
+
+_LARGURAS_DIRETIVAS = {"Y": 4, "m": 2, "d": 2, "H": 2, "M": 2, "S": 2}
+
+def _compilar_formato(fmt):
+    # "%d/%m/%Y %H:%M" vira tamanho fixo + separadores + fatia de cada campo
+    # (o mesmo atalho do leitura.py do ETL, que não vai no zip desta função).
+    # devolve None pra tudo que não estiver exatamente assim: o strptime decide
+    tamanho, seps, fatias, i = 0, [], {}, 0
+    while i < len(fmt):
+        if fmt[i] == "%":
+            largura = _LARGURAS_DIRETIVAS[fmt[i + 1]]
+            fatias[fmt[i + 1]] = (tamanho, tamanho + largura)
+            tamanho += largura
+            i += 2
+        else:
+            seps.append((tamanho, fmt[i]))
+            tamanho += 1
+            i += 1
+    ordem = [fatias[d] for d in "YmdHMS" if d in fatias]
+
+    def rapido(t):
+        if len(t) != tamanho or not t.isascii() or any(t[p] != c for p, c in seps): return None
+        partes = [t[a:b] for a, b in ordem]
+        if not all(p.isdigit() for p in partes): return None
+        try: return datetime(*map(int, partes))
+        except ValueError: return None
+    return rapido
+
 def _safe_float(v):
     try: return float(str(v).replace(",", "."))
     except: return 0.0
@@ -0,0 +1,226 @@
+import os
+import unicodedata
+from datetime import datetime
+from operator import itemgetter
+
+# quanto do StreamingBody a gente puxa por vez (o resto fica no socket)
+TAMANHO_BLOCO = int(os.environ.get("ETL_TAMANHO_BLOCO", str(256 * 1024)))
+
+
+# quantos bytes antes do fim da última linha a gente guarda (serve pra
+# conferir depois se o arquivo só cresceu ou foi reescrito)
+TAMANHO_CAUDA = 64
+
+
+class LeitorLinhas:
+    # lê o corpo do S3 aos pedaços e devolve só as linhas completas (que
+    # terminam em \n), sem nunca ter o arquivo inteiro em memória. o corte é
+    # feito nos bytes: \n nunca aparece no meio de um caractere UTF-8.
+    # no fim, offset aponta pro byte logo depois do último \n e fragmento
+    # guarda o que sobrou sem quebra de linha
+
+    def __init__(self, corpo, inicio=0, tamanho_bloco=TAMANHO_BLOCO):
+        self.corpo = corpo
+        self.tamanho_bloco = tamanho_bloco
+        self.offset = inicio
+        self.cauda = b""
+        self.fragmento = ""
+
+    def linhas(self):
+        pendente = b""
+        while True:
+            bloco = self.corpo.read(self.tamanho_bloco)
+            if not bloco:
+                break
+
+            dados = pendente + bloco
+            fim = dados.rfind(b"\n") + 1
+            if fim == 0:
+                # nenhuma linha fechou nesse bloco, espera o próximo
+                pendente = dados
+                continue
+
+            completas, pendente = dados[:fim], dados[fim:]
+            self.offset += fim
+            self.cauda = (self.cauda + completas[-TAMANHO_CAUDA:])[-TAMANHO_CAUDA:]
+            linhas = completas.decode("utf-8").split("\n")
+            linhas.pop()
+            yield from linhas
+
+        self.fragmento = pendente.decode("utf-8")
+
+
+def iterar_linhas(corpo, tamanho_bloco=TAMANHO_BLOCO):
+    # todas as linhas do corpo, inclusive a última sem \n no fim
+    leitor = LeitorLinhas(corpo, tamanho_bloco=tamanho_bloco)
+    yield from leitor.linhas()
+    if leitor.fragmento:
+        yield leitor.fragmento
+
+
+def iterar_linhas_dados(corpo, tamanho_bloco=TAMANHO_BLOCO):
+    # mesmas linhas que o strip().split("\n") antigo, sem as vazias e
+    # sem o cabeçalho (que é devolvido separado na primeira posição)
+    linhas = (l for l in iterar_linhas(corpo, tamanho_bloco) if l.strip())
+    cabecalho = next(linhas, None)
+    return cabecalho, linhas
+
+
+def limpar_float(valor):
+    if valor is None or valor == "":
+        return 0.0
+    try:
+        return float(str(valor).replace(",", ".").strip())
+    except ValueError:
+        return 0.0
+
+
+# formatos de timestamp aceitos. são mutuamente exclusivos (um texto só
+# casa com um deles), então a ordem de tentativa não muda o resultado
+FORMATOS_DATA = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d-%m-%Y %H:%M",
+)
+
+# nomes aceitos no cabeçalho pra cada campo (já sem acento e em minúsculo)
+NOMES_COLUNAS = {
+    "timestamp": ("timestamp", "time", "data", "datahora", "data_hora"),
+    "cpu": ("cpu",),
+    "ram": ("ram", "memoria", "mem"),
+    "disco": ("disco", "disk"),
+    "uptime": ("uptime",),
+    "temp": ("temperatura", "temp"),
+    "situacao": ("situacao", "status"),
+    "latitude": ("latitude", "lat"),
+    "longitude": ("longitude", "long", "lng", "lon"),
+}
+COLUNAS_OBRIGATORIAS = ("timestamp", "cpu", "ram", "disco", "temp")
+
+# layout antigo do trusted, usado quando o cabeçalho não tem os nomes
+POSICOES_PADRAO = {
+    "timestamp": 1,
+    "cpu": 2,
+    "ram": 3,
+    "disco": 4,
+    "uptime": 5,
+    "temp": 6,
+    "situacao": 8,
+    "latitude": 9,
+    "longitude": 10,
+}
+LARGURA_PADRAO = 11
+
+_LARGURAS_DIRETIVAS = {"Y": 4, "m": 2, "d": 2, "H": 2, "M": 2, "S": 2}
+
+
+class Decodificador:
+    # montado uma vez por arquivo a partir do cabeçalho: separador, posição
+    # de cada coluna pelo nome e o formato do timestamp (descoberto na
+    # primeira data válida e depois lido por fatias de tamanho fixo)
+
+    def __init__(self, cabecalho):
+        cabecalho = cabecalho or ""
+        # CSV com ; normalmente vem com vírgula decimal (12,5)
+        self.separador = ";" if ";" in cabecalho and "," not in cabecalho else ","
+        self.posicoes, self.largura_minima = _resolver_posicoes(cabecalho, self.separador)
+        self.formato = None
+        self._rapido = None
+
+    def data(self, texto):
+        texto = texto.strip().split(".")[0]
+        if self._rapido is not None:
+            data = self._rapido(texto)
+            if data is not None:
+                return data
+
+        # fora do formato fixo (ou formato ainda não detectado): strptime,
+        # começando pelo formato do arquivo
+        formatos = FORMATOS_DATA if self.formato is None else (self.formato,) + FORMATOS_DATA
+        for formato in formatos:
+            try:
+                data = datetime.strptime(texto, formato)
+            except ValueError:
+                continue
+            if self.formato is None:
+                self.formato = formato
+                self._rapido = _compilar_formato(formato)
+            return data
+        return None
+
+
+def converter_float(texto):
+    # float() já aceita espaço em volta; só cai no limpar_float quando
+    # precisa (vírgula decimal, célula vazia ou lixo)
+    try:
+        return float(texto)
+    except ValueError:
+        return limpar_float(texto)
+
+
+def _normalizar_nome(nome):
+    nome = unicodedata.normalize("NFKD", nome.strip().strip('"').lower())
+    return "".join(c for c in nome if not unicodedata.combining(c))
+
+
+def _resolver_posicoes(cabecalho, separador):
+    nomes = [_normalizar_nome(n) for n in cabecalho.split(separador)]
+    posicoes = {}
+    for campo, aceitos in NOMES_COLUNAS.items():
+        for aceito in aceitos:
+            if aceito in nomes:
+                posicoes[campo] = nomes.index(aceito)
+                break
+
+    if any(campo not in posicoes for campo in COLUNAS_OBRIGATORIAS):
+        return dict(POSICOES_PADRAO), LARGURA_PADRAO
+    return posicoes, max(posicoes.values()) + 1
+
+
+def layout_formato(formato):
+    # "%d/%m/%Y %H:%M" vira: tamanho fixo, (posição, caractere) de cada
+    # separador e a fatia de cada campo ({"d": (0, 2), "m": (3, 5), ...})
+    posicao = 0
+    separadores = []
+    fatias = {}
+    i = 0
+    while i < len(formato):
+        if formato[i] == "%":
+            diretiva = formato[i + 1]
+            largura = _LARGURAS_DIRETIVAS[diretiva]
+            fatias[diretiva] = (posicao, posicao + largura)
+            posicao += largura
+            i += 2
+        else:
+            separadores.append((posicao, formato[i]))
+            posicao += 1
+            i += 1
+    return posicao, separadores, fatias
+
+
+def _compilar_formato(formato):
+    # devolve uma função que lê o texto por fatias (ou None quando o texto
+    # não está exatamente nesse formato)
+    tamanho, separadores, fatias = layout_formato(formato)
+    pegar_separadores = itemgetter(*(p for p, _ in separadores))
+    esperado = tuple(c for _, c in separadores)
+    ordem = [fatias.get(d) for d in "YmdHMS"]
+    iso = formato.startswith("%Y-%m-%d %H:%M")
+
+    def rapido(texto):
+        if len(texto) != tamanho or pegar_separadores(texto) != esperado or not texto.isascii():
+            return None
+        try:
+            if iso:
+                # AAAA-MM-DD HH:MM[:SS] com os separadores conferidos é ISO puro
+                return datetime.fromisoformat(texto)
+            partes = [texto[a:b] for a, b in (f for f in ordem if f is not None)]
+            if not all(p.isdigit() for p in partes):
+                return None
+            return datetime(*map(int, partes))
+        except ValueError:
+            return None
+
+    return rapido
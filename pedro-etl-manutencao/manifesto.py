@@ -0,0 +1,76 @@
+import json
+
+# manifesto por CSV de origem: de qual ETag/tamanho a saída foi gerada e
+# com qual configuração. o ETL-GERAL redispara milhares de CSVs que não
+# mudaram; com o manifesto cada um custa um HEAD e um GET pequeno, sem
+# baixar o CSV nem regravar nada (mais uma listagem da janela de 7 dias
+# quando a saída usou outros CSVs da máquina)
+PREFIXO_MANIFESTO = "pedro-client/_manifesto"
+
+# sobe quando o JSON de saída muda de formato: manifestos antigos deixam de
+# valer e tudo é reprocessado uma vez
+VERSAO_MANIFESTO = 1
+
+
+def chave_manifesto(balde_origem, chave_origem):
+    return f"{PREFIXO_MANIFESTO}/{balde_origem}/{chave_origem}.json"
+
+
+def conferir(cliente, balde_destino, balde_origem, chave_origem, configuracao):
+    # devolve (registro, origem): registro é o manifesto salvo se a origem e
+    # a configuração são as mesmas (dá pra pular), senão None. origem é o
+    # que o HEAD viu agora, pra registrar depois do processamento
+    origem = ler_origem(cliente, balde_origem, chave_origem)
+    registro = _carregar(cliente, balde_destino, chave_manifesto(balde_origem, chave_origem))
+    if (
+        registro is None
+        or registro.get("versao") != VERSAO_MANIFESTO
+        or registro.get("origem") != origem
+        or registro.get("configuracao") != configuracao
+    ):
+        return None, origem
+    return registro, origem
+
+
+def ler_origem(cliente, balde_origem, chave_origem):
+    cabeca = cliente.head_object(Bucket=balde_origem, Key=chave_origem)
+    return {
+        "bucket": balde_origem,
+        "key": chave_origem,
+        "etag": cabeca["ETag"],
+        "tamanho": cabeca["ContentLength"],
+    }
+
+
+def registrar(cliente, balde_destino, origem, configuracao, resultado, entradas=None):
+    # gravado depois da saída. se o CSV mudou entre o HEAD e o GET, o ETag
+    # registrado é o antigo e a próxima rodada só reprocessa à toa (nunca
+    # o contrário). entradas: os outros CSVs que entraram na saída (janela
+    # do histórico), conferidos por quem chama antes de pular
+    registro = {
+        "versao": VERSAO_MANIFESTO,
+        "origem": origem,
+        "configuracao": configuracao,
+        "resultado": resultado,
+        "entradas": entradas or None,
+    }
+    cliente.put_object(
+        Bucket=balde_destino,
+        Key=chave_manifesto(origem["bucket"], origem["key"]),
+        Body=json.dumps(registro, ensure_ascii=False, separators=(",", ":")),
+        ContentType="application/json",
+    )
+
+
+def _carregar(cliente, balde, chave):
+    try:
+        resposta = cliente.get_object(Bucket=balde, Key=chave)
+    except Exception as erro:
+        if _codigo_erro(erro) in ("NoSuchKey", "404"):
+            return None
+        raise
+    return json.loads(resposta["Body"].read())
+
+
+def _codigo_erro(erro):
+    return getattr(erro, "response", {}).get("Error", {}).get("Code")
@@ -0,0 +1,174 @@
+import json
+import os
+
+import frota
+
+# índice espacial das máquinas por empresa e dia: o mapa do painel calcula
+# os tiles (geohash) que a tela cobre e baixa só esses, em vez de listar
+# pedro-client/{empresa}/ inteiro. cada tile lista as máquinas dentro dele
+# com o mesmo resumo do resumo da frota (status, severidade, risco,
+# posição). precisão 4 = células de ~39 x 20 km.
+#
+# igual à frota, ninguém disputa o tile: cada máquina grava o próprio
+# objeto dentro da pasta do tile e o tile é uma compactação deles. a
+# máquina que sai de um tile grava lá um objeto com resumo None, e a
+# compactação tira ela. o registro da máquina (_maquinas/) diz em que tile
+# ela está e quais ainda falta limpar; ele é gravado por último, então
+# uma execução que caiu no meio é refeita inteira pela próxima
+#
+#   {prefixo}/{empresa}/{data}/{tile}.json               o tile (quem lê o mapa)
+#   {prefixo}/{empresa}/{data}/{tile}/{maquina}.json     a máquina nesse tile
+#   {prefixo}/{empresa}/{data}/_maquinas/{maquina}.json  o registro da máquina
+PREFIXO_MAPA = "pedro-client/_mapa"
+VERSAO_MAPA = 2
+PRECISAO = int(os.environ.get("ETL_MAPA_PRECISAO", "4"))
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def chave_tile(empresa, data_str, tile):
+    return f"{PREFIXO_MAPA}/{empresa}/{data_str}/{tile}.json"
+
+
+def chave_maquina_tile(empresa, data_str, tile, maquina_id):
+    return f"{PREFIXO_MAPA}/{empresa}/{data_str}/{tile}/{maquina_id}.json"
+
+
+def chave_registro(empresa, data_str, maquina_id):
+    return f"{PREFIXO_MAPA}/{empresa}/{data_str}/_maquinas/{maquina_id}.json"
+
+
+def geohash(latitude, longitude, precisao=None):
+    # geohash padrão: bits alternados de longitude e latitude, 5 por caractere
+    precisao = precisao or PRECISAO
+    faixa_lat = [-90.0, 90.0]
+    faixa_lon = [-180.0, 180.0]
+    texto = []
+    bits = 0
+    valor = 0
+    par = True
+    while len(texto) < precisao:
+        faixa, coordenada = (faixa_lon, longitude) if par else (faixa_lat, latitude)
+        meio = (faixa[0] + faixa[1]) / 2
+        valor <<= 1
+        if coordenada >= meio:
+            valor |= 1
+            faixa[0] = meio
+        else:
+            faixa[1] = meio
+        par = not par
+        bits += 1
+        if bits == 5:
+            texto.append(_BASE32[valor])
+            bits = 0
+            valor = 0
+    return "".join(texto)
+
+
+def tiles_na_janela(lat_min, lon_min, lat_max, lon_max, precisao=None):
+    # tiles que um retângulo (viewport) cobre: anda pela grade do tamanho
+    # de uma célula e junta o geohash de cada ponto (e dos cantos)
+    precisao = precisao or PRECISAO
+    bits_lon = (5 * precisao + 1) // 2
+    bits_lat = 5 * precisao // 2
+    passo_lat = 180.0 / (1 << bits_lat)
+    passo_lon = 360.0 / (1 << bits_lon)
+
+    tiles = set()
+    lat = lat_min
+    while True:
+        lon = lon_min
+        while True:
+            tiles.add(geohash(min(lat, lat_max), min(lon, lon_max), precisao))
+            if lon >= lon_max:
+                break
+            lon += passo_lon
+        if lat >= lat_max:
+            break
+        lat += passo_lat
+    return sorted(tiles)
+
+
+def atualizar(cliente, balde, empresa, data_str, maquina_id, entrada):
+    # entrada: resumo da máquina agora (o mesmo da frota). grava a máquina
+    # no tile dela, tira dos tiles onde estava e compacta os que mexeu.
+    # devolve os tiles gravados
+    tile = geohash(entrada["latitude"], entrada["longitude"])
+    chave = chave_registro(empresa, data_str, maquina_id)
+    registro, _ = frota._carregar(cliente, balde, chave, lambda: _vazio_registro(empresa, data_str, maquina_id))
+    if registro["tile"] == tile and registro["resumo"] == entrada and not registro["limpar"]:
+        return []
+
+    if registro["tile"] != tile:
+        # mudou de tile: antes de aparecer no novo, o registro guarda que
+        # o antigo ainda precisa ser limpo
+        if registro["tile"] is not None:
+            registro["limpar"] = sorted(set(registro["limpar"]) | {registro["tile"]})
+            _gravar(cliente, balde, chave, registro)
+        registro["tile"] = tile
+    registro["limpar"] = [t for t in registro["limpar"] if t != tile]
+
+    gravados = []
+    for destino, resumo in [(tile, entrada)] + [(t, None) for t in registro["limpar"]]:
+        _gravar(cliente, balde, chave_maquina_tile(empresa, data_str, destino, maquina_id), {
+            "versao": VERSAO_MAPA, "company": empresa, "date": data_str, "tile": destino,
+            "machine": maquina_id, "resumo": resumo,
+        })
+        if compactar(cliente, balde, empresa, data_str, destino):
+            gravados.append(destino)
+
+    registro["resumo"] = entrada
+    registro["limpar"] = []
+    _gravar(cliente, balde, chave, registro)
+    return gravados
+
+
+def compactar(cliente, balde, empresa, data_str, tile):
+    # refaz o tile a partir dos objetos das máquinas, lendo só os que
+    # mudaram desde a última compactação (mesma ideia do frota.compactar).
+    # devolve se gravou
+    prefixo = f"{PREFIXO_MAPA}/{empresa}/{data_str}/{tile}/"
+
+    def alterar(objeto):
+        etags = objeto["etags"]
+        mudou = False
+        for chave, etag in frota._listar(cliente, balde, prefixo):
+            maquina_id = chave[len(prefixo):-len(".json")]
+            if etag is not None and etags.get(maquina_id) == etag:
+                continue
+            maquina, etag_lido = frota._carregar(cliente, balde, chave, lambda: {"versao": VERSAO_MAPA, "resumo": None})
+            if etag_lido is None or etags.get(maquina_id) == etag_lido:
+                continue
+            etags[maquina_id] = etag_lido
+            if maquina["resumo"] is None:
+                # saiu desse tile
+                objeto["maquinas"].pop(maquina_id, None)
+            else:
+                objeto["maquinas"][maquina_id] = maquina["resumo"]
+            mudou = True
+        if mudou:
+            # ordem fixa: o mesmo conjunto de máquinas gera sempre o mesmo JSON
+            objeto["maquinas"] = dict(sorted(objeto["maquinas"].items()))
+            objeto["etags"] = dict(sorted(etags.items()))
+        return mudou
+
+    def vazio():
+        return {"versao": VERSAO_MAPA, "company": empresa, "date": data_str, "tile": tile, "maquinas": {}, "etags": {}}
+
+    return frota.atualizar_condicional(cliente, balde, chave_tile(empresa, data_str, tile), vazio, alterar)
+
+
+def _gravar(cliente, balde, chave, objeto):
+    cliente.put_object(
+        Bucket=balde,
+        Key=chave,
+        Body=json.dumps(objeto, ensure_ascii=False, separators=(",", ":")),
+        ContentType="application/json",
+    )
+
+
+def _vazio_registro(empresa, data_str, maquina_id):
+    return {
+        "versao": VERSAO_MAPA, "company": empresa, "date": data_str, "machine": maquina_id,
+        "tile": None, "resumo": None, "limpar": [],
+    }
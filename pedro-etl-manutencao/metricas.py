@@ -0,0 +1,184 @@
+import json
+import os
+import time
+
+# um registro de métricas por invocação, no formato EMF do CloudWatch (o
+# Lambda manda o stdout pro CloudWatch Logs e ele vira métrica sozinho).
+# localmente é só um JSON numa linha. ETL_METRICAS=0 desliga: aí todo
+# mundo recebe a NULA, que não mede nada
+ATIVO = os.environ.get("ETL_METRICAS", "1").lower() in ("1", "true", "sim")
+NAMESPACE = os.environ.get("ETL_METRICAS_NAMESPACE", "Vizor/ETLManutencao")
+FUNCAO = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "pedro-etl-manutencao")
+
+# contagens que viram métrica (o resto dos campos vai junto no log)
+CONTAGENS = (
+    "arquivos",
+    "falhas",
+    "complementos_falhos",
+    "arquivos_inalterados",
+    "linhas_lidas",
+    "linhas_validas",
+    "linhas_curtas",
+    "linhas_data_invalida",
+    "bytes_lidos",
+    "bytes_gravados",
+    "cache_acertos",
+    "cache_faltas",
+)
+
+
+class Medicao:
+    # tempos por etapa em ms, exclusivos: se uma etapa roda dentro de outra
+    # (ex: leitura do corpo do S3 dentro do loop de linhas), o tempo dela
+    # sai da de fora. uma Medicao por arquivo, usada por uma thread só
+
+    def __init__(self):
+        self.tempos = {}
+        self.contagens = {}
+        self._pilha = []
+
+    def etapa(self, nome):
+        return _Etapa(self, nome)
+
+    def somar(self, nome, valor=1):
+        self.contagens[nome] = self.contagens.get(nome, 0) + valor
+
+    def juntar(self, outra):
+        for nome, valor in outra.tempos.items():
+            self.tempos[nome] = self.tempos.get(nome, 0.0) + valor
+        for nome, valor in outra.contagens.items():
+            self.somar(nome, valor)
+
+    def registro(self, duracao_ms, **propriedades):
+        tempos = {f"tempo_{nome}": round(ms, 3) for nome, ms in sorted(self.tempos.items())}
+        tempos["tempo_total"] = round(duracao_ms, 3)
+        contagens = {nome: self.contagens.get(nome, 0) for nome in CONTAGENS}
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["Funcao"]],
+                    "Metrics": (
+                        [{"Name": nome, "Unit": "Milliseconds"} for nome in tempos]
+                        + [{"Name": nome, "Unit": "Bytes" if nome.startswith("bytes") else "Count"} for nome in contagens]
+                    ),
+                }],
+            },
+            "Funcao": FUNCAO,
+            **tempos,
+            **contagens,
+            **propriedades,
+        }
+
+    def emitir(self, duracao_ms, **propriedades):
+        print(json.dumps(self.registro(duracao_ms, **propriedades), ensure_ascii=False, separators=(",", ":")))
+
+
+class _Etapa:
+    def __init__(self, medicao, nome):
+        self.medicao = medicao
+        self.nome = nome
+
+    def __enter__(self):
+        # [nome, início, tempo gasto em etapas filhas]
+        self.medicao._pilha.append([self.nome, time.perf_counter(), 0.0])
+        return self
+
+    def __exit__(self, *erro):
+        pilha = self.medicao._pilha
+        nome, inicio, filhas = pilha.pop()
+        duracao = (time.perf_counter() - inicio) * 1000
+        tempos = self.medicao.tempos
+        tempos[nome] = tempos.get(nome, 0.0) + duracao - filhas
+        if pilha:
+            pilha[-1][2] += duracao
+        return False
+
+
+class _Nula:
+    # desligado: mesma interface, sem relógio nem dicionário
+    tempos = {}
+    contagens = {}
+
+    def etapa(self, nome):
+        return _ETAPA_NULA
+
+    def somar(self, nome, valor=1):
+        pass
+
+    def juntar(self, outra):
+        pass
+
+    def emitir(self, duracao_ms, **propriedades):
+        pass
+
+
+class _EtapaNula:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        return False
+
+
+_ETAPA_NULA = _EtapaNula()
+NULA = _Nula()
+
+
+def nova():
+    return Medicao() if ATIVO else NULA
+
+
+def medir_cliente(cliente, medicao):
+    if medicao is NULA:
+        return cliente
+    return _ClienteMedido(cliente, medicao)
+
+
+class _ClienteMedido:
+    # embrulha o cliente S3: cada chamada vira etapa s3_<operação>, os
+    # bytes gravados são somados e o corpo do GET conta bytes e o tempo
+    # gasto esperando a rede (etapa s3_corpo)
+
+    def __init__(self, cliente, medicao):
+        self._cliente = cliente
+        self._medicao = medicao
+
+    def get_object(self, **kwargs):
+        with self._medicao.etapa("s3_get"):
+            resposta = self._cliente.get_object(**kwargs)
+        resposta["Body"] = _CorpoMedido(resposta["Body"], self._medicao)
+        return resposta
+
+    def put_object(self, **kwargs):
+        corpo = kwargs.get("Body") or b""
+        self._medicao.somar("bytes_gravados", len(corpo.encode("utf-8") if isinstance(corpo, str) else corpo))
+        with self._medicao.etapa("s3_put"):
+            return self._cliente.put_object(**kwargs)
+
+    def head_object(self, **kwargs):
+        with self._medicao.etapa("s3_head"):
+            return self._cliente.head_object(**kwargs)
+
+    def list_objects_v2(self, **kwargs):
+        with self._medicao.etapa("s3_list"):
+            return self._cliente.list_objects_v2(**kwargs)
+
+    def __getattr__(self, nome):
+        return getattr(self._cliente, nome)
+
+
+class _CorpoMedido:
+    def __init__(self, corpo, medicao):
+        self._corpo = corpo
+        self._medicao = medicao
+
+    def read(self, *args):
+        with self._medicao.etapa("s3_corpo"):
+            dados = self._corpo.read(*args)
+        self._medicao.somar("bytes_lidos", len(dados))
+        return dados
+
+    def close(self):
+        self._corpo.close()
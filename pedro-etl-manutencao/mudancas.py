@@ -0,0 +1,119 @@
+import json
+import os
+
+import frota
+
+# feed de mudanças de status da frota: alerta e painel leem uns poucos
+# objetos pequenos em vez de baixar e comparar o JSON de cada máquina. cada
+# máquina tem um registro de estado com o último status/severidade visto;
+# quando o dashboard novo muda algum dos dois, um evento entra no feed da
+# empresa, no dia do dado. cada evento é um objeto próprio dentro do
+# prefixo do dia (ninguém disputa a mesma chave); a chave começa pelo
+# timestamp, então listar o prefixo já devolve o feed em ordem e quem lê
+# continua de onde parou com StartAfter. ETL_MUDANCAS=0 desliga
+PREFIXO_ESTADO = "pedro-client/_estado"
+PREFIXO_MUDANCAS = "pedro-client/_mudancas"
+VERSAO_MUDANCAS = 2
+ATIVO = os.environ.get("ETL_MUDANCAS", "1").lower() in ("1", "true", "sim")
+
+
+def chave_estado(empresa, maquina_id):
+    return f"{PREFIXO_ESTADO}/{empresa}/{maquina_id}.json"
+
+
+def chave_feed(empresa, data_str):
+    return f"{PREFIXO_MUDANCAS}/{empresa}/{data_str}/"
+
+
+def chave_evento(evento):
+    return f"{chave_feed(evento['company'], evento['timestamp'][:10])}{evento['timestamp']}_{evento['machine']}_{evento['id']}.json"
+
+
+def registrar(cliente, balde, empresa, maquina_id, dashboard_json, data_maxima):
+    # compara com o estado da máquina e grava o estado novo (CAS); só
+    # depois que a escrita ganhou é que o evento sai, montado a partir do
+    # estado que essa tentativa leu: tentativa perdida ou repetida não
+    # publica nada. o último evento fica guardado no estado, então um
+    # retry que caiu entre as duas escritas acha o estado já igual e
+    # republica o mesmo evento (mesma chave, o IfNoneMatch ignora).
+    # devolve o evento publicado ou None
+    momento = data_maxima.strftime("%Y-%m-%dT%H:%M:%S")
+    novo = {"status": dashboard_json["status"], "severity": dashboard_json["ui"]["severity"]}
+    tentativa = {}
+
+    def alterar(estado):
+        tentativa.clear()
+        if estado["timestamp"] is not None:
+            if momento < estado["timestamp"]:
+                # CSV mais velho que a última mudança (atrasado ou
+                # reprocessado): não faz o estado voltar no tempo
+                return False
+            if estado["atual"] == novo:
+                ultimo = estado.get("evento")
+                if ultimo is not None and ultimo["timestamp"] == momento:
+                    tentativa["evento"] = ultimo
+                return False
+            tentativa["evento"] = _evento(empresa, maquina_id, estado["atual"], novo, momento, dashboard_json)
+        # sem estado (máquina nova ou feed recém-ligado) só grava a base,
+        # sem evento: senão a frota inteira "mudaria" de uma vez
+        estado["atual"] = novo
+        estado["timestamp"] = momento
+        estado["evento"] = tentativa.get("evento")
+        return True
+
+    def vazio():
+        return {"versao": VERSAO_MUDANCAS, "company": empresa, "machine": maquina_id, "atual": None, "timestamp": None}
+
+    frota.atualizar_condicional(cliente, balde, chave_estado(empresa, maquina_id), vazio, alterar)
+    evento = tentativa.get("evento")
+    if evento is not None:
+        _publicar(cliente, balde, evento)
+    return evento
+
+
+def ler_feed(cliente, balde, empresa, data_str, depois_de=""):
+    # eventos do dia em ordem; depois_de é a última chave já lida
+    parametros = {"Bucket": balde, "Prefix": chave_feed(empresa, data_str)}
+    if depois_de:
+        parametros["StartAfter"] = depois_de
+    eventos = []
+    while True:
+        resposta = cliente.list_objects_v2(**parametros)
+        for objeto in resposta.get("Contents", []):
+            corpo = cliente.get_object(Bucket=balde, Key=objeto["Key"])["Body"].read()
+            eventos.append(json.loads(corpo))
+        if not resposta.get("IsTruncated"):
+            return eventos
+        parametros["ContinuationToken"] = resposta["NextContinuationToken"]
+
+
+def _evento(empresa, maquina_id, anterior, novo, momento, dashboard_json):
+    # o id só depende do que a mudança é: a mesma mudança gera sempre o mesmo
+    import hashlib
+
+    identidade = f"{empresa}/{maquina_id}/{momento}/{anterior['status']}/{anterior['severity']}/{novo['status']}/{novo['severity']}"
+    return {
+        "id": hashlib.sha1(identidade.encode("utf-8")).hexdigest()[:16],
+        "company": empresa,
+        "machine": maquina_id,
+        "from": anterior,
+        "to": novo,
+        "timestamp": momento,
+        "prob": dashboard_json["risk_model"]["prob"],
+        "riskLevel": dashboard_json["risk_model"]["riskLevel"],
+    }
+
+
+def _publicar(cliente, balde, evento):
+    # If-None-Match: o mesmo evento publicado de novo (retry) não sobrescreve
+    try:
+        cliente.put_object(
+            Bucket=balde,
+            Key=chave_evento(evento),
+            Body=json.dumps(evento, ensure_ascii=False, separators=(",", ":")),
+            ContentType="application/json",
+            IfNoneMatch="*",
+        )
+    except Exception as erro:
+        if frota._codigo_erro(erro) not in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409"):
+            raise
@@ -0,0 +1,225 @@
+import os
+import threading
+from array import array
+from datetime import datetime, timedelta
+from itertools import repeat
+
+import agregacao
+import colunar
+import metricas
+from leitura import TAMANHO_BLOCO, Decodificador
+
+# CSV muito grande (uma máquina gravando em alta frequência por semanas): o
+# loop de linhas sozinho é a invocação inteira e usa um núcleo só. a partir
+# de ETL_PARALELO_MB o arquivo é dividido em faixas de bytes alinhadas em
+# \n. o processo da invocação lê a primeira faixa do corpo que já está
+# aberto e cada uma das outras vai pra um processo filho (fork), com GET por
+# Range e If-Match no ETag (o arquivo não pode mudar no meio). cada faixa
+# vira um parcial e os parciais são juntados na ordem do arquivo: o
+# agregado sai igual ao da leitura serial. só Process e Pipe (o Lambda não
+# tem /dev/shm, então nada de Pool ou Queue). o fork só acontece na thread
+# principal e sem nenhuma outra thread viva (pool do lote, histórico): o
+# filho herda só a thread que fez o fork, e uma trava que outra thread
+# segurava naquele instante (malloc, logging, pool de conexões do boto3)
+# nunca mais seria solta nele. dentro de um pool o arquivo é lido em
+# série. ETL_PARALELO=0 desliga
+ATIVO = os.environ.get("ETL_PARALELO", "1").lower() in ("1", "true", "sim")
+LIMIAR_BYTES = int(float(os.environ.get("ETL_PARALELO_MB", "16")) * 1024 * 1024)
+# núcleos que o processo pode usar de verdade (o cpu_count conta a máquina toda)
+PROCESSOS = int(os.environ.get(
+    "ETL_PARALELO_PROCESSOS",
+    str(len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1),
+))
+# faixa menor que isso não paga o fork e o envio do parcial de volta
+FAIXA_MINIMA = 4 * 1024 * 1024
+
+# as datas do motor python voltam dos filhos como segundos desde EPOCA
+# (pickle de datetime custa ~3 µs por linha, array de inteiros quase nada)
+EPOCA = datetime(1970, 1, 1)
+_SEGUNDO = timedelta(seconds=1)
+
+
+def usar(tamanho):
+    return (
+        ATIVO
+        and PROCESSOS > 1
+        and tamanho >= max(LIMIAR_BYTES, 2 * FAIXA_MINIMA)
+        and threading.current_thread() is threading.main_thread()
+        and threading.active_count() == 1
+    )
+
+
+def faixas(tamanho):
+    quantidade = max(1, min(PROCESSOS, tamanho // FAIXA_MINIMA))
+    return [(tamanho * i // quantidade, tamanho * (i + 1) // quantidade) for i in range(quantidade)]
+
+
+def agregar(resposta, balde, chave, novo_cliente, usar_numpy, medicao=metricas.NULA):
+    # resposta: GET do arquivo inteiro, ainda sem ler o corpo. novo_cliente()
+    # devolve o cliente S3 de um filho (o pool de conexões do pai não pode
+    # ser dividido depois do fork)
+    import multiprocessing
+
+    contexto = multiprocessing.get_context("fork")
+    lista = faixas(resposta["ContentLength"])
+    filhos = []
+    try:
+        with medicao.etapa("linhas"):
+            # o cabeçalho sai da primeira faixa, antes de os filhos começarem
+            linhas = (l for l in linhas_da_faixa(resposta["Body"], 0, lista[0][1]) if l.strip())
+            cabecalho = next(linhas, None)
+
+            for inicio, fim in lista[1:]:
+                receber, enviar = contexto.Pipe(duplex=False)
+                processo = contexto.Process(
+                    target=_filho,
+                    args=(enviar, balde, chave, resposta.get("ETag"), inicio, fim, cabecalho, novo_cliente, usar_numpy),
+                    daemon=True,
+                )
+                processo.start()
+                enviar.close()
+                filhos.append((processo, receber))
+
+            parciais = [_ler_faixa(linhas, cabecalho, usar_numpy, medicao)]
+            resposta["Body"].close()
+
+            for processo, receber in filhos:
+                try:
+                    situacao, parcial, contagens = receber.recv()
+                except EOFError:
+                    raise RuntimeError(f"processo da faixa de {chave} morreu (código {processo.exitcode})")
+                if situacao != "ok":
+                    raise RuntimeError(f"faixa de {chave}: {parcial}")
+                if not usar_numpy:
+                    parcial["datas"] = list(map(EPOCA.__add__, map(timedelta, repeat(0), parcial["datas"])))
+                for nome, valor in contagens.items():
+                    medicao.somar(nome, valor)
+                parciais.append(parcial)
+            if not usar_numpy:
+                parcial = juntar_parciais(cabecalho, parciais)
+    finally:
+        for processo, receber in filhos:
+            receber.close()
+            if processo.is_alive():
+                processo.terminate()
+            processo.join()
+
+    print(f"[ETL] {chave} lido em {len(lista)} faixa(s) em paralelo")
+    with medicao.etapa("medianas"):
+        if not usar_numpy:
+            return agregacao.finalizar(parcial)
+        # os lotes de cada faixa, em ordem, são os mesmos que a leitura serial
+        # juntaria (o _finalizar concatena tudo)
+        return colunar._finalizar(
+            Decodificador(cabecalho),
+            sum(p[0] for p in parciais),
+            next((p[1] for p in reversed(parciais) if p[1] is not None), None),
+            [lote for p in parciais for lote in p[2]],
+            {m: [lote for p in parciais for lote in p[3][m]] for m in colunar.METRICAS},
+            medicao,
+        )
+
+
+def linhas_da_faixa(corpo, inicio, fim, tamanho_bloco=TAMANHO_BLOCO):
+    # linhas que começam em [inicio, fim). com inicio > 0 o corpo começa no
+    # byte inicio - 1: se ele for \n a primeira linha começa em inicio, se
+    # não, o pedaço até o próximo \n é da faixa anterior e fica de fora.
+    # a última linha pode passar de fim (vai até o \n dela)
+    posicao = inicio - 1 if inicio > 0 else 0
+    pendente = b""
+    pular = inicio > 0
+    while True:
+        bloco = corpo.read(tamanho_bloco)
+        if not bloco:
+            break
+        dados = pendente + bloco
+        pendente = b""
+        if pular:
+            quebra = dados.find(b"\n")
+            if quebra < 0:
+                posicao += len(dados)
+                continue
+            dados = dados[quebra + 1:]
+            posicao += quebra + 1
+            pular = False
+        if posicao >= fim:
+            return
+
+        corte = dados.rfind(b"\n") + 1
+        if corte == 0:
+            pendente = dados
+            continue
+        if posicao + corte > fim:
+            # a última linha da faixa termina no primeiro \n a partir de fim - 1
+            corte = dados.find(b"\n", fim - 1 - posicao) + 1
+            yield from dados[:corte].decode("utf-8").split("\n")[:-1]
+            return
+        yield from dados[:corte].decode("utf-8").split("\n")[:-1]
+        pendente = dados[corte:]
+        posicao += corte
+
+    if pendente and not pular and posicao < fim:
+        yield pendente.decode("utf-8")
+
+
+def juntar_parciais(cabecalho, parciais):
+    # parciais do motor python (um por faixa, em ordem) num parcial só,
+    # igual ao de uma passada serial. as somas da regressão são de valores
+    # inteiros, então a ordem das parcelas não muda nada
+    total = agregacao.novo_parcial(cabecalho)
+    datas = total["datas"]
+    colunas = total["colunas"]
+    for parcial in parciais:
+        if parcial["n"]:
+            if total["n"] == 0:
+                total["primeira"] = parcial["primeira"]
+            elif parcial["datas"][0] < datas[-1]:
+                total["em_ordem"] = False
+            total["em_ordem"] = total["em_ordem"] and parcial["em_ordem"]
+            # x da regressão é o índice da linha válida no arquivo inteiro
+            total["soma_xy"] += parcial["soma_xy"] + total["n"] * parcial["soma_y"]
+            total["soma_y"] += parcial["soma_y"]
+            total["n"] += parcial["n"]
+            total["ultima"] = parcial["ultima"]
+            datas.extend(parcial["datas"])
+            for nome in agregacao.COLUNAS:
+                colunas[nome].extend(parcial["colunas"][nome])
+        total["total_linhas"] += parcial["total_linhas"]
+        if parcial["colunas_ultima"] is not None:
+            total["colunas_ultima"] = parcial["colunas_ultima"]
+
+    # o detector de anomalias é sequencial (EWMA): roda uma vez, aqui, nas
+    # colunas já na ordem do arquivo
+    detector = total["detector"]
+    if detector is not None:
+        detector.varrer(datas, colunas["cpu"], colunas["ram"], colunas["temp"])
+    return total
+
+
+def _ler_faixa(linhas, cabecalho, usar_numpy, medicao):
+    if usar_numpy:
+        return colunar._ler_lotes(linhas, Decodificador(cabecalho))
+    parcial = agregacao.novo_parcial(cabecalho)
+    parcial["detector"] = None
+    return agregacao.acumular_linhas(linhas, parcial, medicao)
+
+
+def _filho(enviar, balde, chave, etag, inicio, fim, cabecalho, novo_cliente, usar_numpy):
+    # roda no processo filho: lê a faixa e manda o parcial (ou o erro) pelo pipe
+    try:
+        medicao = metricas.nova()
+        cliente = metricas.medir_cliente(novo_cliente(), medicao)
+        parametros = {"Bucket": balde, "Key": chave, "Range": f"bytes={inicio - 1}-"}
+        if etag:
+            parametros["IfMatch"] = etag
+        resposta = cliente.get_object(**parametros)
+        linhas = (l for l in linhas_da_faixa(resposta["Body"], inicio, fim) if l.strip())
+        parcial = _ler_faixa(linhas, cabecalho, usar_numpy, medicao)
+        resposta["Body"].close()
+        if not usar_numpy:
+            parcial["datas"] = array("q", [(data - EPOCA) // _SEGUNDO for data in parcial["datas"]])
+        enviar.send(("ok", parcial, medicao.contagens))
+    except Exception as erro:
+        enviar.send(("erro", f"{type(erro).__name__}: {erro}", {}))
+    finally:
+        enviar.close()
@@ -0,0 +1,93 @@
+import os
+import time
+
+# perfil sob demanda de uma invocação: cProfile + tracemalloc em volta do
+# handler. liga com ETL_PERFIL=1 (todas as invocações do container) ou com
+# "perfil": true no evento (só aquela). o resultado vai pra uma pasta local
+# ou pra s3://bucket/prefixo. cProfile, pstats e tracemalloc só são
+# importados quando uma invocação pede o perfil (são ~30 ms de cold start)
+ATIVO = os.environ.get("ETL_PERFIL", "0").lower() in ("1", "true", "sim")
+DESTINO = os.environ.get("ETL_PERFIL_DESTINO", "/tmp/perfil")
+
+# quantas linhas do resumo (funções mais caras e maiores alocações)
+TOP_FUNCOES = 40
+TOP_ALOCACOES = 25
+
+
+def pedido(evento):
+    if ATIVO:
+        return True
+    return isinstance(evento, dict) and str(evento.get("perfil", "")).lower() in ("1", "true", "sim")
+
+
+def executar(funcao, evento, contexto, obter_cliente=None, destino=None):
+    # roda funcao(evento, contexto) medindo tudo e grava os arquivos. o
+    # resultado da função volta igual; falha ao gravar o perfil só vira log
+    import cProfile
+    import tracemalloc
+
+    destino = destino or DESTINO
+    nome = _nome_base(contexto)
+
+    perfilador = cProfile.Profile()
+    tracemalloc.start()
+    perfilador.enable()
+    try:
+        return funcao(evento, contexto)
+    finally:
+        perfilador.disable()
+        instantaneo = tracemalloc.take_snapshot()
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        try:
+            arquivos = _gravar(perfilador, instantaneo, pico, destino, nome, obter_cliente)
+            print(f"[ETL] Perfil gravado: {', '.join(arquivos)}")
+        except Exception as erro:
+            print("[ETL] Não deu pra gravar o perfil:", erro)
+
+
+def _nome_base(contexto):
+    id_requisicao = getattr(contexto, "aws_request_id", None) or f"local-{os.getpid()}"
+    return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{id_requisicao}"
+
+
+def _gravar(perfilador, instantaneo, pico, destino, nome, obter_cliente):
+    # .pstats (abre com pstats/snakeviz) e um .txt legível com as funções
+    # mais caras e os lugares que mais alocaram. o .pstats é o mesmo
+    # conteúdo do dump_stats, sem passar por arquivo temporário
+    import io
+    import marshal
+    import pstats
+
+    perfilador.create_stats()
+    bytes_stats = marshal.dumps(perfilador.stats)
+
+    texto = io.StringIO()
+    texto.write(f"# funções por tempo acumulado (top {TOP_FUNCOES})\n")
+    pstats.Stats(perfilador, stream=texto).sort_stats("cumulative").print_stats(TOP_FUNCOES)
+    texto.write(f"\n# alocações ainda vivas no fim, por linha (top {TOP_ALOCACOES}), pico {pico / 1024 / 1024:.1f} MiB\n")
+    for estatistica in instantaneo.statistics("lineno")[:TOP_ALOCACOES]:
+        quadro = estatistica.traceback[0]
+        texto.write(f"{estatistica.size / 1024:10.1f} KiB {estatistica.count:8} blocos  {quadro.filename}:{quadro.lineno}\n")
+    bytes_resumo = texto.getvalue().encode("utf-8")
+
+    arquivos = {f"{nome}.pstats": bytes_stats, f"{nome}-resumo.txt": bytes_resumo}
+    if destino.startswith("s3://"):
+        balde, _, prefixo = destino[len("s3://"):].partition("/")
+        prefixo = prefixo.strip("/")
+        cliente = obter_cliente()
+        gravados = []
+        for arquivo, corpo in arquivos.items():
+            chave = f"{prefixo}/{arquivo}" if prefixo else arquivo
+            cliente.put_object(Bucket=balde, Key=chave, Body=corpo)
+            gravados.append(f"s3://{balde}/{chave}")
+        return gravados
+
+    os.makedirs(destino, exist_ok=True)
+    gravados = []
+    for arquivo, corpo in arquivos.items():
+        caminho = os.path.join(destino, arquivo)
+        with open(caminho, "wb") as saida:
+            saida.write(corpo)
+        gravados.append(caminho)
+    return gravados
@@ -0,0 +1,308 @@
+import json
+import math
+import os
+from datetime import date, timedelta
+
+import frota
+import quantis
+
+# resumos por hora, dia e semana de cada máquina, pra gráficos de 30/90
+# dias sem reprocessar CSV. cada arquivo de origem grava os baldes de hora
+# dos dias dele; o dia sai da junção das horas (de todos os arquivos do
+# dia) e a semana da junção dos dias, nunca relendo linhas:
+#
+#   {prefixo}/hora/AAAA-MM-DD/{origem}.json   24 baldes, um objeto por arquivo
+#   {prefixo}/dia/AAAA-MM.json                um balde por dia do mês
+#   {prefixo}/semana/AAAA.json                um balde por semana ISO do ano
+#
+# um gráfico de 90 dias por dia são 3 ou 4 GETs. cada balde tem n, min,
+# max, soma e p50 por métrica (mais o esboço KLL que deixa juntar) e a
+# média da prob_falha. o p50 da hora é exato; o do dia e da semana vem do
+# esboço. só o que mudou é regravado: objeto de hora igual ao do bucket
+# (pelo ETag da listagem), dia igual ao do mês, semana só quando algum dia
+# dela mudou. mesmo assim são umas 5 chamadas ao S3 por dia do arquivo,
+# então é opcional: ETL_PIRAMIDE=1 liga (padrão desligado)
+PREFIXO_PIRAMIDE = "pedro-client/_piramide"
+VERSAO_PIRAMIDE = 1
+ATIVO = os.environ.get("ETL_PIRAMIDE", "0").lower() in ("1", "true", "sim")
+
+# esboço menor que o dos quantis semanais (são 4 por balde e até 53
+# baldes por objeto): ~1,2 KiB por métrica e erro de rank abaixo de 2% no
+# p50 de um dia ou semana juntados de horas (bench/bench_piramide.py; com
+# k=32 o objeto cai pela metade e o erro vai a ~4%)
+K = int(os.environ.get("ETL_PIRAMIDE_K", "64"))
+ERRO_RANK = 0.02
+
+METRICAS = quantis.METRICAS
+NIVEIS = ("hora", "dia", "semana")
+
+
+def _prefixo(empresa, maquina_id):
+    return f"{PREFIXO_PIRAMIDE}/{empresa}/{maquina_id}"
+
+
+def chave_horas(empresa, maquina_id, dia, chave_origem):
+    # a origem vira parte do nome, igual aos esboços dos quantis
+    origem = "_".join(chave_origem.split("/")[2:])
+    return f"{_prefixo(empresa, maquina_id)}/hora/{dia:%Y-%m-%d}/{origem}.json"
+
+
+def chave_dias(empresa, maquina_id, mes):
+    return f"{_prefixo(empresa, maquina_id)}/dia/{mes}.json"
+
+
+def chave_semanas(empresa, maquina_id, ano):
+    return f"{_prefixo(empresa, maquina_id)}/semana/{ano}.json"
+
+
+def balde_linhas(valores):
+    # balde de uma hora a partir das colunas (array("d"), lista ou numpy).
+    # tudo em float do python e fsum (que não depende da ordem), então os
+    # dois motores geram o mesmo balde
+    colunas = {nome: _lista(v) for nome, v in valores.items()}
+    n = len(colunas["cpu"])
+    balde = {"n": n}
+    for m in METRICAS:
+        v = colunas[m]
+        balde[m] = {
+            "min": min(v),
+            "max": max(v),
+            "soma": math.fsum(v),
+            "p50": _mediana(v),
+            "esboco": quantis.EsbocoQuantis(K).adicionar(v).para_dict(),
+        }
+    soma_prob = math.fsum(colunas["prob_falha"])
+    balde["prob_falha"] = {"soma": soma_prob, "media": soma_prob / n}
+    return balde
+
+
+def juntar_baldes(baldes):
+    # baldes sempre na mesma ordem: o sorteio do esboço é fixo, então a
+    # mesma junção dá sempre o mesmo balde
+    n = sum(b["n"] for b in baldes)
+    resultado = {"n": n}
+    for m in METRICAS:
+        esboco = quantis.EsbocoQuantis(K)
+        for b in baldes:
+            esboco.juntar(quantis.EsbocoQuantis.de_dict(b[m]["esboco"]))
+        resultado[m] = {
+            "min": min(b[m]["min"] for b in baldes),
+            "max": max(b[m]["max"] for b in baldes),
+            "soma": math.fsum(b[m]["soma"] for b in baldes),
+            "p50": esboco.quantil(0.5),
+            "esboco": esboco.para_dict(),
+        }
+    soma_prob = math.fsum(b["prob_falha"]["soma"] for b in baldes)
+    resultado["prob_falha"] = {"soma": soma_prob, "media": soma_prob / n}
+    return resultado
+
+
+def atualizar(cliente, balde, empresa, maquina_id, chave_origem, horas):
+    # horas: [(início da hora, balde)] em ordem, de dias inteiros (os
+    # motores montam os baldes com balde_linhas; o modo incremental junta
+    # os do checkpoint). grava as horas de cada dia do arquivo e refaz só
+    # os dias e semanas que eles tocam. devolve os dias gravados
+    import hashlib
+
+    por_dia = {}
+    for hora, balde_hora in horas:
+        por_dia.setdefault(hora.date(), {})[f"{hora.hour:02d}"] = balde_hora
+
+    gravados = {}
+    listados = {}
+    for dia, baldes in por_dia.items():
+        chave = chave_horas(empresa, maquina_id, dia, chave_origem)
+        objeto = {"versao": VERSAO_PIRAMIDE, "dia": f"{dia:%Y-%m-%d}", "origem": chave_origem, "horas": baldes}
+        corpo = json.dumps(objeto, separators=(",", ":"))
+        gravados[chave] = objeto
+        # a listagem do dia serve pra junção logo abaixo e, pelo ETag (MD5
+        # do objeto), diz se as horas desse arquivo já estão lá iguais
+        listados[dia] = _listar_horas(cliente, balde, empresa, maquina_id, dia)
+        if listados[dia].get(chave) == f'"{hashlib.md5(corpo.encode("utf-8")).hexdigest()}"':
+            continue
+        cliente.put_object(Bucket=balde, Key=chave, Body=corpo, ContentType="application/json")
+        listados[dia][chave] = None
+
+    meses = {}
+    for dia in por_dia:
+        meses.setdefault(f"{dia:%Y-%m}", []).append(dia)
+
+    # a semana lê os dias já gravados, então os meses vão antes; e só as
+    # semanas com algum dia que mudou são refeitas
+    semanas = {}
+    dias_gravados = {}
+    for mes, dias in sorted(meses.items()):
+        mudaram, dias_gravados[mes] = _atualizar_dias(
+            cliente, balde, empresa, maquina_id, mes, sorted(dias), gravados, listados
+        )
+        for dia in mudaram:
+            ano, semana, _ = dia.isocalendar()
+            semanas.setdefault(ano, set()).add(semana)
+    for ano, lista in sorted(semanas.items()):
+        _atualizar_semanas(cliente, balde, empresa, maquina_id, ano, sorted(lista), dias_gravados)
+    return sorted(por_dia)
+
+
+def consultar(cliente, balde, empresa, maquina_id, nivel, inicio, fim):
+    # baldes de inicio a fim (date, inclusive) num nível, em ordem:
+    # [(rótulo, balde)]. "dia" lê um objeto por mês e "semana" um por ano;
+    # "hora" lê os arquivos de cada dia e junta a mesma hora de arquivos
+    # diferentes (serve pra janelas curtas)
+    if nivel == "dia":
+        resultado = []
+        for mes in sorted({f"{inicio + timedelta(days=d):%Y-%m}" for d in range((fim - inicio).days + 1)}):
+            dias = _ler(cliente, balde, chave_dias(empresa, maquina_id, mes), _vazio_dias(mes))["dias"]
+            resultado += [(r, b) for r, b in dias.items() if f"{inicio:%Y-%m-%d}" <= r <= f"{fim:%Y-%m-%d}"]
+        return resultado
+
+    if nivel == "semana":
+        primeira = _rotulo_semana(inicio)
+        ultima = _rotulo_semana(fim)
+        resultado = []
+        for ano in range(inicio.isocalendar()[0], fim.isocalendar()[0] + 1):
+            semanas = _ler(cliente, balde, chave_semanas(empresa, maquina_id, ano), _vazio_semanas(ano))["semanas"]
+            resultado += [(r, b) for r, b in semanas.items() if primeira <= r <= ultima]
+        return resultado
+
+    if nivel == "hora":
+        resultado = []
+        for d in range((fim - inicio).days + 1):
+            dia = inicio + timedelta(days=d)
+            por_hora = {}
+            chaves = _listar_horas(cliente, balde, empresa, maquina_id, dia)
+            for objeto in _horas_do_dia(cliente, balde, empresa, maquina_id, dia, {}, chaves):
+                for hora, b in objeto["horas"].items():
+                    por_hora.setdefault(hora, []).append(b)
+            resultado += [
+                (f"{dia:%Y-%m-%d}T{hora}", b[0] if len(b) == 1 else juntar_baldes(b))
+                for hora, b in sorted(por_hora.items())
+            ]
+        return resultado
+
+    raise ValueError(f"nível desconhecido: {nivel} (use {', '.join(NIVEIS)})")
+
+
+def _atualizar_dias(cliente, balde, empresa, maquina_id, mes, dias, gravados, listados):
+    # o dia é refeito com as horas de todos os arquivos dele. a primeira
+    # tentativa usa a listagem que o atualizar já fez; se outro arquivo do
+    # mesmo dia gravou no meio, a escrita condicional falha e a nova
+    # tentativa lista de novo e já enxerga as horas dele. devolve (dias que
+    # mudaram, dias do mês como ficaram gravados)
+    tentativas = []
+    mudaram = []
+
+    def alterar(objeto):
+        listagens = listados if not tentativas else {}
+        tentativas.append(objeto)
+        mudaram.clear()
+        for dia in dias:
+            chaves = listagens.get(dia) or _listar_horas(cliente, balde, empresa, maquina_id, dia)
+            baldes = [
+                b
+                for horas in _horas_do_dia(cliente, balde, empresa, maquina_id, dia, gravados, chaves)
+                for _, b in sorted(horas["horas"].items())
+            ]
+            novo = juntar_baldes(baldes)
+            rotulo = f"{dia:%Y-%m-%d}"
+            if objeto["dias"].get(rotulo) != novo:
+                objeto["dias"][rotulo] = novo
+                mudaram.append(dia)
+        objeto["dias"] = dict(sorted(objeto["dias"].items()))
+        return bool(mudaram)
+
+    frota.atualizar_condicional(
+        cliente, balde, chave_dias(empresa, maquina_id, mes), lambda: _vazio_dias(mes), alterar
+    )
+    return list(mudaram), tentativas[-1]["dias"]
+
+
+def _atualizar_semanas(cliente, balde, empresa, maquina_id, ano, semanas, dias_gravados):
+    # mesma ideia um nível acima (uma semana pode pegar dois meses). a
+    # primeira tentativa aproveita os meses que acabaram de ser gravados;
+    # as outras leem tudo de novo
+    tentativas = []
+
+    def alterar(objeto):
+        meses = dict(dias_gravados) if not tentativas else {}
+        tentativas.append(objeto)
+        mudou = False
+        for semana in semanas:
+            baldes = []
+            segunda = date.fromisocalendar(ano, semana, 1)
+            for d in range(7):
+                dia = segunda + timedelta(days=d)
+                mes = f"{dia:%Y-%m}"
+                if mes not in meses:
+                    meses[mes] = _ler(cliente, balde, chave_dias(empresa, maquina_id, mes), _vazio_dias(mes))["dias"]
+                if f"{dia:%Y-%m-%d}" in meses[mes]:
+                    baldes.append(meses[mes][f"{dia:%Y-%m-%d}"])
+            novo = juntar_baldes(baldes)
+            rotulo = f"{ano}-W{semana:02d}"
+            if objeto["semanas"].get(rotulo) != novo:
+                objeto["semanas"][rotulo] = novo
+                mudou = True
+        objeto["semanas"] = dict(sorted(objeto["semanas"].items()))
+        return mudou
+
+    frota.atualizar_condicional(
+        cliente, balde, chave_semanas(empresa, maquina_id, ano), lambda: _vazio_semanas(ano), alterar
+    )
+
+
+def _listar_horas(cliente, balde, empresa, maquina_id, dia):
+    # {chave: ETag} dos objetos de hora do dia
+    parametros = {"Bucket": balde, "Prefix": f"{_prefixo(empresa, maquina_id)}/hora/{dia:%Y-%m-%d}/"}
+    chaves = {}
+    while True:
+        resposta = cliente.list_objects_v2(**parametros)
+        for objeto in resposta.get("Contents", []):
+            chaves[objeto["Key"]] = objeto.get("ETag")
+        if not resposta.get("IsTruncated"):
+            return chaves
+        parametros["ContinuationToken"] = resposta["NextContinuationToken"]
+
+
+def _horas_do_dia(cliente, balde, empresa, maquina_id, dia, gravados, chaves):
+    # objetos de hora de todos os arquivos do dia (chaves da listagem),
+    # ordenados pela chave. o que acabou de ser gravado entra direto, sem GET
+    prefixo = f"{_prefixo(empresa, maquina_id)}/hora/{dia:%Y-%m-%d}/"
+    chaves = set(chaves) | set(c for c in gravados if c.startswith(prefixo))
+    objetos = []
+    for chave in sorted(chaves):
+        objeto = gravados.get(chave)
+        if objeto is None:
+            objeto = json.loads(cliente.get_object(Bucket=balde, Key=chave)["Body"].read())
+            if objeto.get("versao") != VERSAO_PIRAMIDE:
+                continue
+        objetos.append(objeto)
+    return objetos
+
+
+def _ler(cliente, balde, chave, vazio):
+    return frota._carregar(cliente, balde, chave, lambda: vazio)[0]
+
+
+def _vazio_dias(mes):
+    return {"versao": VERSAO_PIRAMIDE, "nivel": "dia", "periodo": mes, "dias": {}}
+
+
+def _vazio_semanas(ano):
+    return {"versao": VERSAO_PIRAMIDE, "nivel": "semana", "periodo": str(ano), "semanas": {}}
+
+
+def _rotulo_semana(dia):
+    ano, semana, _ = dia.isocalendar()
+    return f"{ano}-W{semana:02d}"
+
+
+def _mediana(valores):
+    ordenados = sorted(valores)
+    meio = len(ordenados) // 2
+    if len(ordenados) % 2:
+        return float(ordenados[meio])
+    return (ordenados[meio - 1] + ordenados[meio]) / 2
+
+
+def _lista(valores):
+    # aceita array("d"), lista ou array do numpy
+    return valores.tolist() if hasattr(valores, "tolist") else list(valores)
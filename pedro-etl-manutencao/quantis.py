@@ -0,0 +1,225 @@
+import json
+import math
+import random
+from bisect import bisect_right
+from datetime import timedelta
+
+# esboços de quantis por dia, ao lado dos JSONs de saída. um objeto por
+# (dia, arquivo de origem): um dia pode ter mais de um CSV no trusted
+PREFIXO_QUANTIS = "pedro-client/_quantis"
+VERSAO_ESBOCO = 1
+
+METRICAS = ("cpu", "ram", "disco", "temp")
+PERCENTIS = {"p50": 0.5, "p90": 0.9, "p95": 0.95, "p99": 0.99}
+
+# tamanho do esboço (KLL). com k=200 o esboço guarda no máximo ~3*k valores
+# por métrica (constante, não importa quantas linhas o dia teve) e o erro
+# de rank fica abaixo de ~1,7% com 99% de confiança: o p50 devolvido está
+# entre os valores que seriam os quantis 0,483 e 0,517 exatos. se o dia (ou
+# a semana juntada) tem até k valores, o esboço ainda não compactou nada e
+# o resultado é exato. bench/bench_quantis.py mede o erro de verdade
+K = 200
+FATOR = 2 / 3
+ERRO_RANK = 0.017
+
+
+class EsbocoQuantis:
+    # KLL: níveis de valores, cada valor do nível h vale 2^h linhas. quando
+    # um nível enche, ele é ordenado e metade dos valores (pares ou ímpares,
+    # sorteado) sobe pro nível de cima. juntar dois esboços é concatenar os
+    # níveis e compactar de novo, então dá pra somar dias à vontade
+
+    def __init__(self, k=K, semente=0):
+        self.k = k
+        self.niveis = [[]]
+        self.n = 0
+        self.minimo = math.inf
+        self.maximo = -math.inf
+        # sorteio com semente fixa: o mesmo CSV gera sempre o mesmo esboço
+        self._aleatorio = random.Random(semente)
+
+    def adicionar(self, valores):
+        valores = list(valores)
+        if not valores:
+            return self
+        self.n += len(valores)
+        self.minimo = min(self.minimo, min(valores))
+        self.maximo = max(self.maximo, max(valores))
+        self.niveis[0].extend(valores)
+        self._compactar()
+        return self
+
+    def juntar(self, outro):
+        if outro.n == 0:
+            return self
+        while len(self.niveis) < len(outro.niveis):
+            self.niveis.append([])
+        for nivel, valores in zip(self.niveis, outro.niveis):
+            nivel.extend(valores)
+        self.n += outro.n
+        self.minimo = min(self.minimo, outro.minimo)
+        self.maximo = max(self.maximo, outro.maximo)
+        self._compactar()
+        return self
+
+    def quantil(self, q):
+        # mesma interpolação do statistics.median / numpy (posição q*(n-1)),
+        # só que sobre os valores pesados do esboço
+        if self.n == 0:
+            return 0.0
+        pares = sorted((v, 1 << h) for h, nivel in enumerate(self.niveis) for v in nivel)
+        valores = [v for v, _ in pares]
+        acumulado = []
+        total = 0
+        for _, peso in pares:
+            total += peso
+            acumulado.append(total)
+
+        posicao = q * (total - 1)
+        baixo = math.floor(posicao)
+        fracao = posicao - baixo
+        v_baixo = valores[bisect_right(acumulado, baixo)]
+        if fracao == 0:
+            valor = v_baixo
+        else:
+            v_alto = valores[bisect_right(acumulado, baixo + 1)]
+            valor = v_baixo + (v_alto - v_baixo) * fracao
+        return float(min(self.maximo, max(self.minimo, valor)))
+
+    def para_dict(self):
+        return {
+            "k": self.k,
+            "n": self.n,
+            "min": self.minimo,
+            "max": self.maximo,
+            "niveis": self.niveis,
+        }
+
+    @classmethod
+    def de_dict(cls, dados):
+        esboco = cls(dados["k"])
+        esboco.n = dados["n"]
+        esboco.minimo = dados["min"]
+        esboco.maximo = dados["max"]
+        esboco.niveis = [list(nivel) for nivel in dados["niveis"]] or [[]]
+        return esboco
+
+    def _capacidade(self, h):
+        # níveis mais altos (valores mais pesados) guardam mais
+        return max(2, math.ceil(self.k * FATOR ** (len(self.niveis) - 1 - h)))
+
+    def _capacidade_total(self):
+        return sum(self._capacidade(h) for h in range(len(self.niveis)))
+
+    def _compactar(self):
+        while sum(len(nivel) for nivel in self.niveis) >= self._capacidade_total():
+            for h in range(len(self.niveis)):
+                nivel = self.niveis[h]
+                if len(nivel) < self._capacidade(h):
+                    continue
+                if h + 1 == len(self.niveis):
+                    self.niveis.append([])
+                nivel.sort()
+                # com tamanho ímpar o maior fica no nível (o peso total não muda)
+                sobra = nivel[-1:] if len(nivel) % 2 else []
+                pares = nivel[:len(nivel) - len(sobra)]
+                self.niveis[h + 1].extend(pares[self._aleatorio.randint(0, 1)::2])
+                self.niveis[h] = sobra
+                break
+
+
+def nome_origem(chave_origem):
+    # a origem vira parte do nome: data/arquivo.csv -> data_arquivo.csv
+    return "_".join(chave_origem.split("/")[2:])
+
+
+def chave_esboco(empresa, maquina_id, dia, chave_origem):
+    return f"{PREFIXO_QUANTIS}/{empresa}/{maquina_id}/{dia.strftime('%Y-%m-%d')}/{nome_origem(chave_origem)}.json"
+
+
+def esbocos_do_dia(valores_por_metrica):
+    return {m: EsbocoQuantis().adicionar(_lista(valores_por_metrica[m])) for m in METRICAS}
+
+
+def salvar_dias(cliente, balde, empresa, maquina_id, chave_origem, dias_semana):
+    # um objeto por dia do arquivo que cai na janela semanal. devolve os
+    # esboços por chave pra não precisar ler de volta o que acabou de gravar
+    salvos = {}
+    for dia, valores in dias_semana:
+        esbocos = esbocos_do_dia(valores)
+        chave = chave_esboco(empresa, maquina_id, dia, chave_origem)
+        cliente.put_object(
+            Bucket=balde,
+            Key=chave,
+            Body=json.dumps({
+                "versao": VERSAO_ESBOCO,
+                "dia": dia.strftime("%Y-%m-%d"),
+                "origem": chave_origem,
+                "metricas": {m: e.para_dict() for m, e in esbocos.items()},
+            }, separators=(",", ":")),
+            ContentType="application/json",
+        )
+        salvos[chave] = esbocos
+    return salvos
+
+
+def semanais(cliente, balde, empresa, maquina_id, data_maxima, salvos):
+    # junta os esboços dos 7 dias que terminam no dia da data_maxima (o
+    # mesmo recorte do historico_7d), de todos os arquivos de cada dia.
+    # "origens" diz de quais arquivos (nome_origem) vieram os esboços
+    ultimo_dia = data_maxima.date()
+    primeiro_dia = ultimo_dia - timedelta(days=6)
+    chaves = list(_listar_chaves(cliente, balde, empresa, maquina_id, primeiro_dia, ultimo_dia))
+    # o que acabou de ser gravado entra direto, sem depender da listagem
+    chaves += [c for c in salvos if c not in chaves]
+
+    juntos = {m: EsbocoQuantis() for m in METRICAS}
+    dias = set()
+    origens = set()
+    for chave in chaves:
+        esbocos = salvos.get(chave)
+        if esbocos is None:
+            dados = json.loads(cliente.get_object(Bucket=balde, Key=chave)["Body"].read())
+            if dados.get("versao") != VERSAO_ESBOCO:
+                continue
+            esbocos = {m: EsbocoQuantis.de_dict(dados["metricas"][m]) for m in METRICAS}
+        for m in METRICAS:
+            juntos[m].juntar(esbocos[m])
+        dias.add(chave.split("/")[-2])
+        origens.add(chave.split("/")[-1][:-len(".json")])
+
+    resultado = {
+        "dias": sorted(dias),
+        "origens": sorted(origens),
+        "erro_rank": ERRO_RANK,
+    }
+    for m in METRICAS:
+        resultado[m] = {nome: juntos[m].quantil(q) for nome, q in PERCENTIS.items()}
+    return resultado
+
+
+def _listar_chaves(cliente, balde, empresa, maquina_id, primeiro_dia, ultimo_dia):
+    # as chaves são ordenadas por dia, então a listagem começa no primeiro
+    # dia da janela e para no primeiro dia depois dela
+    prefixo = f"{PREFIXO_QUANTIS}/{empresa}/{maquina_id}/"
+    limite = ultimo_dia.strftime("%Y-%m-%d")
+    parametros = {
+        "Bucket": balde,
+        "Prefix": prefixo,
+        "StartAfter": prefixo + primeiro_dia.strftime("%Y-%m-%d"),
+    }
+    while True:
+        resposta = cliente.list_objects_v2(**parametros)
+        for objeto in resposta.get("Contents", []):
+            chave = objeto["Key"]
+            if chave[len(prefixo):].split("/")[0] > limite:
+                return
+            yield chave
+        if not resposta.get("IsTruncated"):
+            return
+        parametros["ContinuationToken"] = resposta["NextContinuationToken"]
+
+
+def _lista(valores):
+    # aceita array("d"), lista ou array do numpy
+    return valores.tolist() if hasattr(valores, "tolist") else list(valores)
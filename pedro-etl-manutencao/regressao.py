@@ -0,0 +1,80 @@
+from bisect import bisect_left
+from itertools import accumulate
+
+# regressão da probabilidade de falha contra o tempo de verdade (não contra
+# o índice da linha): o resultado não depende da frequência de coleta. as
+# janelas e projeções contam a partir da data_maxima do CSV
+HORIZONTES = {"1h": 3600, "24h": 24 * 3600, "7d": 7 * 24 * 3600}
+PROJECOES = {"+1h": 3600, "+24h": 24 * 3600, "+7d": 7 * 24 * 3600}
+
+# mesmo limiar da regressao_risco (0,5 por passo), com o passo sendo 1 hora
+LIMIAR_TENDENCIA = 0.5
+
+
+def somas_janelas(segundos, probs):
+    # segundos: tempo de cada linha relativo à data_maxima (<= 0, ordenado)
+    # probs: prob_falha inteira de cada linha. com as somas acumuladas
+    # (uma passada), cada janela sai por busca binária + subtração.
+    # tudo em int do python: as somas são exatas e batem entre os motores
+    prefixo_t = list(accumulate(segundos, initial=0))
+    prefixo_p = list(accumulate(probs, initial=0))
+    prefixo_tt = list(accumulate((t * t for t in segundos), initial=0))
+    prefixo_tp = list(accumulate((t * p for t, p in zip(segundos, probs)), initial=0))
+    total = len(segundos)
+
+    somas = {}
+    for nome, duracao in HORIZONTES.items():
+        i = bisect_left(segundos, -duracao)
+        somas[nome] = {
+            "n": total - i,
+            "soma_t": prefixo_t[total] - prefixo_t[i],
+            "soma_p": prefixo_p[total] - prefixo_p[i],
+            "soma_tt": prefixo_tt[total] - prefixo_tt[i],
+            "soma_tp": prefixo_tp[total] - prefixo_tp[i],
+        }
+    return somas
+
+
+def por_tempo(somas):
+    return {nome: _ajustar(**somas[nome]) for nome in HORIZONTES}
+
+
+def _ajustar(n, soma_t, soma_p, soma_tt, soma_tp):
+    if n == 0:
+        return {
+            "n": 0,
+            "inclinacao_por_hora": 0.0,
+            "tendencia": "estavel",
+            "prob_atual": 0.0,
+            "projecoes": {nome: 0.0 for nome in PROJECOES},
+        }
+
+    denominador = n * soma_tt - soma_t * soma_t
+    if denominador == 0:
+        # uma linha só (ou todas no mesmo segundo): sem inclinação
+        inclinacao = 0.0
+        intercepto = soma_p / n
+    else:
+        inclinacao = (n * soma_tp - soma_t * soma_p) / denominador
+        intercepto = (soma_p - inclinacao * soma_t) / n
+
+    por_hora = inclinacao * 3600
+    if por_hora > LIMIAR_TENDENCIA:
+        tendencia = "subindo"
+    elif por_hora < -LIMIAR_TENDENCIA:
+        tendencia = "descendo"
+    else:
+        tendencia = "estavel"
+
+    # t = 0 é a data_maxima; as projeções são tempo de relógio pra frente
+    return {
+        "n": n,
+        "inclinacao_por_hora": float(por_hora),
+        "tendencia": tendencia,
+        "prob_atual": _limitar(intercepto),
+        "projecoes": {nome: _limitar(intercepto + inclinacao * segundos) for nome, segundos in PROJECOES.items()},
+    }
+
+
+def _limitar(valor):
+    return max(0.0, min(99.0, float(valor)))
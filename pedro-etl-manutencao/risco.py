@@ -0,0 +1,238 @@
+import math
+
+import colunar
+
+# regras do modelo heurístico e do estado da UI. as mesmas regras existem
+# em duas formas: por máquina (o que o index usa a cada CSV) e pra frota
+# inteira de uma vez, com numpy (pra reavaliar todas as máquinas quando um
+# limiar muda, sem reprocessar os CSVs). as duas dão o mesmo resultado;
+# bench/bench_risco.py confere isso com valores sorteados
+LIMIARES = {
+    # estado da UI
+    "ui_critico_cpu": 90,
+    "ui_critico_ram": 90,
+    "ui_critico_temp": 75,
+    "ui_alerta_cpu": 70,
+    "ui_alerta_ram": 70,
+    # mensagem de erro (a primeira que bater)
+    "msg_cpu": 80,
+    "msg_ram": 80,
+    "msg_disco": 90,
+    "msg_temp": 75,
+    # modelo heurístico
+    "prob_imediata": 80,
+    "prob_7_dias": 60,
+    "prob_15_dias": 40,
+    "temp_estresse_termico": 80,
+    "estresse_software": 85,
+}
+
+# campos que saem da avaliação da frota: os do risk_model e os da ui
+CAMPOS_MODELO = ("prob", "stress", "days", "cause", "rec", "riskLevel")
+CAMPOS_UI = ("severity", "color", "icon", "title", "message", "action")
+
+_UI_INFO = {
+    "severity": "INFO",
+    "color": "green",
+    "icon": "check-circle",
+    "title": "Operação Normal",
+    "message": "Monitoramento ativo. Parâmetros estáveis.",
+    "action": "Nenhuma ação necessária",
+}
+_UI_CRITICO = {
+    "severity": "CRITICO",
+    "color": "red",
+    "icon": "alert-triangle",
+    "action": "Intervenção Imediata / Reboot Forçado",
+}
+_UI_ALERTA = {
+    "severity": "ALERTA",
+    "color": "yellow",
+    "icon": "alert-circle",
+    "title": "Atenção Requerida",
+    "action": "Verificar processos ou limpar cache",
+}
+
+_MENSAGENS = (
+    ("cpu", "msg_cpu", "Uso de processador extremamente alto."),
+    ("ram", "msg_ram", "Memória RAM no limite."),
+    ("disk", "msg_disco", "Disco quase cheio. Risco de travamento."),
+    ("temp", "msg_temp", "Temperatura está muito alta!."),
+)
+_MENSAGEM_PADRAO = "Hardware com valores elevados."
+
+
+def montar_ui_state(metricas, maquina_id, limiares=LIMIARES):
+    situacao = metricas["situacao"]
+    cpu = metricas["cpu"]
+    ram = metricas["ram"]
+    temp = metricas["temp"]
+
+    estado_ui = dict(_UI_INFO)
+
+    if (
+        situacao == "Critico"
+        or cpu > limiares["ui_critico_cpu"]
+        or ram > limiares["ui_critico_ram"]
+        or temp > limiares["ui_critico_temp"]
+    ):
+        estado_ui = dict(_UI_CRITICO, title=f"Falha Crítica em {maquina_id}")
+        estado_ui["message"] = determinar_mensagem_erro(metricas, limiares)
+    elif situacao == "Alerta" or cpu > limiares["ui_alerta_cpu"] or ram > limiares["ui_alerta_ram"]:
+        estado_ui = dict(_UI_ALERTA)
+        estado_ui["message"] = determinar_mensagem_erro(metricas, limiares)
+
+    # mesma ordem de chaves de sempre no JSON
+    return {campo: estado_ui[campo] for campo in CAMPOS_UI}
+
+
+def determinar_mensagem_erro(metricas, limiares=LIMIARES):
+    for campo, limiar, mensagem in _MENSAGENS:
+        if metricas[campo] > limiares[limiar]:
+            return mensagem
+    return _MENSAGEM_PADRAO
+
+
+def calcular_modelo_heuristico(metricas, limiares=LIMIARES):
+    cpu = metricas["cpu"]
+    ram = metricas["ram"]
+    disco = metricas["disk"]
+    temp = metricas["temp"]
+    status = (metricas["situacao"] or "").lower()
+
+    pontuacao_hw = (temp * 0.7) + (disco * 0.3)
+    prob_falha = min(99, math.floor(pontuacao_hw))
+
+    pontuacao_sw = (cpu * 0.6) + (ram * 0.4)
+    nivel_estresse = math.floor(pontuacao_sw)
+
+    imediata = status == "critico" or prob_falha > limiares["prob_imediata"]
+
+    dias_manutencao = "45+ dias"
+    if imediata:
+        dias_manutencao = "IMEDIATA"
+    elif prob_falha > limiares["prob_7_dias"]:
+        dias_manutencao = "7 dias"
+    elif prob_falha > limiares["prob_15_dias"]:
+        dias_manutencao = "15 dias"
+
+    causa = "Desgaste Natural"
+    recomendacao = "Monitoramento Padrão"
+    nivel_risco = "low"
+
+    if imediata:
+        nivel_risco = "high"
+        if temp > limiares["temp_estresse_termico"]:
+            causa = "Estresse Térmico (Perigo)"
+            recomendacao = "Verificar Arrefecimento"
+        else:
+            causa = "Falha de Hardware Iminente"
+            recomendacao = "Agendar Troca de Player"
+    elif status == "alerta" or prob_falha > limiares["prob_7_dias"]:
+        nivel_risco = "medium"
+        causa = "Operação em Limite Térmico"
+        recomendacao = "Monitorar temperatura ambiente"
+    elif nivel_estresse > limiares["estresse_software"]:
+        causa = "Sobrecarga de Software"
+        recomendacao = "Reiniciar ou Otimizar Conteúdo"
+
+    return {
+        "prob": float(prob_falha),
+        "stress": float(nivel_estresse),
+        "days": dias_manutencao,
+        "cause": causa,
+        "rec": recomendacao,
+        "riskLevel": nivel_risco,
+    }
+
+
+def avaliar_frota(maquinas, cpu, ram, disco, temp, situacao, limiares=LIMIARES):
+    # as mesmas regras pra N máquinas de uma vez: cada regra vira uma
+    # máscara booleana e cada campo sai de um np.select com as máscaras na
+    # ordem dos if/elif (a primeira que bate ganha). devolve um dicionário
+    # campo -> array (CAMPOS_MODELO + CAMPOS_UI), na ordem de maquinas
+    if not colunar.disponivel():
+        raise RuntimeError("avaliar_frota precisa do numpy")
+    np = colunar.np
+
+    cpu = np.asarray(cpu, dtype=np.float64)
+    ram = np.asarray(ram, dtype=np.float64)
+    disco = np.asarray(disco, dtype=np.float64)
+    temp = np.asarray(temp, dtype=np.float64)
+    situacao = np.array(["" if s is None else s for s in situacao], dtype=str).reshape(cpu.shape)
+    maquinas = np.array([str(m) for m in maquinas], dtype=str).reshape(cpu.shape)
+
+    pontuacao_hw = (temp * 0.7) + (disco * 0.3)
+    pontuacao_sw = (cpu * 0.6) + (ram * 0.4)
+    # o math.floor da versão por máquina não aceita nan/inf: aqui também não
+    invalidas = ~(np.isfinite(pontuacao_hw) & np.isfinite(pontuacao_sw))
+    if invalidas.any():
+        raise ValueError(f"métricas não finitas na máquina {maquinas[invalidas][0]}")
+    prob_falha = np.minimum(99.0, np.floor(pontuacao_hw))
+    nivel_estresse = np.floor(pontuacao_sw)
+
+    # modelo heurístico
+    status = np.char.lower(situacao)
+    alto = (status == "critico") | (prob_falha > limiares["prob_imediata"])
+    medio = ~alto & ((status == "alerta") | (prob_falha > limiares["prob_7_dias"]))
+    sobrecarga = ~alto & ~medio & (nivel_estresse > limiares["estresse_software"])
+    termico = alto & (temp > limiares["temp_estresse_termico"])
+
+    resultado = {
+        "prob": prob_falha,
+        "stress": nivel_estresse,
+        "days": np.select(
+            [alto, prob_falha > limiares["prob_7_dias"], prob_falha > limiares["prob_15_dias"]],
+            ["IMEDIATA", "7 dias", "15 dias"],
+            "45+ dias",
+        ),
+        "cause": np.select(
+            [termico, alto, medio, sobrecarga],
+            ["Estresse Térmico (Perigo)", "Falha de Hardware Iminente", "Operação em Limite Térmico", "Sobrecarga de Software"],
+            "Desgaste Natural",
+        ),
+        "rec": np.select(
+            [termico, alto, medio, sobrecarga],
+            ["Verificar Arrefecimento", "Agendar Troca de Player", "Monitorar temperatura ambiente", "Reiniciar ou Otimizar Conteúdo"],
+            "Monitoramento Padrão",
+        ),
+        "riskLevel": np.select([alto, medio], ["high", "medium"], "low"),
+    }
+
+    # estado da UI
+    critico = (
+        (situacao == "Critico")
+        | (cpu > limiares["ui_critico_cpu"])
+        | (ram > limiares["ui_critico_ram"])
+        | (temp > limiares["ui_critico_temp"])
+    )
+    alerta = ~critico & (
+        (situacao == "Alerta") | (cpu > limiares["ui_alerta_cpu"]) | (ram > limiares["ui_alerta_ram"])
+    )
+    valores = {"cpu": cpu, "ram": ram, "disk": disco, "temp": temp}
+    mensagem = np.select(
+        [valores[campo] > limiares[limiar] for campo, limiar, _ in _MENSAGENS],
+        [texto for _, _, texto in _MENSAGENS],
+        _MENSAGEM_PADRAO,
+    )
+
+    for campo in CAMPOS_UI:
+        if campo == "title":
+            valor_critico = np.char.add("Falha Crítica em ", maquinas)
+        elif campo == "message":
+            valor_critico = mensagem
+        else:
+            valor_critico = _UI_CRITICO[campo]
+        valor_alerta = mensagem if campo == "message" else _UI_ALERTA[campo]
+        resultado[campo] = np.select([critico, alerta], [valor_critico, valor_alerta], _UI_INFO[campo])
+    return resultado
+
+
+def por_maquina(avaliacao, indice):
+    # (ui, risk_model) de uma máquina, no formato que o index grava
+    ui = {campo: str(avaliacao[campo][indice]) for campo in CAMPOS_UI}
+    modelo = {
+        campo: float(avaliacao[campo][indice]) if campo in ("prob", "stress") else str(avaliacao[campo][indice])
+        for campo in CAMPOS_MODELO
+    }
+    return ui, modelo
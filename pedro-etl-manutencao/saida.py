@@ -0,0 +1,66 @@
+import gzip
+import json
+import os
+
+# orjson e zstandard são opcionais (layer): sem eles fica o json da
+# biblioteca padrão e só gzip. importados só na primeira gravação
+orjson = None
+zstandard = None
+_opcionais_procurados = False
+
+# compacto (padrão) ou indentado, que é o formato antigo, bom pra debug
+FORMATO = os.environ.get("ETL_JSON", "compacto").lower()
+
+# nenhuma (padrão), gzip ou zstd. o S3 devolve o Content-Encoding junto e
+# quem lê (o Node) tem que descomprimir
+COMPRESSAO = os.environ.get("ETL_COMPRESSAO", "nenhuma").lower()
+NIVEL_GZIP = 6
+NIVEL_ZSTD = 3
+
+
+def serializar(objeto, formato=None, compressao=None):
+    # devolve os bytes e os parâmetros extras do put_object. o conteúdo do
+    # JSON é o mesmo em todos os modos, só muda espaço e compressão
+    formato = formato or FORMATO
+    compressao = compressao or COMPRESSAO
+    _importar_opcionais()
+
+    if formato == "indentado":
+        corpo = json.dumps(objeto, ensure_ascii=False, indent=2).encode("utf-8")
+    elif formato == "compacto":
+        if orjson is not None:
+            # orjson já sai em UTF-8 sem escapar acento, igual ao ensure_ascii=False
+            corpo = orjson.dumps(objeto)
+        else:
+            corpo = json.dumps(objeto, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    else:
+        raise ValueError(f"ETL_JSON inválido: {formato}")
+
+    extras = {"ContentType": "application/json"}
+    if compressao == "gzip":
+        # mtime=0: o mesmo JSON gera sempre os mesmos bytes
+        corpo = gzip.compress(corpo, compresslevel=NIVEL_GZIP, mtime=0)
+        extras["ContentEncoding"] = "gzip"
+    elif compressao == "zstd":
+        if zstandard is None:
+            raise RuntimeError("ETL_COMPRESSAO=zstd mas o zstandard não está instalado")
+        corpo = zstandard.ZstdCompressor(level=NIVEL_ZSTD).compress(corpo)
+        extras["ContentEncoding"] = "zstd"
+    elif compressao != "nenhuma":
+        raise ValueError(f"ETL_COMPRESSAO inválido: {compressao}")
+    return corpo, extras
+
+
+def _importar_opcionais():
+    global orjson, zstandard, _opcionais_procurados
+    if _opcionais_procurados:
+        return
+    try:
+        import orjson
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        pass
+    _opcionais_procurados = True
@@ -0,0 +1,41 @@
+import os
+
+# série em alta resolução das últimas horas pros gráficos do painel, com no
+# máximo PONTOS pontos por métrica. as linhas (em ordem de tempo) viram
+# PONTOS / 2 baldes do mesmo tamanho e de cada balde ficam o menor e o
+# maior valor: um pico nunca some e o JSON não cresce com o CSV. é min/max
+# e não LTTB porque só compara valores, sem conta de ponto flutuante, e os
+# dois motores escolhem exatamente os mesmos pontos (a versão numpy fica
+# no colunar). ETL_SERIE_PONTOS=0 (padrão) não gera a série
+PONTOS = int(os.environ.get("ETL_SERIE_PONTOS", "0"))
+JANELA_SEGUNDOS = int(float(os.environ.get("ETL_SERIE_HORAS", "24")) * 3600)
+
+COLUNAS = ("cpu", "ram", "disco", "temp", "prob_falha")
+
+
+def baldes(n):
+    # limites [i, f) de cada balde, tamanhos diferindo em no máximo 1
+    quantidade = max(1, PONTOS // 2)
+    return [(n * b // quantidade, n * (b + 1) // quantidade) for b in range(quantidade)]
+
+
+def reduzir(datas, colunas):
+    # motor python: datas ordenadas (datetime) e colunas array("d") alinhadas
+    n = len(datas)
+    resultado = {"janela_horas": JANELA_SEGUNDOS / 3600, "pontos_max": PONTOS}
+    for nome in COLUNAS:
+        valores = colunas[nome]
+        if n <= PONTOS:
+            indices = range(n)
+        else:
+            indices = []
+            for i, f in baldes(n):
+                # min/max devolvem o primeiro empatado, igual ao argmin/argmax
+                menor = min(range(i, f), key=valores.__getitem__)
+                maior = max(range(i, f), key=valores.__getitem__)
+                indices.extend(sorted({menor, maior}))
+        resultado[nome] = {
+            "t": [datas[i].strftime("%Y-%m-%dT%H:%M:%S") for i in indices],
+            "v": [float(valores[i]) for i in indices],
+        }
+    return resultado
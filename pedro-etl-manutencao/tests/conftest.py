@@ -0,0 +1,5 @@
+import os
+import sys
+
+# os módulos da lambda ficam soltos na raiz do pacote (sem instalação)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,73 @@
+import random
+from datetime import datetime, timedelta
+
+# CSVs pequenos e variados pros testes: os defeitos que aparecem no trusted
+# (linha curta, célula vazia ou com lixo, data inválida, colunas a mais),
+# os três layouts de cabeçalho e linhas fora de ordem
+CABECALHO = "maquina,timestamp,cpu,ram,disco,uptime,temperatura,indoor,situacao,latitude,longitude"
+CABECALHO_PV = "Timestamp;Situação;CPU;Memória;Disco;Temperatura;Latitude;Longitude;Uptime"
+INICIO = datetime(2025, 3, 1)
+
+
+def linhas(semente, quantidade, dias=3, intervalo=None, inicio=INICIO, quebradas=0.05, milissegundos=True,
+           formato="iso"):
+    # [(momento, colunas)] na ordem em que vão pro arquivo
+    aleatorio = random.Random(semente)
+    passo = intervalo or max(1, dias * 86400 // max(quantidade, 1))
+    resultado = []
+    for i in range(quantidade):
+        momento = inicio + timedelta(seconds=i * passo)
+        if formato == "br":
+            texto = momento.strftime("%d/%m/%Y %H:%M")
+        else:
+            texto = momento.strftime("%Y-%m-%d %H:%M:%S")
+            if milissegundos and aleatorio.random() < 0.3:
+                texto += f".{aleatorio.randint(0, 999):03d}"
+        temp = aleatorio.uniform(20, 95)
+        colunas = [
+            "M1", texto, f"{aleatorio.uniform(0, 100):.2f}", f"{aleatorio.uniform(0, 100):.1f}",
+            f"{aleatorio.uniform(10, 99):.3f}", str(aleatorio.randint(0, 99999)), f"{temp:.2f}", "sim",
+            "Critico" if temp >= 85 else "Alerta" if temp >= 70 else "Normal",
+            f"{aleatorio.uniform(-30, 0):.6f}", f"{aleatorio.uniform(-60, -40):.6f}",
+        ]
+        if quebradas and aleatorio.random() < quebradas:
+            colunas = _quebrar(colunas, aleatorio)
+        resultado.append((momento, colunas))
+    return resultado
+
+
+def csv(lista, formato="iso", embaralhar=None):
+    # formato: iso (vírgula), br (data dd/mm/aaaa) ou pv (; com vírgula decimal)
+    lista = list(lista)
+    if embaralhar is not None:
+        random.Random(embaralhar).shuffle(lista)
+    if formato == "pv":
+        saida = [CABECALHO_PV]
+        for _, c in lista:
+            if len(c) < 11:
+                saida.append(";".join(c))
+                continue
+            decimal = [v.replace(".", ",") for v in (c[2], c[3], c[4], c[6], c[9])]
+            saida.append(";".join([c[1], c[8], decimal[0], decimal[1], decimal[2], decimal[3], decimal[4], c[10], c[5]]))
+    else:
+        saida = [CABECALHO] + [",".join(c) for _, c in lista]
+    return ("\n".join(saida) + "\n").encode("utf-8")
+
+
+def _quebrar(colunas, aleatorio):
+    tipo = aleatorio.choice(("curta", "vazia", "lixo", "data", "data_inexistente", "larga", "espacos"))
+    if tipo == "curta":
+        return colunas[:aleatorio.randint(1, 7)]
+    if tipo == "vazia":
+        indice = aleatorio.choice((2, 3, 4, 6))
+        return colunas[:indice] + [""] + colunas[indice + 1:]
+    if tipo == "lixo":
+        indice = aleatorio.choice((2, 3, 4, 6))
+        return colunas[:indice] + [aleatorio.choice(("erro", "NaN?", "--", "1_0"))] + colunas[indice + 1:]
+    if tipo == "data":
+        return [colunas[0], aleatorio.choice(("", "n/a", "2025-13-45 99:99:99", "2025-3-1 10:00:00"))] + colunas[2:]
+    if tipo == "data_inexistente":
+        return [colunas[0], aleatorio.choice(("2025-02-30 10:00:00", "2025-03-01 24:00:00", "0000-01-01 00:00:00"))] + colunas[2:]
+    if tipo == "larga":
+        return colunas + ["extra"]
+    return [colunas[0], f" {colunas[1]} "] + [f" {c}" for c in colunas[2:]]
@@ -0,0 +1,22 @@
+import pytest
+
+import backfill
+import index
+
+boto3 = pytest.importorskip("boto3")
+
+
+def test_processo_nao_herda_o_cliente_s3_do_pai(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(index, "cliente_s3", None)
+    monkeypatch.setattr(index, "BALDE_DESTINO", index.BALDE_DESTINO)
+    monkeypatch.setattr(index, "FORCAR", index.FORCAR)
+    monkeypatch.setattr(boto3, "DEFAULT_SESSION", None)
+
+    # o pai lista com o cliente S3 dele antes do fork
+    pai, _, _, _ = backfill._montar_cliente("s3://trusted/Empresa01/", str(tmp_path))
+    sessao_pai = boto3.DEFAULT_SESSION
+
+    backfill._iniciar_processo("s3://trusted/Empresa01/", str(tmp_path), False)
+    assert index.cliente_s3.remoto is not pai.remoto
+    assert boto3.DEFAULT_SESSION is not sessao_pai
@@ -0,0 +1,48 @@
+import io
+import json
+
+import pytest
+
+import agregacao
+import colunar
+import gerador
+from leitura import iterar_linhas_dados
+
+pytestmark = pytest.mark.skipif(not colunar.disponivel(), reason="numpy não instalado")
+
+
+def agregados(conteudo):
+    # o mesmo CSV pelos dois motores, em JSON comparável (arrays viram
+    # listas, datas viram texto)
+    def converter(valor):
+        return valor.tolist() if hasattr(valor, "tolist") else str(valor)
+
+    resultado = []
+    for agregar in (agregacao.agregar_linhas, colunar.agregar):
+        cabecalho, linhas = iterar_linhas_dados(io.BytesIO(conteudo))
+        resultado.append(json.dumps(agregar(cabecalho, linhas), default=converter, sort_keys=True))
+    return resultado
+
+
+@pytest.mark.parametrize("semente", range(40))
+@pytest.mark.parametrize("formato", ["iso", "br", "pv"])
+def test_motores_iguais(semente, formato):
+    lista = gerador.linhas(semente, 200 + semente * 37, dias=1 + semente % 9, formato=formato)
+    conteudo = gerador.csv(lista, formato, embaralhar=semente if semente % 4 == 0 else None)
+    python, numpy = agregados(conteudo)
+    assert python == numpy
+
+
+@pytest.mark.parametrize("quebradas", [0.0, 0.001, 0.3, 1.0])
+def test_motores_iguais_lotes_grandes(quebradas, monkeypatch):
+    # mais de um lote e de um pedaço, com e sem célula quebrada
+    monkeypatch.setattr(colunar, "TAMANHO_LOTE", 3000)
+    lista = gerador.linhas(7, 10000, dias=2, quebradas=quebradas)
+    python, numpy = agregados(gerador.csv(lista))
+    assert python == numpy
+
+
+def test_so_cabecalho_e_sem_datas_validas():
+    assert len(set(agregados(b"maquina,timestamp,cpu,ram,disco,uptime,temperatura\n"))) == 1
+    sem_datas = gerador.CABECALHO + "\n" + "M1,n/a,1,2,3,4,5,sim,Normal,0,0\n" * 3
+    assert len(set(agregados(sem_datas.encode()))) == 1
@@ -0,0 +1,26 @@
+import threading
+
+from espelho import ClienteEspelho
+
+
+def test_threads_gravando_a_mesma_chave(tmp_path):
+    cliente = ClienteEspelho({"b": tmp_path})
+    erros = []
+
+    def gravar(i):
+        try:
+            for _ in range(100):
+                cliente.put_object(Bucket="b", Key="x/k.json", Body=str(i) * 1000)
+        except Exception as erro:
+            erros.append(erro)
+
+    threads = [threading.Thread(target=gravar, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert erros == []
+    corpo = cliente.get_object(Bucket="b", Key="x/k.json")["Body"].read().decode()
+    assert len(set(corpo)) == 1 and len(corpo) == 1000
+    assert [o["Key"] for o in cliente.list_objects_v2(Bucket="b", Prefix="x/")["Contents"]] == ["x/k.json"]
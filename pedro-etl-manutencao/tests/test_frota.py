@@ -0,0 +1,59 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import frota
+import gerador
+import index
+from espelho import ClienteEspelho
+
+
+def dashboard(i):
+    return {
+        "status": "ok",
+        "ui": {"severity": frota.SEVERIDADES[i % 3]},
+        "risk_model": {"prob": float(i), "riskLevel": frota.NIVEIS_RISCO[i % 3]},
+        "raw_metrics": {"latitude": 0.0, "longitude": 0.0},
+        "last_update": "2025-03-01 10:00:00",
+    }
+
+
+def test_maquinas_ao_mesmo_tempo(tmp_path):
+    cliente = ClienteEspelho({"b": tmp_path})
+
+    def maquina(i):
+        frota.atualizar(cliente, "b", "E", "2025-03-01", f"M{i:03d}", dashboard(i))
+        frota.compactar(cliente, "b", "E", "2025-03-01")
+
+    with ThreadPoolExecutor(16) as executor:
+        list(executor.map(maquina, range(64)))
+
+    resumo = json.loads(cliente.get_object(Bucket="b", Key=frota.chave_frota("E", "2025-03-01"))["Body"].read())
+    assert sorted(resumo["maquinas"]) == [f"M{i:03d}" for i in range(64)]
+    assert resumo["contagens"]["total"] == 64
+    assert resumo["maquinas"]["M007"] == frota.resumo_maquina(dashboard(7))
+
+    # sem mudança: nem o objeto da máquina nem o resumo são regravados
+    assert frota.atualizar(cliente, "b", "E", "2025-03-01", "M007", dashboard(7)) == (
+        False, frota.resumo_maquina(dashboard(7))
+    )
+    assert frota.compactar(cliente, "b", "E", "2025-03-01") is False
+
+
+def test_falha_na_frota_nao_derruba_o_registro(tmp_path, monkeypatch):
+    cliente = ClienteEspelho({"trusted": tmp_path / "trusted", index.BALDE_DESTINO: tmp_path / "client"})
+    monkeypatch.setattr(index, "cliente_s3", cliente)
+    monkeypatch.setattr(index, "FROTA", True)
+
+    def disputa(*args):
+        raise RuntimeError("não deu pra atualizar depois de 8 tentativas")
+
+    monkeypatch.setattr(frota, "compactar", disputa)
+    chave = "Empresa01/M1/2025-03-01/dados.csv"
+    lista = gerador.linhas(1, 48, intervalo=1800, quebradas=0)
+    cliente.put_object(Bucket="trusted", Key=chave, Body=gerador.csv(lista))
+
+    resposta = index.lambda_handler({"Records": [{"s3": {"bucket": {"name": "trusted"}, "object": {"key": chave}}}]}, None)
+    assert resposta["statusCode"] == 200 and resposta["batchItemFailures"] == []
+    assert cliente.head_object(Bucket=index.BALDE_DESTINO, Key="pedro-client/Empresa01/2025-03-01/M1.json")
+    # o objeto da máquina foi gravado: a próxima compactação pega
+    assert cliente.head_object(Bucket=index.BALDE_DESTINO, Key=frota.chave_maquina("Empresa01", "2025-03-01", "M1"))
@@ -0,0 +1,48 @@
+import io
+
+import pytest
+
+import agregacao
+import colunar
+import gerador
+import historico
+from leitura import iterar_linhas_dados
+
+MOTORES = [False, pytest.param(True, marks=pytest.mark.skipif(not colunar.disponivel(), reason="numpy não instalado"))]
+
+
+def agregar(lista, usar_numpy):
+    cabecalho, linhas = iterar_linhas_dados(io.BytesIO(gerador.csv(lista)))
+    return (colunar.agregar if usar_numpy else agregacao.agregar_linhas)(cabecalho, linhas)
+
+
+def particionar(lista):
+    # um arquivo por dia, como no trusted
+    por_dia = {}
+    for momento, colunas in lista:
+        por_dia.setdefault(momento.date(), []).append((momento, colunas))
+    return [por_dia[dia] for dia in sorted(por_dia)]
+
+
+@pytest.mark.parametrize("usar_numpy", MOTORES)
+@pytest.mark.parametrize("semente", range(4))
+def test_regressoes_de_todas_as_particoes(semente, usar_numpy):
+    # o mesmo CSV inteiro e dividido por dia: juntando as partições as duas
+    # regressões saem das mesmas somas da leitura do arquivo inteiro
+    lista = gerador.linhas(semente, 900, dias=5, milissegundos=False)
+    particoes = [agregar(parte, usar_numpy) for parte in particionar(lista)]
+    juntado = historico.juntar(particoes[-1], particoes[:-1], usar_numpy)
+    inteiro = agregar(lista, usar_numpy)
+    assert juntado["somas_tempo"] == inteiro["somas_tempo"]
+    assert juntado["somas_regressao"] == inteiro["somas_regressao"]
+    assert juntado["somas_tempo"]["7d"]["n"] > particoes[-1]["somas_tempo"]["7d"]["n"]
+
+
+@pytest.mark.parametrize("usar_numpy", MOTORES)
+def test_linhas_depois_do_evento_ficam_de_fora(usar_numpy):
+    # outro arquivo do mesmo dia com linhas mais novas que as do evento não
+    # entra nas janelas, que terminam na data_maxima do evento
+    lista = gerador.linhas(1, 400, dias=2, quebradas=0, milissegundos=False)
+    evento, depois = lista[:300], lista[300:]
+    juntado = historico.juntar(agregar(evento, usar_numpy), [agregar(depois, usar_numpy)], usar_numpy)
+    assert juntado["somas_tempo"] == agregar(evento, usar_numpy)["somas_tempo"]
@@ -0,0 +1,175 @@
+import io
+import json
+
+import pytest
+
+import agregacao
+import gerador
+import incremental
+import piramide
+import serie
+from espelho import ClienteEspelho
+from leitura import iterar_linhas_dados
+
+CHAVE = "Empresa01/M1/2025-03-01/dados.csv"
+ESTADO = incremental.chave_checkpoint(CHAVE)
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    monkeypatch.setattr(piramide, "ATIVO", False)
+    return ClienteEspelho({"trusted": tmp_path / "trusted", "client": tmp_path / "client"})
+
+
+def gravar(cliente, conteudo):
+    cliente.put_object(Bucket="trusted", Key=CHAVE, Body=conteudo)
+
+
+def rodar(cliente):
+    return incremental.agregar(cliente, "trusted", CHAVE, "client", ESTADO)
+
+
+def completo(conteudo):
+    cabecalho, linhas = iterar_linhas_dados(io.BytesIO(conteudo))
+    return agregacao.agregar_linhas(cabecalho, linhas)
+
+
+def comparavel(agregado):
+    # os valores de cada dia voltam dos esboços em outra ordem, e as linhas
+    # da regressão no tempo vêm em somas por minuto (as somas_tempo batem)
+    agregado = dict(agregado)
+    agregado.pop("tempos_semana", None)
+    agregado.pop("minutos_tempo", None)
+    if "dias_semana" in agregado:
+        agregado["dias_semana"] = [
+            (dia, {m: sorted(v) for m, v in valores.items()}) for dia, valores in agregado["dias_semana"]
+        ]
+    return json.dumps(agregado, default=str, sort_keys=True)
+
+
+def conteudo_exato(semente, quantidade=600):
+    # nas condições em que o checkpoint não perde nada: menos de quantis.K
+    # linhas por dia, menos de 7 dias, segundos inteiros e minuto cheio
+    return gerador.csv(gerador.linhas(semente, quantidade, intervalo=600, milissegundos=False))
+
+
+@pytest.mark.parametrize("semente", range(8))
+def test_igual_a_leitura_completa(cliente, semente):
+    conteudo = conteudo_exato(semente)
+    cortes = sorted({len(conteudo) // 5, len(conteudo) // 3 + 7, len(conteudo) // 2, len(conteudo) - 3})
+    vistos = []
+    for corte in cortes + [len(conteudo)]:
+        # appends, inclusive parando no meio de uma linha
+        gravar(cliente, conteudo[:corte])
+        vistos.append(rodar(cliente))
+        assert comparavel(vistos[-1]) == comparavel(completo(conteudo[:corte]))
+
+    # de novo sem mudança nenhuma
+    assert comparavel(rodar(cliente)) == comparavel(vistos[-1])
+
+
+def test_reescrita_do_mesmo_tamanho(cliente):
+    conteudo = conteudo_exato(1)
+    gravar(cliente, conteudo)
+    rodar(cliente)
+
+    # troca um dígito de uma linha do meio: mesmo tamanho, outro ETag
+    posicao = conteudo.index(b"\n", len(conteudo) // 2) + 1
+    posicao = conteudo.index(b",", conteudo.index(b",", posicao) + 1) + 1
+    trocado = b"9" if conteudo[posicao:posicao + 1] != b"9" else b"1"
+    reescrito = conteudo[:posicao] + trocado + conteudo[posicao + 1:]
+    assert len(reescrito) == len(conteudo)
+    gravar(cliente, reescrito)
+    assert comparavel(rodar(cliente)) == comparavel(completo(reescrito))
+
+
+def test_arquivo_diminuiu(cliente):
+    conteudo = conteudo_exato(2)
+    gravar(cliente, conteudo)
+    rodar(cliente)
+
+    menor = conteudo[:conteudo.index(b"\n", len(conteudo) // 2) + 1]
+    gravar(cliente, menor)
+    assert comparavel(rodar(cliente)) == comparavel(completo(menor))
+
+
+def test_serie_detalhada(cliente, monkeypatch):
+    monkeypatch.setattr(serie, "PONTOS", 40)
+    conteudo = conteudo_exato(3)
+    for corte in (len(conteudo) // 2, len(conteudo)):
+        gravar(cliente, conteudo[:corte])
+        agregado = rodar(cliente)
+    assert agregado["serie_detalhada"] == completo(conteudo)["serie_detalhada"]
+
+
+def test_baldes_da_piramide(cliente, monkeypatch):
+    monkeypatch.setattr(piramide, "ATIVO", True)
+    conteudo = conteudo_exato(4)
+    for corte in (len(conteudo) // 3, len(conteudo) // 2, len(conteudo)):
+        gravar(cliente, conteudo[:corte])
+        agregado = rodar(cliente)
+
+    esperado = completo(conteudo)["horas"]
+    assert [hora for hora, _ in agregado["horas"]] == [hora for hora, _ in esperado]
+    for (_, balde), (_, balde_esperado) in zip(agregado["horas"], esperado):
+        # hora juntada de mais de uma leitura: o p50 sai do esboço e a
+        # soma é a soma das somas
+        assert balde["n"] == balde_esperado["n"]
+        for m in piramide.METRICAS:
+            assert (balde[m]["min"], balde[m]["max"]) == (balde_esperado[m]["min"], balde_esperado[m]["max"])
+            assert balde[m]["soma"] == pytest.approx(balde_esperado[m]["soma"])
+            assert balde[m]["p50"] == pytest.approx(balde_esperado[m]["p50"])
+
+
+def test_checkpoint_nao_guarda_linhas(cliente):
+    # um dia cheio, linha a linha de 2 em 2 segundos
+    conteudo = gerador.csv(gerador.linhas(5, 40000, intervalo=2))
+    gravar(cliente, conteudo)
+    agregado = rodar(cliente)
+    tamanho = len(cliente.get_object(Bucket="client", Key=ESTADO)["Body"].read())
+    assert tamanho < len(conteudo) // 10
+
+    # a janela de 1h começa no minuto cheio (a data_maxima não cai no
+    # segundo 0) e as medianas ficam dentro do erro do esboço
+    esperado = completo(conteudo)
+    assert agregado["somas_tempo"]["24h"] == esperado["somas_tempo"]["24h"]
+    assert abs(agregado["somas_tempo"]["1h"]["n"] - esperado["somas_tempo"]["1h"]["n"]) <= 30
+    assert agregado["anomalias"] == esperado["anomalias"]
+    for m in agregacao.METRICAS:
+        assert agregado["medianas"]["dia"][m] == pytest.approx(esperado["medianas"]["dia"][m], rel=0.05)
+
+
+def test_particoes_de_dias_diferentes(cliente, capsys):
+    # cada dia tem o próprio checkpoint: alternar entre eles continua os dois
+    outra = "Empresa01/M1/2025-03-02/dados.csv"
+    conteudo = conteudo_exato(6)
+    metade = conteudo[:conteudo.index(b"\n", len(conteudo) // 2) + 1]
+    for chave in (CHAVE, outra):
+        cliente.put_object(Bucket="trusted", Key=chave, Body=metade)
+        incremental.agregar(cliente, "trusted", chave, "client", incremental.chave_checkpoint(chave))
+    capsys.readouterr()
+
+    for chave in (CHAVE, outra):
+        cliente.put_object(Bucket="trusted", Key=chave, Body=conteudo)
+        agregado = incremental.agregar(cliente, "trusted", chave, "client", incremental.chave_checkpoint(chave))
+        assert comparavel(agregado) == comparavel(completo(conteudo))
+    assert capsys.readouterr().out.count("Continuando") == 2
+
+
+def test_checkpoint_gravado_no_meio(cliente, monkeypatch):
+    conteudo = conteudo_exato(7)
+    gravar(cliente, conteudo[:len(conteudo) // 2])
+    rodar(cliente)
+    gravar(cliente, conteudo)
+
+    # outra invocação do mesmo CSV grava o checkpoint enquanto essa lê
+    ler = incremental._ler_continuacao
+
+    def concorrente(*args):
+        leitura = ler(*args)
+        cliente.put_object(Bucket="client", Key=ESTADO, Body=b'{"versao":0}')
+        return leitura
+
+    monkeypatch.setattr(incremental, "_ler_continuacao", concorrente)
+    assert comparavel(rodar(cliente)) == comparavel(completo(conteudo))
+    assert cliente.get_object(Bucket="client", Key=ESTADO)["Body"].read() == b'{"versao":0}'
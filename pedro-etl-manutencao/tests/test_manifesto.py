@@ -0,0 +1,45 @@
+import json
+from datetime import timedelta
+
+import pytest
+
+import gerador
+import index
+from espelho import ClienteEspelho
+
+DIA1 = "Empresa01/M1/2025-03-01/dados.csv"
+DIA2 = "Empresa01/M1/2025-03-02/dados.csv"
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    cliente = ClienteEspelho({"trusted": tmp_path / "trusted", index.BALDE_DESTINO: tmp_path / "client"})
+    monkeypatch.setattr(index, "cliente_s3", cliente)
+    monkeypatch.setattr(index, "HISTORICO", True)
+    return cliente
+
+
+def gravar(cliente, chave, semente, inicio):
+    lista = gerador.linhas(semente, 48, intervalo=1800, inicio=inicio, quebradas=0)
+    cliente.put_object(Bucket="trusted", Key=chave, Body=gerador.csv(lista))
+
+
+def historico_7d(cliente):
+    corpo = cliente.get_object(Bucket=index.BALDE_DESTINO, Key="pedro-client/Empresa01/2025-03-02/M1.json")["Body"]
+    return json.loads(corpo.read())["historico_7d"]
+
+
+def test_outro_dia_da_janela_mudou(cliente):
+    gravar(cliente, DIA1, 1, gerador.INICIO)
+    gravar(cliente, DIA2, 2, gerador.INICIO + timedelta(days=1))
+    assert index._processar_objeto("trusted", DIA2) == "Sucesso"
+    antes = historico_7d(cliente)
+    assert index._processar_objeto("trusted", DIA2) == "Inalterado"
+
+    # o CSV do evento é o mesmo, mas o dia anterior foi reescrito
+    gravar(cliente, DIA1, 3, gerador.INICIO)
+    assert index._processar_objeto("trusted", DIA2) == "Sucesso"
+    depois = historico_7d(cliente)
+    assert depois["labels"] == antes["labels"] == ["2025-03-01", "2025-03-02"]
+    assert depois["cpu"][0] != antes["cpu"][0] and depois["cpu"][1] == antes["cpu"][1]
+    assert index._processar_objeto("trusted", DIA2) == "Inalterado"
@@ -0,0 +1,68 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import mapa
+from espelho import ClienteEspelho
+
+SAO_PAULO = (-23.55, -46.63)
+RIO = (-22.90, -43.20)
+
+
+def entrada(posicao, status="ok"):
+    return {
+        "status": status, "severity": "INFO", "prob": 1.0, "riskLevel": "low",
+        "latitude": posicao[0], "longitude": posicao[1], "last_update": "2025-03-01 10:00:00",
+    }
+
+
+def tile(cliente, posicao):
+    chave = mapa.chave_tile("E", "2025-03-01", mapa.geohash(*posicao))
+    return json.loads(cliente.get_object(Bucket="b", Key=chave)["Body"].read())["maquinas"]
+
+
+@pytest.fixture
+def cliente(tmp_path):
+    return ClienteEspelho({"b": tmp_path})
+
+
+def test_muitas_maquinas_no_mesmo_tile(cliente):
+    def maquina(i):
+        mapa.atualizar(cliente, "b", "E", "2025-03-01", f"M{i:03d}", entrada(SAO_PAULO))
+
+    with ThreadPoolExecutor(16) as executor:
+        list(executor.map(maquina, range(64)))
+    assert sorted(tile(cliente, SAO_PAULO)) == [f"M{i:03d}" for i in range(64)]
+
+
+def test_mudou_de_tile(cliente):
+    mapa.atualizar(cliente, "b", "E", "2025-03-01", "M1", entrada(SAO_PAULO))
+    mapa.atualizar(cliente, "b", "E", "2025-03-01", "M2", entrada(SAO_PAULO))
+    assert mapa.atualizar(cliente, "b", "E", "2025-03-01", "M1", entrada(SAO_PAULO)) == []
+
+    assert mapa.atualizar(cliente, "b", "E", "2025-03-01", "M1", entrada(RIO)) == [
+        mapa.geohash(*RIO), mapa.geohash(*SAO_PAULO),
+    ]
+    assert list(tile(cliente, SAO_PAULO)) == ["M2"]
+    assert list(tile(cliente, RIO)) == ["M1"]
+
+
+def test_caiu_antes_de_limpar_o_tile_antigo(cliente, monkeypatch):
+    mapa.atualizar(cliente, "b", "E", "2025-03-01", "M1", entrada(SAO_PAULO))
+    compactar = mapa.compactar
+
+    def so_o_novo(cliente, balde, empresa, data_str, destino):
+        if destino == mapa.geohash(*SAO_PAULO):
+            raise RuntimeError("não deu pra atualizar depois de 8 tentativas")
+        return compactar(cliente, balde, empresa, data_str, destino)
+
+    monkeypatch.setattr(mapa, "compactar", so_o_novo)
+    with pytest.raises(RuntimeError):
+        mapa.atualizar(cliente, "b", "E", "2025-03-01", "M1", entrada(RIO))
+    monkeypatch.setattr(mapa, "compactar", compactar)
+
+    # a próxima execução, já com a posição nova, ainda limpa o antigo
+    mapa.atualizar(cliente, "b", "E", "2025-03-01", "M1", entrada(RIO))
+    assert tile(cliente, SAO_PAULO) == {}
+    assert list(tile(cliente, RIO)) == ["M1"]
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+
+import mudancas
+from espelho import ClienteEspelho
+
+
+def dashboard(status, severidade):
+    return {"status": status, "ui": {"severity": severidade}, "risk_model": {"prob": 0.5, "riskLevel": "Medio"}}
+
+
+@pytest.fixture
+def cliente(tmp_path):
+    return ClienteEspelho({"b": tmp_path})
+
+
+def registrar(cliente, status, severidade, hora):
+    return mudancas.registrar(cliente, "b", "E", "M1", dashboard(status, severidade), datetime(2025, 3, 1, hora))
+
+
+def feed(cliente):
+    return mudancas.ler_feed(cliente, "b", "E", "2025-03-01")
+
+
+def test_eventos_em_ordem_sem_repetir(cliente):
+    assert registrar(cliente, "ok", "Normal", 8) is None
+    assert registrar(cliente, "ok", "Alerta", 9)["from"] == {"status": "ok", "severity": "Normal"}
+    registrar(cliente, "ok", "Critico", 10)
+    # reprocessamento e CSV atrasado não geram nada novo
+    registrar(cliente, "ok", "Critico", 10)
+    assert registrar(cliente, "ok", "Normal", 7) is None
+    assert [e["to"]["severity"] for e in feed(cliente)] == ["Alerta", "Critico"]
+
+    primeiro = mudancas.chave_evento(feed(cliente)[0])
+    assert [e["to"]["severity"] for e in mudancas.ler_feed(cliente, "b", "E", "2025-03-01", primeiro)] == ["Critico"]
+
+
+def test_retry_depois_de_cair_entre_as_escritas(cliente, monkeypatch):
+    registrar(cliente, "ok", "Normal", 8)
+    publicar = mudancas._publicar
+
+    def cai(*args):
+        raise ConnectionError("caiu")
+
+    monkeypatch.setattr(mudancas, "_publicar", cai)
+    with pytest.raises(ConnectionError):
+        registrar(cliente, "ok", "Alerta", 9)
+    monkeypatch.setattr(mudancas, "_publicar", publicar)
+
+    # o estado já mudou; o retry republica o mesmo evento
+    assert registrar(cliente, "ok", "Alerta", 9)["to"]["severity"] == "Alerta"
+    registrar(cliente, "ok", "Alerta", 9)
+    assert len(feed(cliente)) == 1
+
+
+class ClienteDisputado(ClienteEspelho):
+    # na primeira escrita condicional do estado, outra invocação grava antes
+    def __init__(self, diretorios, concorrente):
+        super().__init__(diretorios)
+        self.concorrente = concorrente
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if self.concorrente is not None and Key == mudancas.chave_estado("E", "M1") and "IfMatch" in kwargs:
+            concorrente, self.concorrente = self.concorrente, None
+            concorrente()
+        return super().put_object(Bucket=Bucket, Key=Key, Body=Body, **kwargs)
+
+
+def test_tentativa_perdida_nao_publica(tmp_path):
+    cliente = ClienteDisputado({"b": tmp_path}, None)
+    registrar(cliente, "ok", "Normal", 8)
+    cliente.concorrente = lambda: registrar(ClienteEspelho({"b": tmp_path}), "ok", "Alerta", 9)
+
+    evento = registrar(cliente, "ok", "Critico", 10)
+    # a tentativa que perdeu (Normal -> Critico) não sai no feed; a que
+    # ganhou parte do estado que o concorrente deixou
+    assert evento["from"]["severity"] == "Alerta"
+    assert [(e["from"]["severity"], e["to"]["severity"]) for e in feed(cliente)] == [
+        ("Normal", "Alerta"), ("Alerta", "Critico"),
+    ]
@@ -0,0 +1,51 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import gerador
+import index
+import paralelo
+from espelho import ClienteEspelho
+
+CHAVE = "Empresa01/M1/2025-03-01/dados.csv"
+SAIDA = "pedro-client/Empresa01/2025-03-03/M1.json"
+
+
+@pytest.fixture
+def faixas_pequenas(monkeypatch):
+    monkeypatch.setattr(paralelo, "ATIVO", True)
+    monkeypatch.setattr(paralelo, "PROCESSOS", 3)
+    monkeypatch.setattr(paralelo, "LIMIAR_BYTES", 0)
+    monkeypatch.setattr(paralelo, "FAIXA_MINIMA", 16 * 1024)
+
+
+def test_so_na_thread_principal_sem_pool(faixas_pequenas):
+    assert paralelo.usar(1024 * 1024)
+    with ThreadPoolExecutor(2) as executor:
+        assert executor.submit(paralelo.usar, 1024 * 1024).result() is False
+
+
+def rodar(tmp_path, monkeypatch, capsys, registros):
+    cliente = ClienteEspelho({"trusted": tmp_path / "trusted", index.BALDE_DESTINO: tmp_path / "client"})
+    monkeypatch.setattr(index, "cliente_s3", cliente)
+    monkeypatch.setattr(index.CACHE, "buscar", lambda c, b, k, m: (None, c.get_object(Bucket=b, Key=k)))
+    conteudo = gerador.csv(gerador.linhas(1, 3000, quebradas=0.01))
+    cliente.put_object(Bucket="trusted", Key=CHAVE, Body=conteudo)
+    outros = [f"Empresa01/M{i}/2025-03-01/dados.csv" for i in range(2, registros + 1)]
+    for chave in outros:
+        cliente.put_object(Bucket="trusted", Key=chave, Body=conteudo)
+
+    evento = {"Records": [{"s3": {"bucket": {"name": "trusted"}, "object": {"key": c}}} for c in [CHAVE] + outros]}
+    assert index.lambda_handler(evento, None)["batchItemFailures"] == []
+    saida = json.loads(cliente.get_object(Bucket=index.BALDE_DESTINO, Key=SAIDA)["Body"].read())
+    saida.pop("metadata", None)
+    return saida, "em paralelo" in capsys.readouterr().out
+
+
+def test_lote_le_em_serie_e_registro_unico_em_paralelo(tmp_path, monkeypatch, capsys, faixas_pequenas):
+    # lote com pool de threads: nada de fork, e a saída é a mesma
+    em_lote, paralelo_lote = rodar(tmp_path / "lote", monkeypatch, capsys, 3)
+    sozinho, paralelo_sozinho = rodar(tmp_path / "sozinho", monkeypatch, capsys, 1)
+    assert (paralelo_lote, paralelo_sozinho) == (False, True)
+    assert sozinho == em_lote
@@ -0,0 +1,60 @@
+import io
+from collections import Counter
+from datetime import date
+
+import agregacao
+import gerador
+import piramide
+from espelho import ClienteEspelho
+from leitura import iterar_linhas_dados
+
+
+class ClienteContado(ClienteEspelho):
+    def __init__(self, diretorios):
+        super().__init__(diretorios)
+        self.chamadas = Counter()
+
+    def get_object(self, **kwargs):
+        self.chamadas["get"] += 1
+        return super().get_object(**kwargs)
+
+    def put_object(self, **kwargs):
+        self.chamadas["put", kwargs["Key"].split("/")[4]] += 1
+        return super().put_object(**kwargs)
+
+    def list_objects_v2(self, **kwargs):
+        self.chamadas["list"] += 1
+        return super().list_objects_v2(**kwargs)
+
+
+def horas(conteudo):
+    return agregacao.agregar_linhas(*iterar_linhas_dados(io.BytesIO(conteudo)))["horas"]
+
+
+def atualizar(cliente, conteudo, chave="E/M1/2025-03-04/dados.csv"):
+    cliente.chamadas.clear()
+    piramide.atualizar(cliente, "b", "E", "M1", chave, horas(conteudo))
+    return dict(cliente.chamadas)
+
+
+def test_so_regrava_o_que_mudou(tmp_path, monkeypatch):
+    monkeypatch.setattr(piramide, "ATIVO", True)
+    cliente = ClienteContado({"b": tmp_path})
+    # três dias inteiros (4 a 6/3, mesma semana ISO)
+    conteudo = gerador.csv(gerador.linhas(1, 3 * 288, dias=3, inicio=gerador.INICIO.replace(day=4), quebradas=0))
+    metade = conteudo[:conteudo.index(b"\nM1,2025-03-06") + 1]
+
+    primeira = atualizar(cliente, metade)
+    assert (primeira["put", "hora"], primeira["put", "dia"], primeira["put", "semana"]) == (2, 1, 1)
+
+    # mesmo conteúdo: nenhuma escrita e nem leitura do objeto da semana
+    assert atualizar(cliente, metade) == {"list": 2, "get": 1}
+
+    # chegou o terceiro dia: só a hora dele é regravada
+    depois = atualizar(cliente, conteudo)
+    assert (depois["put", "hora"], depois["put", "dia"], depois["put", "semana"]) == (1, 1, 1)
+
+    dias = piramide.consultar(cliente, "b", "E", "M1", "dia", date(2025, 3, 1), date(2025, 3, 31))
+    assert [(r, b["n"]) for r, b in dias] == [("2025-03-04", 288), ("2025-03-05", 288), ("2025-03-06", 288)]
+    semanas = piramide.consultar(cliente, "b", "E", "M1", "semana", date(2025, 3, 1), date(2025, 3, 31))
+    assert [(r, b["n"]) for r, b in semanas] == [("2025-W10", 864)]
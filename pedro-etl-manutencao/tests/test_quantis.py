@@ -0,0 +1,83 @@
+import json
+from datetime import timedelta
+
+import pytest
+
+import gerador
+import index
+import quantis
+from espelho import ClienteEspelho
+
+DIA1 = "Empresa01/M1/2025-03-01/dados.csv"
+DIA2 = "Empresa01/M1/2025-03-02/dados.csv"
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    cliente = ClienteEspelho({"trusted": tmp_path / "trusted", index.BALDE_DESTINO: tmp_path / "client"})
+    monkeypatch.setattr(index, "cliente_s3", cliente)
+    monkeypatch.setattr(index, "QUANTIS", True)
+    monkeypatch.setattr(index, "HISTORICO", False)
+    return cliente
+
+
+def gravar(cliente, chave, semente, inicio):
+    lista = gerador.linhas(semente, 3000, dias=1, inicio=inicio, quebradas=0)
+    cliente.put_object(Bucket="trusted", Key=chave, Body=gerador.csv(lista))
+
+
+def medianas(cliente, dia):
+    corpo = cliente.get_object(Bucket=index.BALDE_DESTINO, Key=f"pedro-client/Empresa01/{dia}/M1.json")["Body"]
+    return json.loads(corpo.read())["medianas"]
+
+
+def test_uma_particao_so_fica_exata(cliente):
+    gravar(cliente, DIA1, 1, gerador.INICIO)
+    assert index._processar_objeto("trusted", DIA1) == "Sucesso"
+    # a semana é o próprio dia: mediana exata, não o p50 do esboço
+    assert medianas(cliente, "2025-03-01")["semanal"] == medianas(cliente, "2025-03-01")["dia"]
+
+
+def test_outra_particao_vem_do_esboco(cliente):
+    gravar(cliente, DIA1, 1, gerador.INICIO)
+    gravar(cliente, DIA2, 2, gerador.INICIO + timedelta(days=1))
+    index._processar_objeto("trusted", DIA1)
+    index._processar_objeto("trusted", DIA2)
+    resultado = medianas(cliente, "2025-03-02")
+    assert resultado["semanal"] != resultado["dia"]
+    for m in quantis.METRICAS:
+        assert resultado["semanal"][m] == pytest.approx(50, abs=10)
+
+
+def test_com_historico_tudo_em_memoria(cliente, monkeypatch):
+    monkeypatch.setattr(index, "HISTORICO", True)
+    gravar(cliente, DIA1, 1, gerador.INICIO)
+    gravar(cliente, DIA2, 2, gerador.INICIO + timedelta(days=1))
+    index._processar_objeto("trusted", DIA1)
+    index._processar_objeto("trusted", DIA2)
+    com_esbocos = medianas(cliente, "2025-03-02")
+
+    monkeypatch.setattr(index, "QUANTIS", False)
+    index._processar_objeto("trusted", DIA2, forcar=True)
+    assert com_esbocos == medianas(cliente, "2025-03-02")
+
+
+@pytest.mark.parametrize("com_historico", [False, True])
+def test_juntados_no_lote_ganham_esboco_e_manifesto(cliente, monkeypatch, com_historico):
+    # dois CSVs da mesma partição no mesmo lote: só o mais novo roda, mas o
+    # outro também grava o esboço e o manifesto
+    monkeypatch.setattr(index, "HISTORICO", com_historico)
+    antigo = "Empresa01/M1/2025-03-02/antes.csv"
+    gravar(cliente, antigo, 1, gerador.INICIO + timedelta(days=1))
+    gravar(cliente, DIA2, 2, gerador.INICIO + timedelta(days=1, hours=12))
+    evento = {"Records": [
+        {"eventTime": f"2025-03-02T0{i}:00:00Z", "s3": {"bucket": {"name": "trusted"}, "object": {"key": chave}}}
+        for i, chave in enumerate([antigo, DIA2])
+    ]}
+    resposta = index.lambda_handler(evento, None)
+    assert [r["processado_como"] for r in resposta["resultados"]] == [DIA2, DIA2]
+
+    esboco = quantis.chave_esboco("Empresa01", "M1", gerador.INICIO.date() + timedelta(days=1), antigo)
+    assert json.loads(cliente.get_object(Bucket=index.BALDE_DESTINO, Key=esboco)["Body"].read())["origem"] == antigo
+    # o antigo sozinho depois: nada mudou, nem ele nem o resto da janela
+    assert index._processar_objeto("trusted", antigo) == "Inalterado"
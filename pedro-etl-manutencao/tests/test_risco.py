@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+import colunar
+import risco
+
+pytestmark = pytest.mark.skipif(not colunar.disponivel(), reason="numpy não instalado")
+
+SITUACOES = ("Normal", "Alerta", "Critico", "ALERTA", "critico", "Desconhecido", "", None)
+ALTERADOS = {nome: valor - 5 for nome, valor in risco.LIMIARES.items()}
+
+
+def sortear(semente, quantidade):
+    # metade dos valores cai exatamente num limiar ou a um passo dele, onde
+    # > e >= dariam diferente
+    aleatorio = random.Random(semente)
+    limiares = sorted(set(risco.LIMIARES.values()) | set(ALTERADOS.values()))
+
+    def valor():
+        if aleatorio.random() < 0.5:
+            return round(aleatorio.uniform(0, 110), aleatorio.choice((0, 1, 2)))
+        return aleatorio.choice(limiares) + aleatorio.choice((-1, -0.01, 0, 0.01, 1))
+
+    return [
+        {
+            "cpu": valor(), "ram": valor(), "disk": valor(), "temp": valor(),
+            "situacao": aleatorio.choice(SITUACOES),
+        }
+        for _ in range(quantidade)
+    ]
+
+
+def comparar(maquinas, limiares):
+    avaliacao = risco.avaliar_frota(
+        [f"M{i}" for i in range(len(maquinas))],
+        [m["cpu"] for m in maquinas],
+        [m["ram"] for m in maquinas],
+        [m["disk"] for m in maquinas],
+        [m["temp"] for m in maquinas],
+        [m["situacao"] for m in maquinas],
+        limiares,
+    )
+    for i, metricas in enumerate(maquinas):
+        esperado = (
+            risco.montar_ui_state(metricas, f"M{i}", limiares),
+            risco.calcular_modelo_heuristico(metricas, limiares),
+        )
+        assert risco.por_maquina(avaliacao, i) == esperado, metricas
+
+
+@pytest.mark.parametrize("semente", range(4))
+@pytest.mark.parametrize("limiares", [risco.LIMIARES, ALTERADOS], ids=["padrao", "alterados"])
+def test_igual_as_funcoes_por_maquina(semente, limiares):
+    comparar(sortear(semente, 2000), limiares)
+
+
+def test_exatamente_nos_limiares():
+    maquinas = [
+        {"cpu": v, "ram": v, "disk": v, "temp": v, "situacao": s}
+        for v in sorted(set(risco.LIMIARES.values()))
+        for s in ("Normal", "Critico", None)
+    ]
+    comparar(maquinas, risco.LIMIARES)
+
+
+def test_metrica_nao_finita():
+    metricas = {"cpu": float("nan"), "ram": 1.0, "disk": 1.0, "temp": 1.0, "situacao": "Normal"}
+    with pytest.raises(ValueError):
+        risco.calcular_modelo_heuristico(metricas)
+    with pytest.raises(ValueError, match="M7"):
+        risco.avaliar_frota(["M7"], [float("nan")], [1.0], [1.0], [1.0], ["Normal"])